@@ -0,0 +1,101 @@
+"""
+Reproducible synthetic caption corpora.
+
+The cue text is scrambled with `helpers.sanitize_text`, so the corpus keeps
+the structure of real captions (word lengths, punctuation, speaker dashes,
+sounds in brackets) without containing any real dialogue.
+"""
+import os
+import random
+import string
+from dataclasses import asdict, dataclass
+from typing import List
+from helpers.sanitize_text import random_unicode_text
+
+WORDS = (
+    "I you we they he she it the a an and but so what where when why how "
+    "know think want need going gonna really just never always maybe "
+    "house villain challenge money cash night morning tomorrow everyone "
+    "right now here there this that because little pretty town news"
+).split()
+ENDINGS = (".", ".", ".", "!", "?", "...", ",", "", "", '."', "♪")
+SOUNDS = ("[music]", "[buzzer]", "(laughs)", "[cackling]", "(suspenseful music)", "♪♪♪")
+
+
+@dataclass
+class CorpusSpec:
+    seed: int = 0
+    files: int = 20
+    min_cues: int = 200
+    max_cues: int = 800
+    speaker_density: float = 0.2  # share of cues with speaker dashes
+    sound_density: float = 0.05  # share of bracketed sound cues
+    all_caps_ratio: float = 0.1  # share of files in uppercase
+    long_line_ratio: float = 0.05  # share of lines longer than 36 characters
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def _timestamp(ms: int) -> str:
+    hours, ms = divmod(ms, 3_600_000)
+    minutes, ms = divmod(ms, 60_000)
+    seconds, ms = divmod(ms, 1000)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}.{ms:03d}"
+
+
+def _sentence(rng: random.Random, words: int) -> str:
+    text = " ".join(rng.choice(WORDS) for _ in range(words))
+    return random_unicode_text(text, rng) + rng.choice(ENDINGS)
+
+
+def _speaker(rng: random.Random) -> str:
+    return "".join(rng.choice(string.ascii_uppercase) for _ in range(rng.randint(3, 8)))
+
+
+def _cue_lines(rng: random.Random, spec: CorpusSpec) -> List[str]:
+    roll = rng.random()
+    if roll < spec.sound_density:
+        return [rng.choice(SOUNDS)]
+    if roll < spec.sound_density + spec.speaker_density:
+        lines = []
+        for _ in range(2):
+            name = f"{_speaker(rng)}: " if rng.random() < 0.3 else ""
+            lines.append(f"-{name}{_sentence(rng, rng.randint(1, 4))}")
+        return lines
+    if rng.random() < spec.long_line_ratio:
+        return [_sentence(rng, rng.randint(10, 20))]
+    return [_sentence(rng, rng.randint(2, 5)) for _ in range(rng.randint(1, 2))]
+
+
+def generate_file(rng: random.Random, spec: CorpusSpec, all_caps: bool) -> str:
+    blocks = ["WEBVTT", ""]
+    ms = 0
+    for _ in range(rng.randint(spec.min_cues, spec.max_cues)):
+        duration = rng.randint(800, 4000)
+        lines = _cue_lines(rng, spec)
+        if all_caps:
+            lines = [line.upper() for line in lines]
+        blocks.append(f"{_timestamp(ms)} --> {_timestamp(ms + duration)}")
+        blocks.extend(lines)
+        blocks.append("")
+        ms += duration
+    return "\n".join(blocks)
+
+
+def generate_corpus(folder: str, spec: CorpusSpec) -> List[str]:
+    """
+    Write `spec.files` caption files into `folder` and return their paths.
+
+    The same spec always produces the same files.
+    """
+    rng = random.Random(spec.seed)
+    os.makedirs(folder, exist_ok=True)
+    files = []
+    for index in range(spec.files):
+        all_caps = rng.random() < spec.all_caps_ratio
+        path = os.path.join(folder, f"episode_{index:04d}.webvtt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(generate_file(rng, spec, all_caps))
+        files.append(path)
+    return files
@@ -0,0 +1,52 @@
+"""
+Files/sec scaling of the thread, process and async executors.
+
+Usage: python -m benchmarks.executor_scaling [--files N] [--max-workers N]
+"""
+import argparse
+import os
+import tempfile
+import time
+from typing import List
+import helpers.executor
+import helpers.logging
+from benchmarks.corpus import CorpusSpec, generate_corpus
+from process_webvtt import run
+
+
+def measure(files: List[str], executor: str, workers: int) -> float:
+    started = time.perf_counter()
+    log = helpers.logging.create_null_log()
+    run(files, "prepare", log, executor=executor, workers=workers)
+    return len(files) / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--files", type=int, default=64)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--max-workers", type=int, default=helpers.executor.default_workers()
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        # Worker processes log into prepare.jsonl in the working directory
+        os.chdir(folder)
+        files = generate_corpus(folder, CorpusSpec(seed=args.seed, files=args.files))
+        workers = 1
+        header = "".join(f"{executor:>12}" for executor in helpers.executor.EXECUTORS)
+        print(f"{'workers':>8}{header}  (files/sec)")
+        while True:
+            rates = "".join(
+                f"{measure(files, executor, workers):>12.1f}"
+                for executor in helpers.executor.EXECUTORS
+            )
+            print(f"{workers:>8}{rates}")
+            if workers >= args.max_workers:
+                break
+            workers = min(workers * 2, args.max_workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+"""
+Throughput of the prepare and finalize hot paths against a stored baseline.
+
+Usage: python -m benchmarks.regression [--update] [--tolerance 0.3]
+
+Throughput is measured on the corpus checked in next to this module and
+normalized by a calibration loop timed on the same machine, so the
+baseline holds the cues processed in the time of one calibration loop
+and is comparable across machines of different speed. `--update`
+rewrites the baseline after an intended slowdown or speedup.
+"""
+import argparse
+import glob
+import json
+import os
+import platform
+import sys
+import time
+from typing import Callable, Final, Optional
+import helpers.api
+import helpers.cache
+import helpers.postprocess
+from benchmarks.corpus import CorpusSpec, generate_corpus
+
+FOLDER: Final[str] = os.path.dirname(os.path.abspath(__file__))
+CORPUS: Final[str] = os.path.join(FOLDER, "regression_corpus")
+BASELINE: Final[str] = os.path.join(FOLDER, "baseline.json")
+# The spec `CORPUS` was generated from, see `write_corpus`
+SPEC: Final = CorpusSpec(seed=17, files=6, min_cues=500, max_cues=500)
+PATHS: Final[tuple[str, ...]] = (
+    "api.prepare_text",
+    "api.finalize_text",
+    "postprocess.parse_vtt_line",
+)
+# Share of the baseline throughput a path may lose before the check fails
+TOLERANCE: Final[float] = 0.3
+# Runs of every path, a single run is easily slowed down by the rest of the machine
+REPEATS: Final[int] = 7
+
+
+def write_corpus(folder: str = CORPUS) -> list[str]:
+    """
+    Generate the checked-in corpus, only needed when `SPEC` changes.
+    """
+    for file in glob.glob(os.path.join(folder, "*.webvtt")):
+        os.remove(file)
+    return generate_corpus(folder, SPEC)
+
+
+def load_corpus(folder: str = CORPUS) -> list[str]:
+    texts = []
+    for file in sorted(glob.glob(os.path.join(folder, "*.webvtt"))):
+        with open(file, "r", encoding="utf-8") as f:
+            texts.append(f.read())
+    return texts
+
+
+def _calibration_loop() -> int:
+    # String, regex-free list and dict work like the hot paths do
+    counts: dict[str, int] = {}
+    for index in range(60_000):
+        words = f"{index} -JOE: what a night. [music]".split()
+        key = words[index % len(words)].strip(".:").lower()
+        counts[key] = counts.get(key, 0) + len(" ".join(words))
+    return len(counts)
+
+
+def _timed(function: Callable[[], object]) -> float:
+    started = time.perf_counter()
+    function()
+    return time.perf_counter() - started
+
+
+def calibrate(repeats: int = REPEATS) -> float:
+    """
+    Seconds the calibration loop takes on this machine.
+    """
+    return min(_timed(_calibration_loop) for _ in range(repeats))
+
+
+def normalized(count: int, function: Callable[[], object], repeats: int = REPEATS) -> float:
+    """
+    `count` items processed by `function`, per calibration loop.
+
+    Every run of `function` is paired with a run of the loop, so both see
+    the same load of the machine, and the median of the pairs is kept.
+    """
+    ratios = sorted(
+        _timed(_calibration_loop) / _timed(function) for _ in range(repeats)
+    )
+    return count * ratios[len(ratios) // 2]
+
+
+def _paths(texts: list[str]) -> dict[str, tuple[int, Callable[[], object]]]:
+    prepared = [helpers.api.prepare_text(text) for text in texts]
+    lines = [
+        line
+        for text in prepared
+        for line in helpers.postprocess.iter_merged_lines(text.splitlines(True))
+    ]
+    cues = sum(text.count(" --> ") for text in texts)
+    return {
+        "api.prepare_text": (cues, lambda: [helpers.api.prepare_text(t) for t in texts]),
+        "api.finalize_text": (
+            cues,
+            lambda: [helpers.api.finalize_text(t) for t in prepared],
+        ),
+        "postprocess.parse_vtt_line": (
+            len(lines),
+            lambda: [helpers.postprocess.parse_vtt_line(line) for line in lines],
+        ),
+    }
+
+
+def measure(
+    paths: tuple[str, ...] = PATHS, repeats: int = REPEATS
+) -> dict[str, float]:
+    """
+    Normalized throughput of every path: cues, or lines, per calibration loop.
+    """
+    # Repeated runs would only measure cache hits
+    helpers.cache.configure(0)
+    try:
+        functions = _paths(load_corpus())
+        results = {
+            path: round(normalized(*functions[path], repeats), 1) for path in paths
+        }
+    finally:
+        helpers.cache.configure()
+    return results
+
+
+def load_baseline(path: str = BASELINE) -> dict[str, float]:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)["results"]
+
+
+def save_baseline(results: dict[str, float], path: str = BASELINE) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "corpus": SPEC.to_dict(),
+                "python": platform.python_version(),
+                "results": results,
+            },
+            f,
+            indent=2,
+        )
+        f.write("\n")
+
+
+def regressions(
+    results: dict[str, float],
+    baseline: dict[str, float],
+    tolerance: float = TOLERANCE,
+) -> dict[str, float]:
+    """
+    Paths slower than the baseline allows, with their share of its throughput.
+    """
+    return {
+        path: round(value / baseline[path], 3)
+        for path, value in results.items()
+        if path in baseline and value < baseline[path] * (1 - tolerance)
+    }
+
+
+def tolerance_from_env(default: float = TOLERANCE) -> float:
+    value: Optional[str] = os.environ.get("PERF_TOLERANCE")
+    return float(value) if value else default
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--update", action="store_true", help="Write the measured throughput as baseline"
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=tolerance_from_env(),
+        help=f"Share of throughput a path may lose (default: {TOLERANCE})",
+    )
+    parser.add_argument(
+        "--path", action="append", choices=PATHS, help="Only measure these paths"
+    )
+    args = parser.parse_args()
+
+    results = measure(tuple(args.path or PATHS))
+    if args.update:
+        # Paths not measured keep their baseline
+        baseline = load_baseline() if os.path.exists(BASELINE) else {}
+        save_baseline({**baseline, **results})
+        print(json.dumps(results, indent=2))
+        return
+    baseline = load_baseline()
+    for path, value in results.items():
+        print(f"{path}: {value} (baseline {baseline.get(path)})")
+    slower = regressions(results, baseline, args.tolerance)
+    for path, ratio in slower.items():
+        print(f"{path} is down to {ratio:.0%} of its baseline", file=sys.stderr)
+    if slower:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
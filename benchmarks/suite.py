@@ -0,0 +1,322 @@
+"""
+Throughput and peak memory of the prepare and finalize stages.
+
+Usage: python -m benchmarks.suite [--seed N] [--files N] [--output results.json]
+
+Every stage runs in a fresh process, so its peak RSS is not inflated by
+the stages measured before it.
+"""
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Callable, Optional
+from unittest.mock import patch
+import webvtt
+import helpers.api
+import helpers.formats
+import helpers.logging
+import helpers.postprocess
+import helpers.preprocess
+import process_webvtt
+from benchmarks.corpus import CorpusSpec, generate_corpus
+
+# Every stage writing outputs gets its own copy of the corpus
+CORPUS = "corpus"
+PREPARED = os.path.join("finalize", "prepared")
+
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def _peak_rss_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def _size(files: list[str]) -> int:
+    return sum(os.path.getsize(file) for file in files)
+
+
+def _originals(folder: str, copy: str = CORPUS) -> list[str]:
+    return sorted(glob.glob(os.path.join(folder, copy, "*.webvtt")))
+
+
+def _prepared(folder: str) -> list[str]:
+    return sorted(glob.glob(os.path.join(folder, PREPARED, "*.webvtt")))
+
+
+def _merged_lines(folder: str) -> list[str]:
+    lines = []
+    for file in _prepared(folder):
+        lines.extend(helpers.postprocess.read_file(file))
+    return lines
+
+
+def _preprocess(folder: str, reader: str) -> tuple[float, int, int]:
+    files = _originals(folder, "preprocess")
+    log = helpers.logging.create_null_log()
+    cues = 0
+    started = time.perf_counter()
+    for file in files:
+        helpers.preprocess.process_vtt(file, log, reader)
+    elapsed = time.perf_counter() - started
+    for file in files:
+        cues += len(webvtt.read(file).captions)
+    return elapsed, cues, _size(files)
+
+
+def stage_preprocess(folder: str) -> tuple[float, int, int]:
+    return _preprocess(folder, "fast")
+
+
+def stage_preprocess_webvtt(folder: str) -> tuple[float, int, int]:
+    return _preprocess(folder, "webvtt")
+
+
+def stage_read_file(folder: str) -> tuple[float, int, int]:
+    files = _prepared(folder)
+    cues = 0
+    started = time.perf_counter()
+    for file in files:
+        cues += len(helpers.postprocess.read_file(file))
+    return time.perf_counter() - started, cues, _size(files)
+
+
+def stage_parse_vtt_line(folder: str) -> tuple[float, int, int]:
+    lines = _merged_lines(folder)
+    started = time.perf_counter()
+    for line in lines:
+        helpers.postprocess.parse_vtt_line(line)
+    elapsed = time.perf_counter() - started
+    return elapsed, len(lines), sum(len(line.encode("utf-8")) for line in lines)
+
+
+def stage_iter_captions(folder: str) -> tuple[float, int, int]:
+    files = _prepared(folder)
+    started = time.perf_counter()
+    # Kept in memory, so peak RSS shows the size of the caption records
+    captions = [
+        caption for file in files for caption in helpers.postprocess.iter_captions(file)
+    ]
+    return time.perf_counter() - started, len(captions), _size(files)
+
+
+def stage_wrap_text_lines(folder: str) -> tuple[float, int, int]:
+    texts = []
+    for file in _originals(folder):
+        texts.extend(" ".join(caption.lines) for caption in webvtt.read(file))
+    started = time.perf_counter()
+    for text in texts:
+        helpers.postprocess.wrap_text_lines(text, helpers.postprocess.LINE_LENGTH)
+    elapsed = time.perf_counter() - started
+    return elapsed, len(texts), sum(len(text.encode("utf-8")) for text in texts)
+
+
+def _texts(files: list[str]) -> list[str]:
+    texts = []
+    for file in files:
+        with open(file, "r", encoding="utf-8-sig") as f:
+            texts.append(f.read())
+    return texts
+
+
+def _through_temp_file(process_vtt: Callable, text: str) -> str:
+    # What an integration holding text in memory had to do before the text API
+    log = helpers.logging.create_null_log()
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "document.webvtt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+        with open(process_vtt(path, log), "r", encoding="utf-8") as f:
+            return f.read()
+
+
+def _text_api(
+    files: list[str], cues: int, transform: Callable[[str], str]
+) -> tuple[float, int, int]:
+    texts = _texts(files)
+    started = time.perf_counter()
+    for text in texts:
+        transform(text)
+    return time.perf_counter() - started, cues, _size(files)
+
+
+def stage_prepare_text(folder: str) -> tuple[float, int, int]:
+    files = _originals(folder)
+    cues = sum(len(webvtt.read(file).captions) for file in files)
+    return _text_api(files, cues, helpers.api.prepare_text)
+
+
+def stage_prepare_text_temp_files(folder: str) -> tuple[float, int, int]:
+    files = _originals(folder)
+    cues = sum(len(webvtt.read(file).captions) for file in files)
+    return _text_api(
+        files, cues, partial(_through_temp_file, helpers.preprocess.process_vtt)
+    )
+
+
+def stage_finalize_text(folder: str) -> tuple[float, int, int]:
+    return _text_api(
+        _prepared(folder), len(_merged_lines(folder)), helpers.api.finalize_text
+    )
+
+
+def stage_finalize_text_temp_files(folder: str) -> tuple[float, int, int]:
+    return _text_api(
+        _prepared(folder),
+        len(_merged_lines(folder)),
+        partial(_through_temp_file, helpers.postprocess.process_vtt),
+    )
+
+
+def _finalize_formats(
+    folder: str, finalize: Callable[[str], None]
+) -> tuple[float, int, int]:
+    files = _prepared(folder)
+    cues = len(_merged_lines(folder))
+    started = time.perf_counter()
+    for file in files:
+        finalize(file)
+    return time.perf_counter() - started, cues, _size(files)
+
+
+def _fan_out(file: str) -> None:
+    log = helpers.logging.create_null_log()
+    helpers.postprocess.process_vtt(file, log, helpers.formats.FORMATS)
+
+
+def _convert_after(file: str) -> None:
+    # Finalize, then convert the output in a pass of its own
+    final = helpers.postprocess.process_vtt(file, helpers.logging.create_null_log())
+    captions = webvtt.read(final)
+    captions.save_as_srt()
+    with open(helpers.postprocess.output_path(file, "ttml"), "w", encoding="utf-8") as f:
+        helpers.postprocess.write_formats([f], ["ttml"], captions)
+
+
+def stage_finalize_formats(folder: str) -> tuple[float, int, int]:
+    return _finalize_formats(folder, _fan_out)
+
+
+def stage_finalize_then_convert(folder: str) -> tuple[float, int, int]:
+    return _finalize_formats(folder, _convert_after)
+
+
+def _main(folder: str, action: str) -> float:
+    argv = ["process_webvtt.py", folder, action, "--force", "--workers", "1"]
+    # main writes its log into the working directory
+    os.chdir(folder)
+    with patch.object(sys, "argv", argv), patch(
+        "helpers.scheduler.alive_progress.alive_bar"
+    ):
+        started = time.perf_counter()
+        process_webvtt.main()
+        return time.perf_counter() - started
+
+
+def stage_main_prepare(folder: str) -> tuple[float, int, int]:
+    files = _originals(folder, "main")
+    cues = sum(len(webvtt.read(file).captions) for file in files)
+    return _main(os.path.join(folder, "main"), "prepare"), cues, _size(files)
+
+
+def stage_main_finalize(folder: str) -> tuple[float, int, int]:
+    files = _prepared(folder)
+    cues = len(_merged_lines(folder))
+    return _main(os.path.join(folder, PREPARED), "finalize"), cues, _size(files)
+
+
+STAGES: dict[str, Callable[[str], tuple[float, int, int]]] = {
+    "preprocess.process_vtt": stage_preprocess,
+    "preprocess.process_vtt webvtt-py": stage_preprocess_webvtt,
+    "postprocess.read_file": stage_read_file,
+    "postprocess.parse_vtt_line": stage_parse_vtt_line,
+    "postprocess.iter_captions": stage_iter_captions,
+    "postprocess.wrap_text_lines": stage_wrap_text_lines,
+    "api.prepare_text": stage_prepare_text,
+    "api.prepare_text temp files": stage_prepare_text_temp_files,
+    "api.finalize_text": stage_finalize_text,
+    "api.finalize_text temp files": stage_finalize_text_temp_files,
+    "postprocess.process_vtt vtt,srt,ttml": stage_finalize_formats,
+    "postprocess.process_vtt then convert": stage_finalize_then_convert,
+    "process_webvtt.main prepare": stage_main_prepare,
+    "process_webvtt.main finalize": stage_main_finalize,
+}
+
+
+def _measure(name: str, folder: str) -> dict:
+    seconds, cues, size = STAGES[name](folder)
+    return {
+        "seconds": round(seconds, 4),
+        "cues": cues,
+        "bytes": size,
+        "cues_per_sec": round(cues / seconds, 1),
+        "mb_per_sec": round(size / seconds / 1_000_000, 3),
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def measure_stage(name: str, folder: str) -> dict:
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+        return pool.submit(_measure, name, folder).result()
+
+
+def run_suite(spec: CorpusSpec, stages: list[str]) -> dict:
+    with tempfile.TemporaryDirectory() as folder:
+        generate_corpus(os.path.join(folder, CORPUS), spec)
+        for copy in ("preprocess", "main", "finalize"):
+            shutil.copytree(os.path.join(folder, CORPUS), os.path.join(folder, copy))
+        # Inputs of the finalize stages
+        log = helpers.logging.create_null_log()
+        for file in _originals(folder, "finalize"):
+            helpers.preprocess.process_vtt(file, log)
+        results = {name: measure_stage(name, folder) for name in stages}
+    return {
+        "corpus": spec.to_dict(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    defaults = CorpusSpec()
+    for field, value in defaults.to_dict().items():
+        parser.add_argument(
+            f"--{field.replace('_', '-')}", type=type(value), default=value
+        )
+    parser.add_argument(
+        "--stage", action="append", choices=STAGES, help="Only run these stages"
+    )
+    parser.add_argument("--output", help="Write the results into this JSON file")
+    args = parser.parse_args()
+    spec = CorpusSpec(**{field: getattr(args, field) for field in defaults.to_dict()})
+
+    report = run_suite(spec, args.stage or list(STAGES))
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
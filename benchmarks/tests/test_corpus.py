@@ -0,0 +1,40 @@
+from benchmarks.corpus import CorpusSpec, generate_corpus
+from helpers import postprocess, preprocess
+from unittest.mock import MagicMock
+import webvtt
+
+
+class TestGenerateCorpus:
+    def test_same_seed_same_corpus(self, tmp_path):
+        spec = CorpusSpec(seed=3, files=3, min_cues=20, max_cues=40)
+        first = generate_corpus(str(tmp_path / "a"), spec)
+        second = generate_corpus(str(tmp_path / "b"), spec)
+        for a, b in zip(first, second):
+            with open(a, encoding="utf-8") as f, open(b, encoding="utf-8") as g:
+                assert f.read() == g.read()
+
+    def test_other_seed_other_corpus(self, tmp_path):
+        spec = CorpusSpec(seed=3, files=1, min_cues=20, max_cues=40)
+        (first,) = generate_corpus(str(tmp_path / "a"), spec)
+        spec.seed = 4
+        (second,) = generate_corpus(str(tmp_path / "b"), spec)
+        with open(first, encoding="utf-8") as f, open(second, encoding="utf-8") as g:
+            assert f.read() != g.read()
+
+    def test_files_are_valid_webvtt(self, tmp_path):
+        spec = CorpusSpec(files=2, min_cues=50, max_cues=50, all_caps_ratio=1.0)
+        for file in generate_corpus(str(tmp_path), spec):
+            captions = webvtt.read(file).captions
+            assert len(captions) == 50
+            assert all(caption.text == caption.text.upper() for caption in captions)
+
+    def test_corpus_survives_prepare_and_finalize(self, tmp_path):
+        spec = CorpusSpec(files=2, min_cues=100, max_cues=100)
+        for file in generate_corpus(str(tmp_path), spec):
+            prepared = preprocess.process_vtt(file, MagicMock())
+            final = postprocess.process_vtt(prepared, MagicMock())
+            original = webvtt.read(file).captions
+            finalized = webvtt.read(final).captions
+            assert [(c.start, c.end) for c in original] == [
+                (c.start, c.end) for c in finalized
+            ]
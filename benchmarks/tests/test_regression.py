@@ -0,0 +1,58 @@
+from benchmarks import regression
+import glob
+import os
+import pytest
+
+
+class TestRegressions:
+    def test_within_tolerance(self):
+        baseline = {"api.prepare_text": 1000.0}
+        assert regression.regressions({"api.prepare_text": 750.0}, baseline, 0.3) == {}
+
+    def test_past_tolerance(self):
+        baseline = {"api.prepare_text": 1000.0, "api.finalize_text": 1000.0}
+        results = {"api.prepare_text": 200.0, "api.finalize_text": 1200.0}
+        assert regression.regressions(results, baseline, 0.3) == {
+            "api.prepare_text": 0.2
+        }
+
+    def test_paths_without_baseline_pass(self):
+        assert regression.regressions({"api.prepare_text": 1.0}, {}) == {}
+
+    def test_baseline_roundtrip(self, tmp_path):
+        path = str(tmp_path / "baseline.json")
+        regression.save_baseline({"api.prepare_text": 1234.5}, path)
+        assert regression.load_baseline(path) == {"api.prepare_text": 1234.5}
+
+    def test_tolerance_from_env(self, monkeypatch):
+        monkeypatch.setenv("PERF_TOLERANCE", "0.5")
+        assert regression.tolerance_from_env() == 0.5
+        monkeypatch.delenv("PERF_TOLERANCE")
+        assert regression.tolerance_from_env() == regression.TOLERANCE
+
+    def test_corpus_matches_spec(self, tmp_path):
+        generated = regression.write_corpus(str(tmp_path))
+        checked_in = sorted(glob.glob(os.path.join(regression.CORPUS, "*.webvtt")))
+        assert [os.path.basename(file) for file in generated] == [
+            os.path.basename(file) for file in checked_in
+        ]
+        for a, b in zip(generated, checked_in):
+            with open(a, encoding="utf-8") as f, open(b, encoding="utf-8") as g:
+                assert f.read() == g.read()
+
+    def test_measure_every_path(self):
+        results = regression.measure(repeats=1)
+        assert set(results) == set(regression.PATHS)
+        assert all(value > 0 for value in results.values())
+
+
+@pytest.mark.perf
+@pytest.mark.parametrize("path", regression.PATHS)
+def test_throughput(path):
+    baseline = regression.load_baseline()
+    results = regression.measure((path,))
+    slower = regression.regressions(results, baseline, regression.tolerance_from_env())
+    assert not slower, (
+        f"{path} is down to {slower[path]:.0%} of its baseline, "
+        "run python -m benchmarks.regression --update if this is intended"
+    )
@@ -0,0 +1,55 @@
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Callable, Iterable, Optional
+import helpers.postprocess
+import helpers.preprocess
+import helpers.rules
+
+
+def prepare_text(text: str, reader: Optional[str] = None) -> str:
+    """
+    Prepared text of a WebVTT document, what `prepare` would write for it.
+
+    Raises `webvtt.errors.MalformedFileError` if `text` is not WebVTT.
+    """
+    # Left over when a file with a byte order mark is read as plain UTF-8
+    if text.startswith("\ufeff"):
+        text = text[1:]
+    return helpers.preprocess.prepare_document(text, reader).text
+
+
+def finalize_text(text: str) -> str:
+    """
+    WebVTT document of prepared text, what `finalize` would write for it.
+    """
+    return helpers.postprocess.finalize_document(text).text
+
+
+def _map(function: Callable[[str], str], texts: Iterable[str], workers: int) -> list[str]:
+    if workers <= 1:
+        return [function(text) for text in texts]
+    # Workers apply the rules configured in this process
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=helpers.rules.configure,
+        initargs=(helpers.rules.current(),),
+    ) as pool:
+        return list(pool.map(function, texts))
+
+
+def prepare_texts(
+    texts: Iterable[str], workers: int = 1, reader: Optional[str] = None
+) -> list[str]:
+    """
+    `prepare_text` of every document, in order, on `workers` processes.
+
+    The first document failing raises its error.
+    """
+    return _map(partial(prepare_text, reader=reader), texts, workers)
+
+
+def finalize_texts(texts: Iterable[str], workers: int = 1) -> list[str]:
+    """
+    `finalize_text` of every document, in order, on `workers` processes.
+    """
+    return _map(finalize_text, texts, workers)
@@ -0,0 +1,245 @@
+import glob
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Final, Iterable, Optional, Sequence
+import helpers.rules
+
+CACHE_VERSION: Final[int] = 1
+DEFAULT_SIZE: Final[int] = 16384
+
+# Every cache created, so they can be configured and saved together
+_caches: dict[str, "LRUCache"] = {}
+_folder: Optional[str] = None
+
+
+def rules_version(*sources: str) -> str:
+    """
+    Hash of the modules implementing a set of rules, of `helpers.rules`,
+    which compiles them, and of the rules applied.
+    """
+    digest = hashlib.sha256()
+    for source in (*sources, helpers.rules.__file__):
+        with open(source, "rb") as f:
+            digest.update(hashlib.file_digest(f, "sha256").digest())
+    digest.update(helpers.rules.current().version.encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+class LRUCache:
+    """
+    Results of a pure cue text transformation, least recently used dropped first.
+
+    Keys are the text the transformation gets. The rules version is the
+    hash of `sources`, the modules whose code shapes the results, and of
+    the `helpers.rules` applied. It only keys the entries saved to disk, which
+    are discarded when the version differs; `helpers.rules.configure`
+    clears the entries in memory when the rules change.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        sources: Sequence[str],
+        decode: Callable[[Any], Any] = tuple,
+        size: int = DEFAULT_SIZE,
+    ):
+        self.name = name
+        self.sources = tuple(sources)
+        # Turns a value loaded from JSON back into what was cached
+        self.decode = decode
+        self.size = size
+        self.entries: OrderedDict[str, Any] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.changed = False
+        # Worker threads share the cache
+        self._lock = threading.Lock()
+        _caches[name] = self
+
+    def get(self, key: str) -> Optional[Any]:
+        # Without the lock: a key evicted by another thread is just a miss
+        try:
+            value = self.entries[key]
+            self.entries.move_to_end(key)
+        except KeyError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value
+
+    def put(self, key: str, value: Any) -> None:
+        if self.size <= 0:
+            return
+        with self._lock:
+            self._add(key, value)
+            self.changed = True
+
+    def _add(self, key: str, value: Any) -> None:
+        if self.size <= 0:
+            return
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self.entries.clear()
+            self.hits = self.misses = self.evictions = 0
+            self.changed = False
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self.entries),
+        }
+
+    def path(self, folder: str) -> str:
+        return os.path.join(folder, f"{self.name}.json")
+
+    def _read(self, path: str) -> list:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            # Nothing saved yet, or a damaged file: start empty
+            return []
+        if data.get("version") != CACHE_VERSION:
+            return []
+        if data.get("rules") != rules_version(*self.sources):
+            return []
+        return data.get("entries", [])
+
+    def _write(self, path: str, entries: list) -> None:
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "version": CACHE_VERSION,
+                    "rules": rules_version(*self.sources),
+                    "entries": entries,
+                },
+                f,
+                ensure_ascii=False,
+            )
+        os.replace(tmp_path, path)
+
+    def load(self, folder: str) -> None:
+        entries = self._read(self.path(folder))
+        with self._lock:
+            for key, value in entries:
+                self._add(key, self.decode(value))
+            # Entries dropped while loading are not evicted by this run
+            self.evictions = 0
+
+    def save_part(self, folder: str) -> None:
+        """
+        Save the entries of a worker process, for `save` to merge.
+        """
+        if not self.changed:
+            return
+        os.makedirs(folder, exist_ok=True)
+        with self._lock:
+            entries = list(self.entries.items())
+            self.changed = False
+        self._write(f"{self.path(folder)}.{os.getpid()}.part", entries)
+
+    def save(self, folder: str) -> None:
+        """
+        Merge the saved entries, the worker parts and the entries of this process.
+
+        Later entries are the more recent ones, the oldest are dropped
+        beyond the cache size.
+        """
+        parts = glob.glob(f"{glob.escape(self.path(folder))}.*.part")
+        if not self.changed and not parts:
+            return
+        entries = OrderedDict(self._read(self.path(folder)))
+        with self._lock:
+            for path in parts:
+                entries.update(self._read(path))
+            for key, value in self.entries.items():
+                entries.pop(key, None)
+                entries[key] = value
+            self.changed = False
+        kept = list(entries.items())[-self.size :] if self.size > 0 else []
+        os.makedirs(folder, exist_ok=True)
+        self._write(self.path(folder), kept)
+        for path in parts:
+            os.remove(path)
+
+
+def configure(size: int = DEFAULT_SIZE, folder: Optional[str] = None) -> None:
+    """
+    Set the size of every cache and load the entries saved in `folder`.
+
+    Counters start from zero, so they cover a single run.
+    """
+    global _folder
+    _folder = folder
+    for cache in _caches.values():
+        cache.clear()
+        cache.size = size
+        if folder:
+            cache.load(folder)
+
+
+def clear() -> None:
+    for cache in _caches.values():
+        cache.clear()
+
+
+def save() -> None:
+    if _folder:
+        for cache in _caches.values():
+            cache.save(_folder)
+
+
+def save_part() -> None:
+    if _folder:
+        for cache in _caches.values():
+            cache.save_part(_folder)
+
+
+def stats() -> dict[str, dict[str, int]]:
+    """
+    Counters of every cache in this process, keyed on the cache name.
+    """
+    return {name: cache.stats() for name, cache in _caches.items()}
+
+
+def latest(
+    previous: Optional[dict[str, dict[str, int]]], snapshot: dict[str, dict[str, int]]
+) -> dict[str, dict[str, int]]:
+    """
+    The later of two `stats` of one process, which may arrive out of order.
+    """
+    if not previous:
+        return snapshot
+    return {
+        name: {
+            key: max(value, previous.get(name, {}).get(key, 0))
+            for key, value in counters.items()
+        }
+        for name, counters in snapshot.items()
+    }
+
+
+def total(snapshots: Iterable[dict[str, dict[str, int]]]) -> dict[str, dict[str, int]]:
+    """
+    Counters of all processes, from the latest `stats` of each one.
+    """
+    result: dict[str, dict[str, int]] = {}
+    for snapshot in snapshots:
+        for name, counters in snapshot.items():
+            totals = result.setdefault(name, dict.fromkeys(counters, 0))
+            for key, value in counters.items():
+                totals[key] += value
+    return result
@@ -0,0 +1,103 @@
+import re
+from typing import Final, NamedTuple, Optional, Sequence
+import helpers.postprocess
+import helpers.preprocess
+
+CHUNK_SIZE: Final[int] = 512 * 1024
+# Roundtrip compares whole files, so only these are split
+ACTIONS: Final[tuple[str, ...]] = ("prepare", "finalize")
+HEADER: Final[str] = "WEBVTT\n"
+
+# A prepared line starting with a timestamp never continues the caption before it
+_CAPTION_START: Final = re.compile(rf"\n[^\S\n]*{helpers.postprocess.TIMESTAMP_PATTERN}")
+
+
+class Chunk(NamedTuple):
+    """
+    Output of a range of cues, and the state the cues after it depend on.
+    """
+
+    text: str
+    cues: int
+    all_caps: bool
+
+
+def _universal_newlines(text: str) -> str:
+    # What reading the file in text mode does, the chunks are split by line
+    if "\r" not in text:
+        return text
+    return text.replace("\r\n", "\n").replace("\r", "\n")
+
+
+def _boundary(action: str, text: str, position: int) -> int:
+    """
+    Start of the first cue at or after `position`, or -1.
+    """
+    if action == "prepare":
+        # After an empty line, which ends every block in both readers
+        found = text.find("\n\n", position)
+        return found + 2 if found >= 0 else -1
+    match = _CAPTION_START.search(text, position)
+    return match.start() + 1 if match else -1
+
+
+def split(action: str, text: str, chunk_size: int = CHUNK_SIZE) -> list[str]:
+    """
+    Split a document into ranges of whole cues of about `chunk_size` characters.
+
+    Every chunk is a document of its own: the chunks of an original get a
+    WebVTT header, the chunks of prepared text start with a caption.
+    """
+    text = _universal_newlines(text)
+    chunks: list[str] = []
+    start = 0
+    while chunk_size > 0 and len(text) - start > chunk_size:
+        end = _boundary(action, text, start + chunk_size)
+        if end < 0 or end >= len(text):
+            break
+        chunks.append(text[start:end])
+        start = end
+    chunks.append(text[start:])
+    if action == "prepare":
+        return [chunks[0], *(f"{HEADER}\n{chunk}" for chunk in chunks[1:])]
+    return chunks
+
+
+def transform(
+    action: str, index: int, text: str, reader: Optional[str] = None
+) -> Chunk:
+    """
+    Run `action` on the chunk at `index` of a document.
+    """
+    if action == "prepare":
+        # Unless it is the first, a chunk starting with a sound gets a line
+        # break before it, `stitch` drops it after a cue ending with one
+        prepared = helpers.preprocess.prepare_document(text, reader, index == 0)
+        return Chunk(prepared.text, prepared.cues, prepared.all_caps)
+    if action == "finalize":
+        finalized = helpers.postprocess.finalize_document(text)
+        # Only the first chunk keeps the header
+        output = finalized.text if index == 0 else finalized.text[len(HEADER) :]
+        return Chunk(output, finalized.cues, False)
+    raise ValueError(f"Cannot split files of {action}")
+
+
+def stitch(action: str, chunks: Sequence[Chunk]) -> Chunk:
+    """
+    Join the outputs of all chunks of a document, in order.
+    """
+    cues = sum(chunk.cues for chunk in chunks)
+    all_caps = all(chunk.all_caps for chunk in chunks)
+    if action != "prepare":
+        return Chunk("".join(chunk.text for chunk in chunks), cues, all_caps)
+    parts: list[str] = []
+    newline_in_previous = True
+    for chunk in chunks:
+        if not chunk.text:
+            continue
+        if newline_in_previous and chunk.text.startswith("\n"):
+            parts.append(chunk.text[1:])
+        else:
+            parts.append(chunk.text)
+        newline_in_previous = chunk.text.endswith("\n")
+    return Chunk("".join(parts), cues, all_caps)
@@ -0,0 +1,64 @@
+import fnmatch
+import os
+from typing import Final, Iterator, Sequence
+from structlog import BoundLogger
+
+INCLUDE: Final[tuple[str, ...]] = ("*.webvtt",)
+# Folders the actions write their outputs into
+OUTPUT_DIRS: Final[tuple[str, ...]] = ("prepared", "final")
+
+
+def _matches(relpath: str, patterns: Sequence[str]) -> bool:
+    name = relpath.rsplit("/", 1)[-1]
+    return any(
+        fnmatch.fnmatchcase(relpath, pattern) or fnmatch.fnmatchcase(name, pattern)
+        for pattern in patterns
+    )
+
+
+def walk(
+    root: str,
+    log: BoundLogger,
+    include: Sequence[str] = INCLUDE,
+    exclude: Sequence[str] = (),
+    prune: Sequence[str] = OUTPUT_DIRS,
+) -> Iterator[str]:
+    """
+    Yield the files below `root` matching `include`, directory by directory.
+
+    Patterns match the name or the path relative to `root` (with `/`
+    separators). Directories named in `prune` or matching `exclude` are not
+    entered, symlinked directories are followed once, so links pointing
+    back up the tree do not loop. Unreadable directories are logged and
+    skipped.
+    """
+    visited: set[tuple[int, int]] = set()
+    stack = [(root, "")]
+    while stack:
+        folder, relfolder = stack.pop()
+        try:
+            stat = os.stat(folder)
+            if (stat.st_dev, stat.st_ino) in visited:
+                log.warning("Directory already visited", path=folder)
+                continue
+            visited.add((stat.st_dev, stat.st_ino))
+            with os.scandir(folder) as it:
+                entries = sorted(it, key=lambda entry: entry.name)
+        except OSError as e:
+            log.warning("Directory skipped", path=folder, error=str(e))
+            continue
+        subfolders = []
+        for entry in entries:
+            relpath = f"{relfolder}{entry.name}"
+            try:
+                is_dir = entry.is_dir()
+                is_file = not is_dir and entry.is_file()
+            except OSError:
+                continue
+            if is_dir:
+                if entry.name not in prune and not _matches(relpath, exclude):
+                    subfolders.append((entry.path, f"{relpath}/"))
+            elif is_file and _matches(relpath, include) and not _matches(relpath, exclude):
+                yield entry.path
+        # Depth first, in name order
+        stack.extend(reversed(subfolders))
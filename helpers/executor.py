@@ -0,0 +1,215 @@
+import multiprocessing.util
+import os
+import threading
+import time
+from concurrent.futures import (
+    BrokenExecutor,
+    Executor,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+)
+from dataclasses import dataclass, field
+from typing import Any, Callable, Final, Optional, Sequence
+from structlog import BoundLogger
+import helpers.cache
+import helpers.failures
+import helpers.formats
+import helpers.logging
+import helpers.postprocess
+import helpers.preprocess
+import helpers.profiling
+import helpers.reader
+import helpers.rules
+import helpers.roundtrip
+
+# "async" runs files through `helpers.pipeline`, on worker processes
+EXECUTORS: Final[tuple[str, ...]] = ("thread", "process", "async")
+
+# Logger of the current worker process, set up by `_init_worker`
+_worker_log: Optional[BoundLogger] = None
+
+
+@dataclass
+class FileResult:
+    file: str
+    output: Any  # output path, or the mismatches found by roundtrip
+    profile: dict[str, float] = field(default_factory=dict)
+    failure: Optional[dict[str, str]] = None
+    # Cache counters of the processes that ran the file, see `helpers.cache.stats`,
+    # keyed on the process id; a file split in chunks may run on several
+    caches: dict[int, dict[str, dict[str, int]]] = field(default_factory=dict)
+    # Wall time spent on the file by the workers, whether or not it is profiled
+    seconds: float = 0.0
+
+
+def default_workers() -> int:
+    return os.cpu_count() or 1
+
+
+def action_function(action: str) -> Callable[[str, BoundLogger], Any]:
+    # Looked up on every call so the functions can be patched in tests
+    if action == "prepare":
+        return helpers.preprocess.process_vtt
+    if action == "finalize":
+        return helpers.postprocess.process_vtt
+    if action == "roundtrip":
+        return helpers.roundtrip.process_vtt
+    raise ValueError(f"Unknown action {action}")
+
+
+def _init_worker(
+    log_name: str,
+    profile: bool,
+    reader: str,
+    cache_size: int = helpers.cache.DEFAULT_SIZE,
+    cache_dir: Optional[str] = None,
+    memprofile: bool = False,
+    rules: Optional[helpers.rules.Rules] = None,
+    formats: Sequence[str] = helpers.formats.DEFAULT_FORMATS,
+    log_settings: Optional[helpers.logging.LogSettings] = None,
+) -> None:
+    global _worker_log
+    _worker_log = helpers.logging.create_worker_log(log_name, log_settings)
+    helpers.profiling.configure(profile, memprofile)
+    helpers.reader.configure(reader)
+    helpers.formats.configure(formats)
+    # Before the cache, which discards entries saved under other rules
+    helpers.rules.configure(rules)
+    helpers.cache.configure(cache_size, cache_dir)
+    # Run when the pool shuts the worker down, atexit handlers are not.
+    # The parent merges the parts once the pool is shut down.
+    multiprocessing.util.Finalize(None, helpers.cache.save_part, exitpriority=10)
+
+
+def run_file(
+    action: str,
+    file: str,
+    log: Optional[BoundLogger] = None,
+    keep_going: bool = False,
+) -> FileResult:
+    """
+    Process a single file on a worker thread or process.
+
+    Worker processes receive only the action name and the file path and
+    log through their own logger, the result is sent back to the parent.
+    With `keep_going` a failure is returned in the result instead of raised,
+    before the original error is lost to pickling.
+    """
+    started = time.perf_counter()
+    with helpers.profiling.profiled() as profile:
+        try:
+            output = action_function(action)(file, log or _worker_log)
+        except Exception as e:
+            if not keep_going:
+                raise
+            failure = helpers.failures.failure(action, file, profile.last_lap, e)
+            return FileResult(
+                file, None, failure=failure, seconds=time.perf_counter() - started
+            )
+    return FileResult(
+        file,
+        output,
+        profile.fields(),
+        caches={os.getpid(): helpers.cache.stats()},
+        seconds=time.perf_counter() - started,
+    )
+
+
+class RestartingPool(Executor):
+    """
+    Pool replaced by a new one from `create` once it is broken.
+
+    A process pool breaks when one of its workers dies, killed for running
+    out of memory say. The files in flight then fail with
+    `BrokenProcessPool`, the files submitted later run on the new pool.
+    """
+
+    def __init__(self, create: Callable[[], Executor], log: BoundLogger):
+        self.create = create
+        self.log = log
+        self.pool = create()
+        self._lock = threading.Lock()
+
+    def submit(self, fn, /, *args, **kwargs) -> Future:
+        with self._lock:
+            try:
+                return self.pool.submit(fn, *args, **kwargs)
+            except BrokenExecutor as e:
+                self.log.warning("Worker pool restarted", error=str(e))
+                self.pool.shutdown(wait=False)
+                self.pool = self.create()
+                return self.pool.submit(fn, *args, **kwargs)
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False) -> None:
+        self.pool.shutdown(wait=wait, cancel_futures=cancel_futures)
+
+
+def create_executor(
+    kind: str,
+    workers: int,
+    log_name: str,
+    profile: bool = False,
+    reader: str = "fast",
+    cache_size: int = helpers.cache.DEFAULT_SIZE,
+    cache_dir: Optional[str] = None,
+    memprofile: bool = False,
+    rules: Optional[helpers.rules.Rules] = None,
+    formats: Sequence[str] = helpers.formats.DEFAULT_FORMATS,
+    log: Optional[BoundLogger] = None,
+) -> Executor:
+    """
+    Pool of `workers` threads or processes.
+
+    Given `log`, a process pool broken by a dead worker is restarted and
+    the restart logged, see `RestartingPool`.
+    """
+    if kind == "process" and log is not None:
+        return RestartingPool(
+            lambda: create_executor(
+                kind,
+                workers,
+                log_name,
+                profile=profile,
+                reader=reader,
+                cache_size=cache_size,
+                cache_dir=cache_dir,
+                memprofile=memprofile,
+                rules=rules,
+                formats=formats,
+            ),
+            log,
+        )
+    if kind == "process":
+        # Only the settings of the rules are sent, workers compile them
+        return ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(
+                log_name,
+                profile,
+                reader,
+                cache_size,
+                cache_dir,
+                memprofile,
+                rules,
+                tuple(formats),
+                helpers.logging.settings(),
+            ),
+        )
+    if kind == "thread":
+        return ThreadPoolExecutor(max_workers=workers)
+    raise ValueError(f"Unknown executor {kind}")
+
+
+def submit(
+    executor: Executor,
+    kind: str,
+    action: str,
+    file: str,
+    log: BoundLogger,
+    keep_going: bool = False,
+) -> Future:
+    if kind == "process":
+        return executor.submit(run_file, action, file, None, keep_going)
+    return executor.submit(run_file, action, file, log, keep_going)
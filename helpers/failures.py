@@ -0,0 +1,55 @@
+import json
+from typing import Final, Optional
+
+SUMMARY_VERSION: Final[int] = 1
+
+# Stages every cue goes through, in the order `process_vtt` laps them
+ACTION_STAGES: Final[dict[str, tuple[str, ...]]] = {
+    "prepare": ("parse", "transform", "write"),
+    "finalize": ("parse", "transform", "wrap", "write"),
+    "roundtrip": ("parse", "transform", "wrap"),
+}
+
+
+def failed_stage(action: str, last_lap: Optional[str]) -> str:
+    """
+    The stage following the last completed one, which is where the file failed.
+    """
+    stages = ACTION_STAGES[action]
+    if last_lap not in stages:
+        return stages[0]
+    return stages[(stages.index(last_lap) + 1) % len(stages)]
+
+
+def failure(action: str, file: str, last_lap: Optional[str], error: Exception) -> dict:
+    # process_vtt wraps the original error in a generic "Processing error"
+    cause = error.__cause__ or error
+    return {
+        "file": file,
+        "stage": failed_stage(action, last_lap),
+        "type": type(cause).__name__,
+        "message": str(cause),
+    }
+
+
+def write_summary(path: str, action: str, files: int, failures: list[dict]) -> None:
+    summary = {
+        "version": SUMMARY_VERSION,
+        "action": action,
+        "files": files,
+        "failed": len(failures),
+        "failures": sorted(failures, key=lambda entry: entry["file"]),
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+
+
+def load_files(path: str) -> list[str]:
+    """
+    Files listed in a failure summary, to be processed again.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        summary = json.load(f)
+    if summary.get("version") != SUMMARY_VERSION:
+        raise ValueError(f"{path} is not a failure summary")
+    return [entry["file"] for entry in summary["failures"]]
@@ -0,0 +1,137 @@
+import abc
+from typing import Final, Sequence, TextIO
+from xml.sax.saxutils import escape
+
+FORMATS: Final[tuple[str, ...]] = ("vtt", "srt", "ttml")
+DEFAULT_FORMATS: Final[tuple[str, ...]] = ("vtt",)
+
+_default_formats: tuple[str, ...] = DEFAULT_FORMATS
+
+
+def parse(value: str) -> tuple[str, ...]:
+    """
+    Formats of a comma separated list like "vtt,srt", in the order given.
+    """
+    formats = tuple(
+        dict.fromkeys(part.strip().lower() for part in value.split(",") if part.strip())
+    )
+    unknown = [name for name in formats if name not in FORMATS]
+    if unknown:
+        raise ValueError(f"Unknown formats {', '.join(unknown)}")
+    if not formats:
+        raise ValueError("No output format given")
+    return formats
+
+
+def configure(formats: Sequence[str] = DEFAULT_FORMATS) -> None:
+    global _default_formats
+    unknown = [name for name in formats if name not in FORMATS]
+    if unknown or not formats:
+        raise ValueError(f"Unknown formats {', '.join(unknown)}")
+    _default_formats = tuple(formats)
+
+
+def current() -> tuple[str, ...]:
+    """
+    Formats finalize writes, the first one is the output recorded for a file.
+    """
+    return _default_formats
+
+
+class Writer(abc.ABC):
+    """
+    Writes captions to a text stream as they are parsed, one at a time.
+
+    Captions are `postprocess.CaptionRecord` or `webvtt.Caption`, only
+    `start`, `end`, `lines` and `text` are used.
+    """
+
+    extension: str = ""
+
+    def __init__(self, f: TextIO):
+        self.f = f
+
+    def begin(self) -> None:
+        pass
+
+    @abc.abstractmethod
+    def write(self, caption) -> None:
+        pass
+
+    def end(self) -> None:
+        pass
+
+
+class VttWriter(Writer):
+    """
+    Byte-identical to `webvtt.WebVTT.save`.
+    """
+
+    extension = ".vtt"
+
+    def begin(self) -> None:
+        self.f.write("WEBVTT\n")
+
+    def write(self, caption) -> None:
+        self.f.write(f"\n{caption.start} --> {caption.end}\n")
+        for line in caption.lines:
+            self.f.write(f"{line}\n")
+
+
+class SrtWriter(Writer):
+    """
+    Byte-identical to `webvtt.WebVTT.save_as_srt` of the WebVTT output.
+
+    webvtt-py strips the end of the whole document, so a caption is only
+    written once the next one arrives.
+    """
+
+    extension = ".srt"
+
+    def __init__(self, f: TextIO):
+        super().__init__(f)
+        self.count = 0
+        self._pending: str = ""
+
+    def write(self, caption) -> None:
+        self.count += 1
+        if self._pending:
+            self.f.write(f"{self._pending}\n\n")
+        start = caption.start.replace(".", ",")
+        end = caption.end.replace(".", ",")
+        self._pending = "\n".join(
+            [str(self.count), f"{start} --> {end}", *caption.text.splitlines()]
+        )
+
+    def end(self) -> None:
+        self.f.write(self._pending.rstrip())
+
+
+class TtmlWriter(Writer):
+    """
+    Minimal TTML 1.0: a paragraph per caption, its lines separated by breaks.
+    """
+
+    extension = ".ttml"
+
+    def begin(self) -> None:
+        self.f.write(
+            '<?xml version="1.0" encoding="utf-8"?>\n'
+            '<tt xmlns="http://www.w3.org/ns/ttml" xml:lang="">\n'
+            "  <body>\n"
+            "    <div>\n"
+        )
+
+    def write(self, caption) -> None:
+        text = "<br/>".join(escape(line) for line in caption.text.splitlines())
+        self.f.write(f'      <p begin="{caption.start}" end="{caption.end}">{text}</p>\n')
+
+    def end(self) -> None:
+        self.f.write("    </div>\n  </body>\n</tt>\n")
+
+
+WRITERS: Final[dict[str, type[Writer]]] = {
+    "vtt": VttWriter,
+    "srt": SrtWriter,
+    "ttml": TtmlWriter,
+}
@@ -0,0 +1,137 @@
+import contextlib
+import json
+import os
+from typing import TYPE_CHECKING, Final, Iterator, Optional, TextIO
+from structlog import BoundLogger
+
+if TYPE_CHECKING:
+    # process_vtt writes through `atomic_open`, the executor imports it
+    import helpers.executor
+
+JOURNAL_VERSION: Final[int] = 1
+
+
+@contextlib.contextmanager
+def atomic_open(path: str) -> Iterator[TextIO]:
+    """
+    Open `path` for writing text, it only appears once the file is complete.
+
+    The text goes to a temporary file renamed over `path` when the block
+    ends, a run killed halfway leaves the temporary file, never a truncated
+    output.
+    """
+    tmp_path = f"{path}.tmp"
+    f = open(tmp_path, "w", encoding="utf-8")
+    try:
+        yield f
+        f.close()
+        os.replace(tmp_path, path)
+    except BaseException:
+        f.close()
+        with contextlib.suppress(OSError):
+            os.remove(tmp_path)
+        raise
+
+
+def journal_path(folder: str, action: str, shard: Optional[tuple[int, int]] = None) -> str:
+    # Shards running on other nodes keep journals of their own
+    suffix = f".shard-{shard[0]}-of-{shard[1]}" if shard else ""
+    return os.path.join(folder, f".webvtt_loc.{action}{suffix}.journal")
+
+
+def _line(entry: dict) -> str:
+    return json.dumps(entry, ensure_ascii=False) + "\n"
+
+
+class Journal:
+    """
+    Append-only record of the files a run completed, to resume it when killed.
+
+    A line is written and flushed as soon as a file is done, with the input
+    hash the manifest computed, so a resumed run records it in the manifest
+    without reading the file again. The first line holds the tool version;
+    a journal of other rules is not resumed. A line cut short by the kill
+    is ignored.
+    """
+
+    def __init__(self, path: str, tool: str, hashes: dict[str, str]):
+        self.path = path
+        self.tool = tool
+        # Input hashes of the manifest, filled in as files are checked
+        self.hashes = hashes
+        self.entries: dict[str, dict[str, str]] = {}
+        self._f: Optional[TextIO] = None
+        self._started = False
+
+    def load(self, log: BoundLogger) -> None:
+        """
+        Read the files completed by the killed run, to be skipped.
+        """
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                lines = f.read().splitlines()
+        except OSError:
+            log.info("No journal to resume", journal=self.path)
+            return
+        entries = []
+        for line in lines:
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                continue
+        header = entries[0] if entries else {}
+        if header.get("version") != JOURNAL_VERSION or header.get("tool") != self.tool:
+            log.warning("Journal not resumed", journal=self.path, reason="other rules")
+            return
+        for entry in entries[1:]:
+            if "file" in entry and os.path.exists(entry.get("output", "")):
+                self.entries[entry["file"]] = entry
+        log.info("Resuming", journal=self.path, completed=len(self.entries))
+
+    def open(self) -> None:
+        """
+        Start the journal, keeping the entries loaded by `load`.
+
+        The file is created with the first completed file, a journal left by
+        an earlier run is replaced.
+        """
+        self._started = True
+        with contextlib.suppress(OSError):
+            os.remove(self.path)
+        if self.entries:
+            with atomic_open(self.path) as f:
+                f.write(_line({"version": JOURNAL_VERSION, "tool": self.tool}))
+                for entry in self.entries.values():
+                    f.write(_line(entry))
+
+    def _write(self, entry: dict) -> None:
+        if self._f is None:
+            new = not os.path.exists(self.path)
+            self._f = open(self.path, "a", encoding="utf-8")
+            if new:
+                self._f.write(_line({"version": JOURNAL_VERSION, "tool": self.tool}))
+        self._f.write(_line(entry))
+        # Seen by a resumed run even if this one is killed right after
+        self._f.flush()
+
+    def add(self, result: "helpers.executor.FileResult") -> None:
+        if not self._started or result.failure or not isinstance(result.output, str):
+            return
+        entry = {"file": result.file, "output": result.output}
+        digest = self.hashes.get(result.file)
+        if digest is not None:
+            entry["hash"] = digest
+        self.entries[result.file] = entry
+        self._write(entry)
+
+    def close(self, complete: bool) -> None:
+        """
+        Close the journal, and remove it once the run is complete.
+        """
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+        self._started = False
+        if complete:
+            with contextlib.suppress(OSError):
+                os.remove(self.path)
@@ -1,27 +1,210 @@
+import atexit
+import logging
+import multiprocessing.util
+import os
+import queue
+import threading
 import structlog
 from pathlib import Path
 from datetime import datetime
+from typing import Any, Final, NamedTuple, Optional
 
+LEVELS: Final[tuple[str, ...]] = ("debug", "info", "warning", "error", "critical")
+QUEUE_SIZE: Final[int] = 10000
+# What to do with an event when the queue is full
+OVERFLOW: Final[tuple[str, ...]] = ("block", "drop")
+# Events rendered and written together by the writer thread
+BATCH_SIZE: Final[int] = 512
 
-def create_log(filename: str = "webvtt") -> structlog.BoundLogger:
-    log_path = Path(filename).with_suffix(".jsonl")
-    if log_path.exists():
-        # Append timestamp to the old log file before creating a new one
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        backup_path = log_path.with_name(
-            f"{log_path.stem}_{timestamp}{log_path.suffix}"
-        )
-        log_path.rename(backup_path)
+# Tells the writer thread to stop once every event before it is written
+_STOP: Final = None
+
+
+class LogSettings(NamedTuple):
+    level: str = "info"
+    queue_size: int = QUEUE_SIZE
+    overflow: str = "block"
+
+
+_settings = LogSettings()
+_sink: Optional["QueueSink"] = None
+
+
+class QueueSink:
+    """
+    Event dicts queued by the logging threads, written by a background thread.
+
+    The writer renders the events to JSON and appends a batch with a single
+    write, so processes appending to the same file do not cut each other's
+    lines. A full queue blocks the logging thread, or with the "drop"
+    overflow drops the event; the number dropped is logged by the writer.
+    """
+
+    def __init__(self, log_path: Path, mode: str, settings: LogSettings):
+        # Appended to even when truncated, like the workers do
+        flags = os.O_WRONLY | os.O_CREAT | os.O_APPEND
+        self.fd = os.open(log_path, flags if "a" in mode else flags | os.O_TRUNC, 0o644)
+        self.block = settings.overflow == "block"
+        self.queue: queue.Queue = queue.Queue(settings.queue_size)
+        self.dropped = 0
+        self.closed = False
+        self._lock = threading.Lock()
+        self._render = structlog.processors.JSONRenderer(ensure_ascii=False, sort_keys=True)
+        self._timestamp = structlog.processors.TimeStamper(fmt="ISO", utc=True)
+        self._thread = threading.Thread(target=self._write, name="log-writer", daemon=True)
+        self._thread.start()
+
+    def put(self, event: dict[str, Any]) -> None:
+        if self.closed:
+            # Logged during interpreter shutdown, after the last flush
+            return
+        if self.block:
+            self.queue.put(event)
+            return
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+
+    def _dropped_event(self) -> Optional[dict[str, Any]]:
+        with self._lock:
+            dropped, self.dropped = self.dropped, 0
+        if not dropped:
+            return None
+        event = {"msg": "Log events dropped", "level": "warning", "dropped": dropped}
+        return self._timestamp(None, "warning", event)
+
+    def _write(self) -> None:
+        stopping = False
+        while not stopping:
+            batch = [self.queue.get()]
+            while len(batch) < BATCH_SIZE:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            if batch[-1] is _STOP:
+                batch.pop()
+                stopping = True
+            dropped = self._dropped_event()
+            if dropped:
+                batch.append(dropped)
+            if not batch:
+                continue
+            lines = "".join(f"{self._render(None, '', event)}\n" for event in batch)
+            try:
+                os.write(self.fd, lines.encode("utf-8"))
+            except OSError:
+                # A full disk must not stop the run, nor block it on a full queue
+                with self._lock:
+                    self.dropped += len(batch)
+
+    def close(self) -> None:
+        """
+        Write every queued event and close the file.
+        """
+        self.closed = True
+        # Never dropped, whatever the overflow
+        self.queue.put(_STOP)
+        self._thread.join()
+        os.close(self.fd)
+
+
+class _QueueLogger:
+    """
+    structlog logger handing the processed event dict to the sink.
+    """
+
+    def __init__(self, sink: QueueSink):
+        self.sink = sink
+
+    def msg(self, **event: Any) -> None:
+        self.sink.put(event)
+
+    debug = info = warning = warn = error = critical = exception = fatal = failure = msg
+
+
+def shutdown() -> None:
+    """
+    Flush the events still queued and stop the writer of this process.
+    """
+    global _sink
+    if _sink is not None:
+        _sink.close()
+        _sink = None
+
+
+def _configure(log_path: Path, mode: str, settings: LogSettings) -> None:
+    global _settings, _sink
+    shutdown()
+    _settings = settings
+    _sink = QueueSink(log_path, mode, settings)
+    sink = _sink
     structlog.configure(
+        # Rendering and writing are left to the writer thread, only what
+        # depends on the moment of the call runs in the logging thread
         processors=[
             structlog.processors.TimeStamper(fmt="ISO", utc=True),
             structlog.processors.add_log_level,
             structlog.processors.EventRenamer("msg"),
             structlog.processors.dict_tracebacks,
-            structlog.processors.JSONRenderer(ensure_ascii=False, sort_keys=True),
         ],
-        logger_factory=structlog.WriteLoggerFactory(
-            file=log_path.open("wt", encoding="utf-8")
+        wrapper_class=structlog.make_filtering_bound_logger(
+            logging.getLevelName(settings.level.upper())
         ),
+        logger_factory=lambda *args: _QueueLogger(sink),
     )
+
+
+def settings() -> LogSettings:
+    """
+    Settings of the log of this process, for worker processes to use as well.
+    """
+    return _settings
+
+
+def create_log(
+    filename: str = "webvtt", settings: LogSettings = LogSettings()
+) -> structlog.BoundLogger:
+    log_path = Path(filename).with_suffix(".jsonl")
+    if log_path.exists():
+        # Append timestamp to the old log file before creating a new one
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        backup_path = log_path.with_name(
+            f"{log_path.stem}_{timestamp}{log_path.suffix}"
+        )
+        log_path.rename(backup_path)
+    _configure(log_path, "wt", settings)
     return structlog.get_logger()
+
+
+def create_worker_log(
+    filename: str = "webvtt", settings: Optional[LogSettings] = None
+) -> structlog.BoundLogger:
+    """
+    Configure logging inside a worker process.
+
+    Appends to the log file created by `create_log` in the parent process,
+    every event is tagged with the worker's pid. The queued events are
+    written when the pool shuts the worker down.
+    """
+    global _sink
+    # A forked worker inherits the sink of the parent, but not its writer thread
+    _sink = None
+    _configure(Path(filename).with_suffix(".jsonl"), "at", settings or _settings)
+    # atexit handlers are not run in pool workers
+    multiprocessing.util.Finalize(None, shutdown, exitpriority=0)
+    return structlog.get_logger().bind(worker=os.getpid())
+
+
+def create_null_log() -> structlog.BoundLogger:
+    """
+    Logger dropping every event, for callers that do not want a log file.
+    """
+    return structlog.wrap_logger(
+        None, wrapper_class=structlog.make_filtering_bound_logger(logging.CRITICAL)
+    )
+
+
+atexit.register(shutdown)
@@ -0,0 +1,203 @@
+import contextlib
+import hashlib
+import json
+import os
+import socket
+import time
+from types import ModuleType
+from typing import Final, Iterable, Iterator
+import helpers.chunking
+import helpers.formats
+import helpers.pipeline
+import helpers.postprocess
+import helpers.preprocess
+import helpers.reader
+import helpers.rules
+
+MANIFEST_VERSION: Final[int] = 1
+# Seconds between two tries to take the lock of a manifest another shard saves
+LOCK_RETRY: Final[float] = 0.05
+# Seconds after which a lock is taken to be left behind by a killed run
+LOCK_STALE: Final[float] = 60.0
+# Modules whose code shapes the outputs of each action: parsing, the
+# transform, chunk splitting and stitching, and the writers
+OUTPUT_MODULES: Final[dict[str, tuple[ModuleType, ...]]] = {
+    "prepare": (
+        helpers.preprocess,
+        helpers.reader,
+        helpers.rules,
+        helpers.chunking,
+        helpers.pipeline,
+    ),
+    "finalize": (
+        helpers.postprocess,
+        helpers.formats,
+        helpers.rules,
+        helpers.chunking,
+        helpers.pipeline,
+    ),
+}
+
+
+def file_hash(path: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+def tool_version(action: str) -> str:
+    """
+    Version of the rules applied by `action`.
+
+    Hash of the `OUTPUT_MODULES` of the action and of the rules configured,
+    so any change to either invalidates the outputs recorded by earlier runs.
+    Finalize also hashes the formats configured.
+    """
+    modules = OUTPUT_MODULES[action]
+    parts = [file_hash(module.__file__) for module in modules]
+    parts.append(helpers.rules.current().version)
+    if action == "finalize":
+        parts.append(",".join(helpers.formats.current()))
+    return hashlib.sha256(":".join(parts).encode("utf-8")).hexdigest()[:16]
+
+
+def run_dir(path: str) -> str:
+    if os.path.isdir(path):
+        return path
+    return os.path.dirname(path) or "."
+
+
+class Manifest:
+    """
+    Input hash, tool version and output of every file processed in a folder.
+    """
+
+    def __init__(self, folder: str, action: str):
+        self.folder = folder
+        self.path = os.path.join(folder, f".webvtt_loc.{action}.json")
+        self.tool = tool_version(action)
+        self.entries: dict[str, dict[str, str]] = {}
+        # Input hashes computed during this run, recorded once files finish
+        self.hashes: dict[str, str] = {}
+        # Entries recorded by this run, the others may be saved by other shards
+        self.recorded: set[str] = set()
+        self.changed = False
+        self.hits = 0
+        self.misses = 0
+
+    def _read(self) -> dict[str, dict[str, str]]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            # No manifest yet, or a damaged one: everything gets processed
+            return {}
+        if data.get("version") != MANIFEST_VERSION:
+            return {}
+        return data.get("files", {})
+
+    @classmethod
+    def load(cls, folder: str, action: str) -> "Manifest":
+        manifest = cls(folder, action)
+        manifest.entries = manifest._read()
+        return manifest
+
+    def _key(self, file: str) -> str:
+        return os.path.relpath(file, self.folder)
+
+    def is_current(self, file: str) -> bool:
+        """
+        Whether the recorded output of `file` is still valid.
+        """
+        try:
+            digest = file_hash(file)
+        except OSError:
+            return False
+        self.hashes[file] = digest
+        entry = self.entries.get(self._key(file), {})
+        return (
+            entry.get("hash") == digest
+            and entry.get("tool") == self.tool
+            and "output" in entry
+            and os.path.exists(os.path.join(self.folder, entry["output"]))
+        )
+
+    def pending(self, files: Iterable[str], force: bool = False) -> Iterator[str]:
+        """
+        Yield the files whose outputs are not current, or all of them if `force`.
+        """
+        for file in files:
+            # Hashes every file, so outputs of forced runs are recorded as well
+            if self.is_current(file) and not force:
+                self.hits += 1
+            else:
+                self.misses += 1
+                yield file
+
+    def record(self, file: str, output: str) -> None:
+        digest = self.hashes.get(file)
+        if digest is None:
+            return
+        self.entries[self._key(file)] = {
+            "hash": digest,
+            "tool": self.tool,
+            "output": os.path.relpath(output, self.folder),
+        }
+        self.recorded.add(self._key(file))
+        self.changed = True
+
+    @contextlib.contextmanager
+    def _locked(self) -> Iterator[None]:
+        """
+        Hold the lock file of the manifest, waiting for other shards to release it.
+        """
+        lock_path = f"{self.path}.lock"
+        while True:
+            try:
+                fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                break
+            except FileExistsError:
+                try:
+                    age = time.time() - os.path.getmtime(lock_path)
+                except OSError:
+                    # Released since
+                    continue
+                if age > LOCK_STALE:
+                    # Saving takes well under that, the run holding it was killed
+                    with contextlib.suppress(OSError):
+                        os.remove(lock_path)
+                    continue
+                time.sleep(LOCK_RETRY)
+        try:
+            os.write(fd, f"{socket.gethostname()} {os.getpid()}\n".encode("utf-8"))
+            os.close(fd)
+            yield
+        finally:
+            os.remove(lock_path)
+
+    def save(self) -> None:
+        """
+        Save the entries recorded by this run over the manifest on disk.
+
+        Shards of a run on other nodes save theirs into the same manifest,
+        so it is read again rather than overwritten with the entries loaded,
+        under a lock so shards finishing together do not drop each other's.
+        """
+        if not self.changed:
+            return
+        with self._locked():
+            entries = self._read()
+            for name in self.recorded:
+                entries[name] = self.entries[name]
+            self.entries = entries
+            # Unique, so shards saving at the same time do not share a temporary file
+            tmp_path = f"{self.path}.{socket.gethostname()}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(
+                    {"version": MANIFEST_VERSION, "files": self.entries},
+                    f,
+                    ensure_ascii=False,
+                    indent=1,
+                    sort_keys=True,
+                )
+            os.replace(tmp_path, self.path)
+        self.changed = False
@@ -0,0 +1,570 @@
+import asyncio
+import contextlib
+import os
+import threading
+import time
+from concurrent.futures import Executor, Future
+from dataclasses import dataclass, field
+from typing import Any, Callable, Final, Iterable, Optional, Sequence
+from structlog import BoundLogger
+import helpers.cache
+import helpers.chunking
+import helpers.executor
+import helpers.failures
+import helpers.formats
+import helpers.journal
+import helpers.postprocess
+import helpers.preprocess
+import helpers.profiling
+import helpers.reader
+import helpers.roundtrip
+import helpers.rules
+
+READ_AHEAD: Final[int] = 8
+WRITE_BEHIND: Final[int] = 8
+
+# Tells the tasks of the next stage that no more files are coming
+_DONE: Final = None
+
+
+@dataclass
+class Transformed:
+    """
+    Result of the CPU stage, sent back from the worker process.
+    """
+
+    file: str
+    text: Optional[str]  # None when nothing is written
+    output: Any  # output path, or the mismatches found by roundtrip
+    profile: helpers.profiling.NullProfile
+    cues: int = 0
+    bytes_in: int = 0
+    all_caps: bool = False
+    failure: Optional[dict[str, str]] = None
+    # Outputs of the other formats finalize writes, keyed on their path
+    others: dict[str, str] = field(default_factory=dict)
+    # Wall time of the transform, of all chunks for a file split in chunks
+    seconds: float = 0.0
+    # Cache counters of the worker processes, see `helpers.executor.FileResult`
+    caches: dict[int, dict[str, dict[str, int]]] = field(default_factory=dict)
+
+
+def read_file(file: str) -> bytes:
+    with open(file, "rb") as f:
+        return f.read()
+
+
+def write_file(out_path: str, text: str, profile: helpers.profiling.NullProfile) -> int:
+    """
+    Write `text` like `process_vtt` does and return the number of bytes written.
+    """
+    profile.restart()
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    with helpers.journal.atomic_open(out_path) as f:
+        f.write(text)
+        size = f.tell()
+    profile.lap("write")
+    return size
+
+
+def output_path(action: str, file: str) -> str:
+    if action == "prepare":
+        return helpers.preprocess.output_path(file)
+    return helpers.postprocess.output_path(file, helpers.formats.current()[0])
+
+
+def decode(action: str, data: bytes) -> str:
+    if action == "finalize":
+        # Prepared files are plain UTF-8, read like `postprocess.process_vtt` does
+        return data.decode("utf-8")
+    return helpers.reader.decode(data)
+
+
+def _profiled(
+    action: str,
+    file: str,
+    keep_going: bool,
+    function: Callable[..., Transformed],
+    *args: Any,
+) -> Transformed:
+    started = time.perf_counter()
+    with helpers.profiling.profiled() as profile:
+        try:
+            result = function(profile, *args)
+        except Exception as e:
+            if not keep_going:
+                raise
+            failure = helpers.failures.failure(action, file, profile.last_lap, e)
+            result = Transformed(file, None, None, profile, failure=failure)
+            result.seconds = time.perf_counter() - started
+            return result
+    profile.record_sizes(result.cues, result.bytes_in)
+    result.caches = {os.getpid(): helpers.cache.stats()}
+    result.seconds = time.perf_counter() - started
+    return result
+
+
+def transform(
+    action: str, file: str, data: bytes, keep_going: bool = False
+) -> Transformed:
+    """
+    CPU stage of one file, runs on a worker process.
+
+    Only the file name and its bytes are sent to the worker and the text to
+    write is sent back. With `keep_going` a failure is returned in the result
+    instead of raised, like `helpers.executor.run_file` does.
+    """
+    return _profiled(action, file, keep_going, _transform, action, file, data)
+
+
+def _transform(
+    profile: helpers.profiling.NullProfile, action: str, file: str, data: bytes
+) -> Transformed:
+    text = decode(action, data)
+    if action == "prepare":
+        prepared = helpers.preprocess.prepare_document(text)
+        result = Transformed(
+            file, prepared.text, output_path(action, file), profile, prepared.cues
+        )
+        result.all_caps = prepared.all_caps
+    elif action == "finalize":
+        formats = helpers.formats.current()
+        finalized = helpers.postprocess.finalize_document(text, formats)
+        result = Transformed(
+            file, finalized.text, output_path(action, file), profile, finalized.cues
+        )
+        result.others = {
+            helpers.postprocess.output_path(file, format): finalized.texts[format]
+            for format in formats[1:]
+        }
+    elif action == "roundtrip":
+        mismatches, cues = helpers.roundtrip.check_cues(helpers.reader.text_cues(text))
+        result = Transformed(file, None, mismatches, profile, cues)
+    else:
+        raise ValueError(f"Unknown action {action}")
+    result.bytes_in = len(data)
+    return result
+
+
+def transform_chunk(
+    action: str, file: str, index: int, text: str, keep_going: bool = False
+) -> Transformed:
+    """
+    CPU stage of one chunk of a file, see `helpers.chunking`.
+    """
+    return _profiled(action, file, keep_going, _transform_chunk, action, file, index, text)
+
+
+def _transform_chunk(
+    profile: helpers.profiling.NullProfile,
+    action: str,
+    file: str,
+    index: int,
+    text: str,
+) -> Transformed:
+    chunk = helpers.chunking.transform(action, index, text)
+    return Transformed(file, chunk.text, None, profile, chunk.cues, 0, chunk.all_caps)
+
+
+def splits(action: str, size: int, chunk_size: int) -> bool:
+    """
+    Whether a file of `size` bytes is split, when it has more than one chunk.
+    """
+    if action not in helpers.chunking.ACTIONS or not 0 < chunk_size < size:
+        return False
+    # Chunks are joined as WebVTT, other formats are written from whole files
+    return (
+        action != "finalize"
+        or helpers.formats.current() == helpers.formats.DEFAULT_FORMATS
+    )
+
+
+def split(action: str, data: bytes, chunk_size: int) -> Optional[list[str]]:
+    """
+    The chunks of a file large enough to be split, or None.
+    """
+    if not splits(action, len(data), chunk_size):
+        return None
+    chunks = helpers.chunking.split(action, decode(action, data), chunk_size)
+    return chunks if len(chunks) > 1 else None
+
+
+def stitch(
+    action: str, file: str, bytes_in: int, chunks: list[Transformed]
+) -> Transformed:
+    """
+    Result of a file from the results of its chunks, or the first failure.
+    """
+    for chunk in chunks:
+        if chunk.failure:
+            return chunk
+    joined = helpers.chunking.stitch(
+        action,
+        [helpers.chunking.Chunk(chunk.text, chunk.cues, chunk.all_caps) for chunk in chunks],
+    )
+    profile = chunks[0].profile
+    caches: dict[int, dict[str, dict[str, int]]] = {}
+    for chunk in chunks:
+        if chunk is not chunks[0]:
+            profile.merge(chunk.profile)
+        for pid, snapshot in chunk.caches.items():
+            caches[pid] = helpers.cache.latest(caches.get(pid), snapshot)
+    profile.record_sizes(joined.cues, bytes_in)
+    return Transformed(
+        file,
+        joined.text,
+        output_path(action, file),
+        profile,
+        joined.cues,
+        bytes_in,
+        joined.all_caps,
+        caches=caches,
+        seconds=sum(chunk.seconds for chunk in chunks),
+    )
+
+
+def complete(
+    action: str, log: BoundLogger, result: Transformed
+) -> helpers.executor.FileResult:
+    """
+    Write the output of a transformed file and log it as `process_vtt` does.
+
+    Runs in the parent next to other files, so the memory of the write is
+    not profiled.
+    """
+    profile = result.profile
+    profile.skip_memory()
+    started = time.perf_counter()
+    if result.text is not None:
+        size = write_file(result.output, result.text, profile)
+        for path, text in result.others.items():
+            size += write_file(path, text, profile)
+        profile.record_sizes(result.cues, result.bytes_in, size)
+    if action == "roundtrip" and result.output:
+        log.warning("Roundtrip mismatch", file=result.file, mismatches=len(result.output))
+    log.info("File processed", cues=result.cues, **profile.timings())
+    if result.all_caps:
+        print("All captions are in uppercase.")
+    return helpers.executor.FileResult(
+        result.file,
+        result.output,
+        profile.fields(),
+        caches=result.caches,
+        seconds=result.seconds + time.perf_counter() - started,
+    )
+
+
+def submit_chunked(
+    pool: Executor,
+    io: Executor,
+    action: str,
+    file: str,
+    log: BoundLogger,
+    whole: Callable[[], Future],
+    keep_going: bool = False,
+    chunk_size: int = helpers.chunking.CHUNK_SIZE,
+) -> Optional[Future]:
+    """
+    Submit the chunks of a large file to `pool`, or return None for other files.
+
+    The file is read and split on `io`, and its output stitched and written
+    there once every chunk is done, so neither the caller nor the threads
+    delivering the results of `pool` wait for the storage. A file that
+    turns out to have a single chunk is submitted by `whole`. The returned
+    future completes with the `helpers.executor.FileResult` of the file.
+    """
+    try:
+        if not splits(action, os.path.getsize(file), chunk_size):
+            return None
+    except OSError:
+        # Left to `helpers.executor.run_file`, which reports the error
+        return None
+    done: Future = Future()
+    futures: list[Future] = []
+    lock = threading.Lock()
+
+    def forward(source: Future) -> None:
+        if done.cancelled():
+            return
+        if source.cancelled():
+            done.cancel()
+        elif source.exception() is not None:
+            done.set_exception(source.exception())
+        else:
+            done.set_result(source.result())
+
+    def submit_chunks() -> None:
+        try:
+            data = read_file(file)
+            chunks = split(action, data, chunk_size)
+        except (OSError, ValueError):
+            # Left to `helpers.executor.run_file`, which reports the error
+            chunks = None
+        with lock:
+            if done.cancelled():
+                return
+            if chunks is None:
+                futures.append(whole())
+            else:
+                log.info("Processing file", file=file, chunks=len(chunks))
+                futures.extend(
+                    pool.submit(transform_chunk, action, file, index, chunk, keep_going)
+                    for index, chunk in enumerate(chunks)
+                )
+        if chunks is None:
+            futures[0].add_done_callback(forward)
+            return
+        remaining = [len(futures)]
+        bytes_in = len(data)
+        del data, chunks
+
+        def chunk_done(_: Future) -> None:
+            with lock:
+                remaining[0] -= 1
+                if remaining[0] or done.cancelled():
+                    return
+            # Done callbacks run on the threads delivering results
+            io.submit(write_chunked, bytes_in)
+
+        for future in futures:
+            future.add_done_callback(chunk_done)
+
+    def write_chunked(bytes_in: int) -> None:
+        result = None
+        try:
+            parts = [future.result() for future in futures]
+            result = stitch(action, file, bytes_in, parts)
+            if result.failure:
+                done.set_result(
+                    helpers.executor.FileResult(
+                        file, None, failure=result.failure, seconds=result.seconds
+                    )
+                )
+                return
+            done.set_result(complete(action, log, result))
+        except OSError as e:
+            if not keep_going:
+                done.set_exception(e)
+                return
+            last_lap = result.profile.last_lap if result is not None else None
+            failure = helpers.failures.failure(action, file, last_lap, e)
+            done.set_result(helpers.executor.FileResult(file, None, failure=failure))
+        except Exception as e:
+            done.set_exception(e)
+
+    def submitted(scheduled: Future) -> None:
+        if scheduled.exception() is not None and not done.cancelled():
+            done.set_exception(scheduled.exception())
+
+    def cancel_chunks(_: Future) -> None:
+        if done.cancelled():
+            with lock:
+                for future in futures:
+                    future.cancel()
+
+    done.add_done_callback(cancel_chunks)
+    io.submit(submit_chunks).add_done_callback(submitted)
+    return done
+
+
+def _first_error(error: BaseException) -> BaseException:
+    # Task groups nest the error of the failing task in exception groups
+    while isinstance(error, BaseExceptionGroup):
+        error = error.exceptions[0]
+    return error
+
+
+class Pipeline:
+    """
+    Read files, transform them on worker processes and write the outputs.
+
+    The three stages run concurrently and are connected by bounded queues:
+    up to `read_ahead` files are read ahead of the workers and up to
+    `write_behind` outputs wait for their writes, so slow storage does not
+    keep the workers idle. File I/O runs on threads, asyncio has no
+    asynchronous file access of its own.
+    """
+
+    def __init__(
+        self,
+        action: str,
+        log: BoundLogger,
+        done: Callable[[helpers.executor.FileResult], None],
+        keep_going: bool = False,
+        read_ahead: int = READ_AHEAD,
+        write_behind: int = WRITE_BEHIND,
+        chunk_size: int = helpers.chunking.CHUNK_SIZE,
+    ):
+        if read_ahead < 1 or write_behind < 1:
+            # No task would read or write, the files would be silently skipped
+            raise ValueError("read_ahead and write_behind must be at least 1")
+        self.action = action
+        self.log = log
+        self.done = done
+        self.keep_going = keep_going
+        self.read_ahead = read_ahead
+        self.write_behind = write_behind
+        self.chunk_size = chunk_size
+
+    def fail(self, file: str, last_lap: Optional[str], error: Exception) -> None:
+        """
+        Report a failed read, worker or write, or stop the run unless `keep_going`.
+        """
+        if not self.keep_going:
+            self.log.error("Worker failed", file=file, error=str(error))
+            raise Exception("Processing error") from error
+        failure = helpers.failures.failure(self.action, file, last_lap, error)
+        self.done(helpers.executor.FileResult(file, None, failure=failure))
+
+    async def run(self, files: Iterable[str], pool: Executor, workers: int) -> None:
+        reads: asyncio.Queue = asyncio.Queue(self.read_ahead)
+        writes: asyncio.Queue = asyncio.Queue(self.write_behind)
+        pending = iter(files)
+        # Walking folders and checking the manifest is I/O as well
+        next_file = asyncio.Lock()
+
+        async def read() -> None:
+            while True:
+                async with next_file:
+                    file = await asyncio.to_thread(next, pending, None)
+                if file is None:
+                    return
+                self.log.info("Processing file", file=file)
+                try:
+                    data = await asyncio.to_thread(read_file, file)
+                except OSError as e:
+                    self.fail(file, None, e)
+                    continue
+                await reads.put((file, data))
+
+        async def transform_files() -> None:
+            loop = asyncio.get_running_loop()
+            while (item := await reads.get()) is not _DONE:
+                file, data = item
+                try:
+                    chunks = split(self.action, data, self.chunk_size)
+                except ValueError as e:
+                    # Not decodable, reported like a failure of the worker
+                    self.fail(file, None, e)
+                    continue
+                try:
+                    if chunks is None:
+                        result = await loop.run_in_executor(
+                            pool, transform, self.action, file, data, self.keep_going
+                        )
+                    else:
+                        # The chunks of a large file are spread over the workers
+                        parts = await asyncio.gather(
+                            *(
+                                loop.run_in_executor(
+                                    pool,
+                                    transform_chunk,
+                                    self.action,
+                                    file,
+                                    index,
+                                    chunk,
+                                    self.keep_going,
+                                )
+                                for index, chunk in enumerate(chunks)
+                            )
+                        )
+                        result = stitch(self.action, file, len(data), parts)
+                except Exception as e:
+                    # The worker died, or its result could not be sent back
+                    self.fail(file, None, e)
+                    continue
+                if result.failure:
+                    self.done(
+                        helpers.executor.FileResult(
+                            file, None, failure=result.failure, seconds=result.seconds
+                        )
+                    )
+                else:
+                    await writes.put(result)
+
+        async def write() -> None:
+            while (result := await writes.get()) is not _DONE:
+                await self.write(result)
+
+        async def stage(
+            task: Callable, count: int, out: Optional[asyncio.Queue], consumers: int
+        ) -> None:
+            async with asyncio.TaskGroup() as group:
+                for _ in range(count):
+                    group.create_task(task())
+            # Every task of the next stage stops at its own marker
+            if out is not None:
+                for _ in range(consumers):
+                    await out.put(_DONE)
+
+        try:
+            async with asyncio.TaskGroup() as group:
+                group.create_task(stage(read, self.read_ahead, reads, workers))
+                group.create_task(
+                    stage(transform_files, workers, writes, self.write_behind)
+                )
+                group.create_task(stage(write, self.write_behind, None, 0))
+        except BaseExceptionGroup as e:
+            raise _first_error(e)
+
+    async def write(self, result: Transformed) -> None:
+        try:
+            file_result = await asyncio.to_thread(complete, self.action, self.log, result)
+        except OSError as e:
+            self.fail(result.file, result.profile.last_lap, e)
+            return
+        self.done(file_result)
+
+
+def run(
+    files: Iterable[str],
+    action: str,
+    log: BoundLogger,
+    done: Callable[[helpers.executor.FileResult], None],
+    workers: int = 1,
+    profile: bool = False,
+    reader: str = "fast",
+    keep_going: bool = False,
+    read_ahead: int = READ_AHEAD,
+    write_behind: int = WRITE_BEHIND,
+    cache_size: int = helpers.cache.DEFAULT_SIZE,
+    cache_dir: Optional[str] = None,
+    chunk_size: int = helpers.chunking.CHUNK_SIZE,
+    memprofile: bool = False,
+    rules: Optional[helpers.rules.Rules] = None,
+    formats: Sequence[str] = helpers.formats.DEFAULT_FORMATS,
+    pool: Optional[Executor] = None,
+) -> None:
+    """
+    Run `action` over `files` in the pipeline, calling `done` with every result.
+
+    The workers run in `pool` when given, which is left running, otherwise
+    in a process pool created for the run.
+    """
+    pipeline = Pipeline(
+        action,
+        log,
+        done,
+        keep_going=keep_going,
+        read_ahead=read_ahead,
+        write_behind=write_behind,
+        chunk_size=chunk_size,
+    )
+    with (
+        contextlib.nullcontext(pool)
+        if pool is not None
+        else helpers.executor.create_executor(
+            "process",
+            workers,
+            action,
+            profile=profile,
+            reader=reader,
+            cache_size=cache_size,
+            cache_dir=cache_dir,
+            memprofile=memprofile,
+            rules=rules,
+            formats=formats,
+            log=log if keep_going else None,
+        )
+    ) as pool:
+        asyncio.run(pipeline.run(files, pool, workers))
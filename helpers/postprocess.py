@@ -1,13 +1,84 @@
 import webvtt
+import contextlib
+import io
 import os
 import re
-from typing import List, Final
+from typing import (
+    Any,
+    Final,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    TextIO,
+)
 from structlog import BoundLogger
 import textwrap
+from itertools import islice
+import helpers.cache
+import helpers.formats
+import helpers.journal
+import helpers.profiling
+import helpers.rules
 
-LINE_LENGTH: Final[int] = 36
+# Default of the "line_length" rule
+LINE_LENGTH: Final[int] = helpers.rules.DEFAULTS["line_length"]
 TIMESTAMP_PATTERN: Final[str] = r"(⎡⎡\d{2}:\d{2}:\d{2}\.\d{3} --> \d{2}:\d{2}:\d{2}\.\d{3}⎦⎦)"
 
+_TAGS: Final = re.compile("<.*?>")
+
+
+def parse_timestamp(value: str) -> int:
+    """
+    Milliseconds of a `HH:MM:SS.mmm` timestamp as matched by TIMESTAMP_PATTERN.
+    """
+    minutes, seconds = int(value[3:5]), int(value[6:8])
+    # Rejected by webvtt-py as well
+    if minutes > 59 or seconds > 59:
+        raise webvtt.errors.MalformedCaptionError(f"Invalid timestamp {value!r}")
+    return ((int(value[0:2]) * 60 + minutes) * 60 + seconds) * 1000 + int(value[9:12])
+
+
+def format_timestamp(ms: int) -> str:
+    seconds, ms = divmod(ms, 1000)
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}.{ms:03d}"
+
+
+class CaptionRecord:
+    """
+    A finalized caption with millisecond timings.
+
+    Takes a fraction of the memory of a `webvtt.Caption`, the timestamps
+    are only formatted when the caption is written.
+    """
+
+    __slots__ = ("start_ms", "end_ms", "lines")
+
+    def __init__(self, start_ms: int, end_ms: int, lines: Sequence[str]):
+        self.start_ms = start_ms
+        self.end_ms = end_ms
+        self.lines = lines
+
+    @property
+    def start(self) -> str:
+        return format_timestamp(self.start_ms)
+
+    @property
+    def end(self) -> str:
+        return format_timestamp(self.end_ms)
+
+    @property
+    def raw_text(self) -> str:
+        return "\n".join(self.lines)
+
+    @property
+    def text(self) -> str:
+        return _TAGS.sub("", self.raw_text)
+
 
 def wrap_text_lines(text: str, width: int) -> list[str]:
     """
@@ -30,129 +101,334 @@ def wrap_text_lines(text: str, width: int) -> list[str]:
     return lines_out
 
 
-def parse_vtt_line(line: str) -> webvtt.Caption:
-    # Regex to extract timestamp
-    timestamp_re = re.compile(
-        r"⎡⎡(\d{2}:\d{2}:\d{2}\.\d{3}) --> (\d{2}:\d{2}:\d{2}\.\d{3})⎦⎦"
-    )
-    # Regex to match speaker tags
-    speaker_re = re.compile(r"⎡⎡Speaker (?:([^:⎦]+):?)?⎦⎦")
+# Token kinds of the prepared format, a token is (kind, text, value)
+TIMESTAMP: Final[int] = 0  # value: start and end as written
+SPEAKER: Final[int] = 1  # value: speaker name or None
+TEXT: Final[int] = 2
+NEWLINE: Final[int] = 3
+
+Token = tuple[int, str, Any]
+
+# Either marker, so one pass over a line finds both
+_MARKERS: Final = re.compile(
+    r"⎡⎡(?:(\d{2}:\d{2}:\d{2}\.\d{3}) --> (\d{2}:\d{2}:\d{2}\.\d{3})⎦⎦"
+    r"|Speaker (?:([^:⎦]+):?)?⎦⎦)"
+)
+_SPACE: Final[Token] = (TEXT, " ", None)
+
+
+def tokenize_line(line: str) -> List[Token]:
+    """
+    Split one prepared line into timestamp, speaker and text tokens.
+    """
+    if "⎡⎡" not in line:
+        return [(TEXT, line, None)]
+    tokens: List[Token] = []
+    text_start = 0
+    for match in _MARKERS.finditer(line):
+        start, end, name = match.groups()
+        if match.start() > text_start:
+            tokens.append((TEXT, line[text_start : match.start()], None))
+        if start:
+            tokens.append((TIMESTAMP, match.group(), (start, end)))
+        else:
+            tokens.append((SPEAKER, match.group(), name))
+        text_start = match.end()
+    if text_start < len(line):
+        tokens.append((TEXT, line[text_start:], None))
+    return tokens
+
+
+def tokenize_lines(lines: Iterable[str]) -> Iterator[List[Token]]:
+    """
+    Tokens of every non-blank line of prepared text.
+
+    Each line is scanned once, markers are only recognized within a line.
+    """
+    for raw_line in lines:
+        line = raw_line.rstrip("\n")
+        if line.strip():
+            yield tokenize_line(line)
+
+
+def tokenize(lines: Iterable[str]) -> Iterator[Token]:
+    """
+    Tokens of prepared text, every non-blank line ends with a NEWLINE token.
+    """
+    for tokens in tokenize_lines(lines):
+        yield from tokens
+        yield (NEWLINE, "\n", None)
+
+
+def _strip(tokens: List[Token]) -> List[Token]:
+    # Same as str.strip on the text of the tokens, markers never end in spaces
+    tokens = list(tokens)
+    if tokens and tokens[0][0] == TEXT:
+        text = tokens[0][1].lstrip()
+        tokens[0:1] = [(TEXT, text, None)] if text else []
+    if tokens and tokens[-1][0] == TEXT:
+        text = tokens[-1][1].rstrip()
+        tokens[-1:] = [(TEXT, text, None)] if text else []
+    return tokens
+
+
+def _line_segments(tokens: List[Token]) -> Iterator[tuple[bool, List[Token]]]:
+    """
+    Split the tokens of a line into (starts a caption, tokens) segments.
+
+    A line starting with its only timestamp is a caption as it is, a line
+    without timestamps continues the previous caption. Any other line is
+    cut before each timestamp and the stripped pieces are used.
+    """
+    starts = [index for index, token in enumerate(tokens) if token[0] == TIMESTAMP]
+    if not starts:
+        yield False, tokens
+    elif starts == [0]:
+        yield True, tokens
+    else:
+        bounds = [0, *starts, len(tokens)]
+        for index in range(len(bounds) - 1):
+            segment = _strip(tokens[bounds[index] : bounds[index + 1]])
+            if segment:
+                yield index > 0, segment
+
+
+def _merge_line(tokens: List[Token], captions: List[List[Token]]) -> None:
+    for starts_caption, segment in _line_segments(tokens):
+        if starts_caption or not captions:
+            captions.append(segment)
+        else:
+            captions[-1].append(_SPACE)
+            captions[-1].extend(segment)
+
+
+def iter_merged_tokens(lines: Iterable[List[Token]]) -> Iterator[List[Token]]:
+    """
+    Lazily merge continuation lines, yielding the tokens of one caption at a time.
+
+    Takes the tokens of each line, as produced by `tokenize_lines`.
+    """
+    # Only the caption still open for continuation lines is kept in memory
+    pending: List[List[Token]] = []
+    for tokens in lines:
+        _merge_line(tokens, pending)
+        if len(pending) > 1:
+            yield from pending[:-1]
+            del pending[:-1]
+    yield from pending
+
+
+def _text(tokens: Iterable[Token]) -> str:
+    return "".join(token[1] for token in tokens)
 
-    # Extract timestamp
-    ts_match = timestamp_re.match(line)
-    if not ts_match:
-        raise ValueError("No timestamp found in line")
 
-    start, end = ts_match.group(1), ts_match.group(2)
-    text = line[ts_match.end() :].strip()
+def split_tokens(tokens: List[Token]) -> tuple[int, int, List[str]]:
+    """
+    Split the tokens of a caption into start and end in milliseconds and
+    one caption line per speaker.
+    """
+    if not tokens or tokens[0][0] != TIMESTAMP:
+        raise ValueError("No timestamp found in line")
+    start, end = tokens[0][2]
 
-    # Find all speaker tags to determine if there is only one unique speaker
-    speakers = []
-    for m in speaker_re.finditer(text):
-        name = m.group(1)
-        if name:
-            speakers.append(name.strip())
+    # Text before the first speaker tag, then the name and text of each tag
+    text: List[str] = []
+    names: List[Optional[str]] = []
+    contents: List[List[str]] = [text]
+    for kind, token_text, value in islice(tokens, 1, None):
+        if kind == SPEAKER:
+            names.append(value)
+            text = []
+            contents.append(text)
         else:
-            speakers.append("")  # anonymous speaker
+            text.append(token_text)
 
-    # Split text into caption lines, one per speaker tag
+    if not names:
+        lines = ["".join(text).strip()]
+        return parse_timestamp(start), parse_timestamp(end), lines
     lines = []
-    matches = list(speaker_re.finditer(text))
-    # Handle text before the first speaker tag
-    if matches:
-        first_start = matches[0].start()
-        pre_text = text[:first_start].strip()
-        if pre_text:
-            lines.append(pre_text)
-    # Handle each speaker tag and its content
-    for idx, m in enumerate(matches):
-        start_idx = m.end()
-        next_m = matches[idx + 1] if idx + 1 < len(matches) else None
-        end_idx = next_m.start() if next_m else len(text)
-        content = text[start_idx:end_idx].strip()
-        name = m.group(1)
-        if len(speakers) == 1:
+    pre_text = "".join(contents[0]).strip()
+    if pre_text:
+        lines.append(pre_text)
+    for name, content_parts in zip(names, islice(contents, 1, None)):
+        content = "".join(content_parts).strip()
+        if len(names) == 1:
             line_text = f"{name + ': ' if name else '- '}{content}".strip()
+        elif name:
+            line_text = f"- {name}: {content}".strip()
         else:
-            if name:
-                line_text = f"- {name}: {content}".strip()
-            else:
-                line_text = f"- {content}".strip()
+            line_text = f"- {content}".strip()
         lines.append(line_text)
+    return parse_timestamp(start), parse_timestamp(end), lines
+
+
+def split_vtt_line(line: str) -> tuple[int, int, List[str]]:
+    """
+    Split a prepared line into start and end in milliseconds and one
+    caption line per speaker.
+    """
+    return split_tokens(tokenize_line(line))
+
 
+# Wrapped lines at the line length of the rules, which are part of the rules version
+_WRAPPED: Final = helpers.cache.LRUCache("finalize.wrap", (__file__,))
 
-    # If there are no speaker tags, just use the text as is
-    if not lines:
-        lines = [text]
 
-    # Wrap each line if it exceeds LINE_LENGTH
+def wrap_caption_lines(lines: List[str]) -> List[str]:
+    # Wrap each line if it exceeds the line length
+    line_length = helpers.rules.current().line_length
     wrapped_lines = []
     for line in lines:
-        if len(line) > LINE_LENGTH:
-            wrapped_lines.extend(wrap_text_lines(line, LINE_LENGTH))
+        if len(line) > line_length:
+            wrapped = _WRAPPED.get(line)
+            if wrapped is None:
+                wrapped = tuple(wrap_text_lines(line, line_length))
+                _WRAPPED.put(line, wrapped)
+            wrapped_lines.extend(wrapped)
         else:
             wrapped_lines.append(line)
+    return wrapped_lines
+
 
-    caption_text = "\n".join(wrapped_lines)
+def caption_record(start: int, end: int, lines: List[str]) -> CaptionRecord:
+    # Split like webvtt.Caption splits its text, so the output stays the same
+    return CaptionRecord(start, end, tuple("\n".join(lines).splitlines()))
+
+
+def parse_vtt_line(line: str) -> CaptionRecord:
+    start, end, lines = split_vtt_line(line)
+    return caption_record(start, end, wrap_caption_lines(lines))
 
-    return webvtt.Caption(start, end, caption_text)
 
 def process_line(line: str, result: list) -> None:
-    matches = list(re.finditer(TIMESTAMP_PATTERN, line))
-    if not matches:
-        # No timestamp: append to previous
-        if result:
-            result[-1] += " " + line
+    """
+    Add a prepared line to the merged lines in `result`.
+    """
+    for starts_caption, segment in _line_segments(tokenize_line(line)):
+        if starts_caption or not result:
+            result.append(_text(segment))
         else:
-            result.append(line)
-    elif len(matches) == 1 and matches[0].start() == 0:
-        # Single timestamp at start: start new item
-        result.append(line)
-    else:
-        # Multiple timestamps: split at each timestamp, including any content before the first timestamp
-        splits = [0] + [m.start() for m in matches] + [len(line)]
-        for i in range(len(splits) - 1):
-            segment = line[splits[i]:splits[i + 1]].strip()
-            if not segment:
-                continue
-            # If this is the first segment and it does not start with a timestamp, join it to previous
-            if i == 0 and not re.match(TIMESTAMP_PATTERN, segment):
-                if result:
-                    result[-1] += " " + segment
-                else:
-                    result.append(segment)
-            else:
-                result.append(segment)
+            result[-1] += " " + _text(segment)
+
+
+def iter_merged_lines(lines: Iterable[str]) -> Iterator[str]:
+    """
+    Lazily merge continuation lines, yielding one line per caption.
+    """
+    for tokens in iter_merged_tokens(tokenize_lines(lines)):
+        yield _text(tokens)
 
 
 def read_file(file: str) -> List[str]:
-    result = []
     with open(file, "r", encoding="utf-8") as f:
-        for raw_line in f:
-            line = raw_line.rstrip("\n")
-            if not line.strip():
-                continue 
-            process_line(line, result)
-    return result
+        return list(iter_merged_lines(f))
 
 
+def parse_lines(lines: Iterable[str]) -> Iterator[CaptionRecord]:
+    """
+    Captions of prepared text, the text is scanned once.
+
+    Laps the parse, transform and wrap stages of the current profile.
+    """
+    profile = helpers.profiling.current()
+    for tokens in iter_merged_tokens(tokenize_lines(lines)):
+        profile.lap("parse")
+        start, end, caption_lines = split_tokens(tokens)
+        profile.lap("transform")
+        caption = caption_record(start, end, wrap_caption_lines(caption_lines))
+        profile.lap("wrap")
+        yield caption
+
+
+def iter_captions(file: str) -> Iterator[CaptionRecord]:
+    with open(file, "r", encoding="utf-8") as f:
+        yield from parse_lines(f)
+
+
+def output_path(file: str, format: str = "vtt") -> str:
+    # 'final' subfolder, with the .vtt extension webvtt-py used to append
+    orig_dir = os.path.dirname(file)
+    orig_filename = os.path.basename(file)
+    out_path = os.path.join(orig_dir, "final", orig_filename)
+    if out_path[-4:].lower() != ".vtt":
+        out_path = f"{out_path}.vtt"
+    if format != "vtt":
+        # Where webvtt-py would save the WebVTT output converted to `format`
+        extension = helpers.formats.WRITERS[format].extension
+        out_path = f"{os.path.splitext(out_path)[0]}{extension}"
+    return out_path
+
+
+class Finalized(NamedTuple):
+    # Document of the first format
+    text: str
+    cues: int
+    # Document of every format
+    texts: dict[str, str]
+
+
+def write_formats(
+    files: Sequence[TextIO], formats: Sequence[str], captions: Iterable[CaptionRecord]
+) -> int:
+    """
+    Write each caption to every format as soon as it is parsed.
+
+    Laps the write stage of the current profile.
+    """
+    profile = helpers.profiling.current()
+    writers = [helpers.formats.WRITERS[format](f) for f, format in zip(files, formats)]
+    cue_count = 0
+    for writer in writers:
+        writer.begin()
+    writes = [writer.write for writer in writers]
+    for caption in captions:
+        for write in writes:
+            write(caption)
+        profile.lap("write")
+        cue_count += 1
+    for writer in writers:
+        writer.end()
+    return cue_count
+
+
+def finalize_document(text: str, formats: Sequence[str] = ("vtt",)) -> Finalized:
+    """
+    Finalize prepared text held in memory, to each of `formats`.
+    """
+    outs = [io.StringIO() for _ in formats]
+    # Universal newlines, like reading the file
+    cues = write_formats(outs, formats, parse_lines(io.StringIO(text, newline=None)))
+    texts = {format: out.getvalue() for format, out in zip(formats, outs)}
+    return Finalized(texts[formats[0]], cues, texts)
+
+
+def process_vtt(
+    file: str, log: BoundLogger, formats: Optional[Sequence[str]] = None
+) -> str:
+    """
+    Finalize a file to each of `formats`, by default the configured ones,
+    from a single parse. Returns the output of the first format.
+    """
+    profile = helpers.profiling.current()
+    formats = formats or helpers.formats.current()
+    cue_count: int = 0
 
-def process_vtt(file: str, log: BoundLogger):
     log.info("Processing file", file=file)
-    vtt = webvtt.WebVTT()
+    profile.restart()
     try:
-        lines = read_file(file)
-        for line in lines:
-            caption = parse_vtt_line(line)
-            vtt.captions.append(caption)
-        # Create 'final' subfolder path
-        orig_dir = os.path.dirname(file)
-        orig_filename = os.path.basename(file)
-        final_dir = os.path.join(orig_dir, "final")
-        os.makedirs(final_dir, exist_ok=True)
-        out_path = os.path.join(final_dir, orig_filename)
-        vtt.save(out_path)
+        out_paths = [output_path(file, format) for format in formats]
+        os.makedirs(os.path.dirname(out_paths[0]), exist_ok=True)
+        with contextlib.ExitStack() as stack:
+            src = stack.enter_context(open(file, "r", encoding="utf-8"))
+            outs = [
+                stack.enter_context(helpers.journal.atomic_open(path))
+                for path in out_paths
+            ]
+            cue_count = write_formats(outs, formats, parse_lines(src))
+        profile.lap("write")
+        profile.finish(cue_count, file, *out_paths)
     except Exception as e:
         log.exception("Processing error", file=file, error=str(e))
         raise Exception("Processing error") from e
-    log.info("File processed")
+    log.info("File processed", cues=cue_count, **profile.timings())
+    return out_paths[0]
@@ -1,74 +1,221 @@
-import webvtt
 import re
 from structlog import BoundLogger
 import os
-from typing import Final
+import helpers.cache
+import helpers.journal
+import helpers.profiling
+import helpers.reader
+import helpers.rules
+from typing import Final, Iterable, Iterator, NamedTuple, Optional, Sequence
 
 
-SPEAKER_MATCH_RE: Final[str] = r"^ *-(?!-)"
-SPEAKER_CAPTURE_RE: Final[str] = r"^ *-(\s*[A-Z]+:)?"
-SOUND_RE: Final[str] = r"^ *(?:\[|\()[^\]]*(?:\]|\)) *$"
+# Speaker and sound patterns are in `helpers.rules`
+SPEAKER_TAG: Final[str] = r"⎡⎡Speaker \1⎦⎦ "
 
+_SPACES: Final = re.compile(" +")
+_DOUBLE_NEWLINE: Final = re.compile(r"\n\n$")
 
-def process_vtt(file: str, log: BoundLogger):
+
+class CueScan(NamedTuple):
+    """
+    Everything `process_vtt` needs to know about a single cue.
+    """
+
+    body: str  # timestamp marker and cue text, spaces collapsed
+    has_lowercase: bool
+    speaker_lines: tuple[int, ...]  # indexes of lines starting with a speaker dash
+    is_sound: bool
+    ends_with_punctuation: bool
+    ends_with_bracket: bool
+
+
+def _ends_with_punctuation(text: str, rules: helpers.rules.Rules) -> bool:
+    # Same as re.search(r"[!?\.♪][\"']? *$", text) without scanning the text
+    if text.endswith("\n"):
+        text = text[:-1]
+    text = text.rstrip(" ")
+    if text.endswith(rules.quotes):
+        text = text[:-1]
+    return text.endswith(rules.punctuation)
+
+
+class TextScan(NamedTuple):
+    """
+    The part of `CueScan` that only depends on the cue text.
+    """
+
+    body: str  # cue text following the timestamp marker, spaces collapsed
+    has_lowercase: bool
+    speaker_lines: tuple[int, ...]
+    is_sound: bool
+    ends_with_punctuation: bool
+    ends_with_bracket: bool
+
+
+def _decode_scan(value: list) -> TextScan:
+    body, has_lowercase, speaker_lines, *flags = value
+    return TextScan(body, has_lowercase, tuple(speaker_lines), *flags)
+
+
+# Cue texts repeat across a series: intros, sounds, catchphrases. The
+# reader splits the cue texts that are scanned
+_SCANS: Final = helpers.cache.LRUCache(
+    "prepare.cues", (__file__, helpers.reader.__file__), _decode_scan
+)
+
+
+def scan_text(text: str, raw_text: str, lines: Sequence[str]) -> TextScan:
+    rules = helpers.rules.current()
+    parts: list[str] = [" "]
+    stripped = [line.strip() for line in lines]
+    speakers = {
+        counter: match
+        for counter, line in enumerate(stripped)
+        if (match := rules.speaker.match(line))
+    }
+    # A line indented with anything but spaces only counts once stripped
+    if any(rules.speaker.match(lines[counter]) for counter in speakers):
+        for counter, line in enumerate(stripped):
+            if counter in speakers:
+                if counter > 0:
+                    parts.append("\n")
+                # SPEAKER_TAG with the name the match captured, if any
+                match = speakers[counter]
+                parts.append(f"⎡⎡Speaker {match.group(1) or ''}⎦⎦ {line[match.end() :]}")
+            else:
+                parts.append(" ")
+                parts.append(line)
+    else:
+        cue_text = " ".join(raw_text.splitlines()) + " "
+        parts.append(rules.named_speaker.sub(SPEAKER_TAG, cue_text, count=1))
+    # Collapsed together with the space ending the timestamp marker
+    body = "".join(parts)
+    return TextScan(
+        body=(_SPACES.sub(" ", body) if "  " in body else body)[1:],
+        has_lowercase=rules.lowercase.search(text) is not None,
+        speaker_lines=tuple(speakers),
+        is_sound=rules.sound.match(text) is not None,
+        ends_with_punctuation=_ends_with_punctuation(text, rules),
+        ends_with_bracket=body.endswith("] "),
+    )
+
+
+def _cue_scan(start: str, end: str, scan: TextScan) -> CueScan:
+    return CueScan(f"⎡⎡{start} --> {end}⎦⎦ {scan.body}", *scan[1:])
+
+
+def scan_cue(
+    start: str, end: str, text: str, raw_text: str, lines: Sequence[str]
+) -> CueScan:
+    return _cue_scan(start, end, scan_text(text, raw_text, lines))
+
+
+def scan_caption(caption) -> CueScan:
+    """
+    `scan_cue` of a caption, its text scanned once per cache lifetime.
+    """
+    raw_text = caption.raw_text
+    if _SCANS.size <= 0:
+        return scan_cue(caption.start, caption.end, caption.text, raw_text, caption.lines)
+    scan = _SCANS.get(raw_text)
+    if scan is None:
+        scan = scan_text(caption.text, raw_text, caption.lines)
+        _SCANS.put(raw_text, scan)
+    return _cue_scan(caption.start, caption.end, scan)
+
+
+def build_fragment(cue: CueScan, newline_in_previous: bool) -> tuple[str, bool]:
+    """
+    Return the prepared text of a cue and whether it ends with a line break.
+    """
+    # sounds in brackets
+    if cue.is_sound:
+        if newline_in_previous:
+            fragment = cue.body + "\n"
+        else:
+            fragment = "\n" + cue.body + "\n"
+    # break after punctuation
+    elif cue.ends_with_bracket or cue.ends_with_punctuation:
+        fragment = cue.body + "\n"
+    else:
+        return cue.body, False
+    if fragment.endswith("\n\n"):
+        fragment = _DOUBLE_NEWLINE.sub("\n", fragment)
+    return fragment, True
+
+
+def output_path(file: str) -> str:
+    # 'prepared' subfolder next to the original
+    return os.path.join(os.path.dirname(file), "prepared", os.path.basename(file))
+
+
+def iter_fragments(
+    captions: Iterable, newline_in_previous: bool = True
+) -> Iterator[tuple[str, bool]]:
+    """
+    Prepared text of every caption and whether the caption has lowercase letters.
+
+    `newline_in_previous` tells whether the text before the first caption
+    ends with a line break. Laps the parse and transform stages of the
+    current profile.
+    """
+    profile = helpers.profiling.current()
+    for caption in captions:
+        # The built-in readers parse cue by cue, webvtt-py all at once
+        profile.lap("parse")
+        cue = scan_caption(caption)
+        fragment, newline_in_previous = build_fragment(cue, newline_in_previous)
+        profile.lap("transform")
+        yield fragment, cue.has_lowercase
+
+
+class Prepared(NamedTuple):
+    text: str
+    cues: int
+    all_caps: bool
+
+
+def prepare_document(
+    text: str, reader: Optional[str] = None, newline_in_previous: bool = True
+) -> Prepared:
+    """
+    Prepare a WebVTT document held in memory, see `iter_fragments`.
+    """
+    fragments: list[str] = []
+    all_caps: bool = True
+    captions = helpers.reader.text_cues(text, reader)
+    for fragment, has_lowercase in iter_fragments(captions, newline_in_previous):
+        fragments.append(fragment)
+        if has_lowercase:
+            all_caps = False
+    return Prepared("".join(fragments), len(fragments), all_caps)
+
+
+def process_vtt(file: str, log: BoundLogger, reader: Optional[str] = None) -> str:
     all_caps: bool = True
     cue_count: int = 0
+    profile = helpers.profiling.current()
 
     log.info("Processing file", file=file)
+    profile.restart()
     try:
-        # Prepare output path in 'prepared' subfolder
-        orig_dir = os.path.dirname(file)
-        orig_filename = os.path.basename(file)
-        prepared_dir = os.path.join(orig_dir, "prepared")
-        os.makedirs(prepared_dir, exist_ok=True)
-        out_path = os.path.join(prepared_dir, orig_filename)
-
-        with open(out_path, "w", encoding="utf-8") as f:
-            newline_in_previous: bool = True
-            for caption in webvtt.read(file):
-                if re.search(r"[a-z]", caption.text):
+        out_path = output_path(file)
+        os.makedirs(os.path.dirname(out_path), exist_ok=True)
+
+        with helpers.journal.atomic_open(out_path) as f:
+            captions = helpers.reader.read_cues(file, reader)
+            for fragment, has_lowercase in iter_fragments(captions):
+                if has_lowercase:
                     all_caps = False
-                fragment: str = ""
-                fragment += f"⎡⎡{caption.start} --> {caption.end}⎦⎦ "
-                # multiple speakers
-                if any(re.match(SPEAKER_MATCH_RE, line) for line in caption.lines):
-                    line:str=""
-                    for counter, line in enumerate(caption.lines):
-                        line=line.strip()
-                        if re.match(SPEAKER_MATCH_RE, line):
-                            if counter >0:
-                                fragment += "\n"
-                            fragment +=  re.sub(SPEAKER_CAPTURE_RE,
-                                               r"⎡⎡Speaker \1⎦⎦ ", line)
-                        else:
-                            fragment += " "+ line
-                else:
-                    cue_text = " ".join(caption.raw_text.splitlines()) + " "
-                    fragment += re.sub(r"^([A-Z]+:)", r"⎡⎡Speaker \1⎦⎦ ", cue_text)
-                # sounds in brackets
-                if re.match(SOUND_RE, caption.text) or re.match(
-                    r"- *\[[^\]]+\]", caption.text
-                ):
-                    if newline_in_previous:
-                        fragment += "\n"
-                    else:
-                        fragment = "\n" + fragment + "\n"
-                    newline_in_previous = True
-                elif fragment.endswith("] "):
-                    fragment += "\n"
-                    newline_in_previous = True
-                # break after punctuation
-                elif re.search(r"[!?\.♪][\"']? *$", caption.text):
-                    fragment += "\n"
-                    newline_in_previous = True
-                else:
-                    newline_in_previous = False
-                fragment = re.sub(r"\n\n$", "\n", fragment)
-                f.write(re.sub(" +", " ", fragment))
+                f.write(fragment)
+                profile.lap("write")
                 cue_count += 1
+        profile.lap("write")
+        profile.finish(cue_count, file, out_path)
     except Exception as e:
         log.exception("Processing error", file=file, error=str(e))
         raise Exception("Processing error") from e
-    log.info("File processed", cues=cue_count)
+    log.info("File processed", cues=cue_count, **profile.timings())
     if all_caps:
         print("All captions are in uppercase.")
+    return out_path
@@ -0,0 +1,322 @@
+import os
+import time
+import tracemalloc
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Final, Iterator, Optional
+
+STAGES: Final[tuple[str, ...]] = ("parse", "transform", "wrap", "write")
+# Allocation sites kept for a file, and files in the memory report of a run
+TOP: Final[int] = 10
+# Sites are only looked up when the peak of the process grows this much,
+# a snapshot of every traced allocation is expensive
+_SITES_FLOOR: Final[int] = 1024 * 1024
+_SITES_GROWTH: Final[float] = 1.25
+
+_enabled: bool = False
+_memory: bool = False
+# Highest peak a file reached in this process, in bytes
+_process_peak: int = 0
+# Allocations made before any file, left out of the sites
+_baseline: Optional[tracemalloc.Snapshot] = None
+
+
+def configure(enabled: bool, memory: bool = False) -> None:
+    """
+    Turn timing on or off, and memory tracking, which traces every allocation.
+    """
+    global _enabled, _memory, _process_peak, _baseline
+    _enabled = enabled
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    elif _memory and not memory:
+        tracemalloc.stop()
+    _memory = memory
+    _process_peak = 0
+    _baseline = _snapshot() if memory else None
+
+
+class NullProfile:
+    """
+    Profile used when profiling is off, it only remembers the last lap.
+    """
+
+    def __init__(self):
+        # Tells which stage a failing file got to
+        self.last_lap: Optional[str] = None
+
+    def restart(self) -> None:
+        pass
+
+    def lap(self, stage: str) -> None:
+        self.last_lap = stage
+
+    def finish(self, cues: int, file: str, *out_paths: str) -> None:
+        pass
+
+    def skip_memory(self) -> None:
+        """
+        Leave the memory of the following stages out of the profile.
+        """
+
+    def record_sizes(self, cues: int, bytes_in: int, bytes_out: int = 0) -> None:
+        pass
+
+    def merge(self, other: "NullProfile") -> None:
+        pass
+
+    def timings(self) -> dict[str, float]:
+        return {}
+
+    def fields(self) -> dict[str, float]:
+        return {}
+
+
+class Profile(NullProfile):
+    """
+    Wall and CPU time spent in each stage of processing one file.
+
+    Stages interleave cue by cue, so instead of timing blocks the caller
+    marks the end of each step with `lap` and the time since the previous
+    lap is added to that stage.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.wall = dict.fromkeys(STAGES, 0.0)
+        self.cpu = dict.fromkeys(STAGES, 0.0)
+        self.cues = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.restart()
+
+    def restart(self) -> None:
+        self._wall = time.perf_counter()
+        # CPU time of the current thread, so concurrent files do not add up
+        self._cpu = time.thread_time()
+
+    def lap(self, stage: str) -> None:
+        wall = time.perf_counter()
+        cpu = time.thread_time()
+        self.wall[stage] += wall - self._wall
+        self.cpu[stage] += cpu - self._cpu
+        self._wall = wall
+        self._cpu = cpu
+        self.last_lap = stage
+
+    def finish(self, cues: int, file: str, *out_paths: str) -> None:
+        self.record_sizes(
+            cues, os.path.getsize(file), sum(os.path.getsize(path) for path in out_paths)
+        )
+
+    def record_sizes(self, cues: int, bytes_in: int, bytes_out: int = 0) -> None:
+        self.cues = cues
+        self.bytes_in = bytes_in
+        self.bytes_out = bytes_out
+
+    def merge(self, other: "Profile") -> None:
+        """
+        Add the stage times of another part of the same file, like a chunk.
+        """
+        for stage in STAGES:
+            self.wall[stage] += other.wall[stage]
+            self.cpu[stage] += other.cpu[stage]
+
+    def timings(self) -> dict[str, float]:
+        """
+        Fields added to the "File processed" event, which has the cue count.
+        """
+        result: dict[str, float] = {}
+        for stage in STAGES:
+            result[f"{stage}_wall"] = round(self.wall[stage], 6)
+            result[f"{stage}_cpu"] = round(self.cpu[stage], 6)
+        wall = sum(self.wall.values())
+        result["wall"] = round(wall, 6)
+        result["cpu"] = round(sum(self.cpu.values()), 6)
+        result["bytes_in"] = self.bytes_in
+        result["bytes_out"] = self.bytes_out
+        result["cues_per_sec"] = round(self.cues / wall, 1) if wall else 0.0
+        return result
+
+    def fields(self) -> dict[str, float]:
+        return {"cues": self.cues, **self.timings()}
+
+
+def _snapshot() -> tracemalloc.Snapshot:
+    return tracemalloc.take_snapshot().filter_traces(
+        (
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+            tracemalloc.Filter(False, "<unknown>"),
+        )
+    )
+
+
+def _sites() -> list[dict[str, float]]:
+    """
+    Lines holding the most memory allocated since memory tracking started.
+    """
+    stats = _snapshot().compare_to(_baseline, "lineno") if _baseline else []
+    return [
+        {
+            "site": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+            "kb": round(stat.size_diff / 1024, 1),
+            "count": stat.count_diff,
+        }
+        for stat in stats[:TOP]
+        if stat.size_diff > 0
+    ]
+
+
+class MemoryProfile(Profile):
+    """
+    Profile that also tracks the peak memory allocated in each stage.
+
+    Peaks are measured with tracemalloc from the memory traced when the
+    file started, so they include what earlier stages still hold. The
+    peak is global to the process and reset at every lap: with several
+    files on threads of one process, a file is charged for the others and
+    loses the peak another file resets, so `run` only profiles one file at
+    a time per process, and stages the parent runs next to the workers,
+    like the writes of the async executor, are not traced. When a file raises the peak of its process well
+    above the earlier ones, the allocation sites holding the most memory at
+    the end of that lap are kept in `sites`.
+    """
+
+    def __init__(self):
+        self.peak = dict.fromkeys(STAGES, 0)
+        self.sites: list[dict[str, float]] = []
+        self.traced = True
+        self._memory_start: Optional[int] = None
+        super().__init__()
+
+    def __getstate__(self) -> dict:
+        # Traced memory of another process means nothing in this one
+        state = self.__dict__.copy()
+        state["_memory_start"] = None
+        return state
+
+    def skip_memory(self) -> None:
+        # Stages run next to other files in the process, such as the writes
+        # of the parent, neither reset the peak nor take it as their own
+        self.traced = False
+
+    def restart(self) -> None:
+        if self.traced:
+            if self._memory_start is None:
+                self._memory_start = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        super().restart()
+
+    def lap(self, stage: str) -> None:
+        global _process_peak
+        super().lap(stage)
+        if not self.traced:
+            return
+        if self._memory_start is None:
+            self._memory_start = tracemalloc.get_traced_memory()[0]
+        peak = tracemalloc.get_traced_memory()[1] - self._memory_start
+        tracemalloc.reset_peak()
+        if peak <= self.peak[stage]:
+            return
+        self.peak[stage] = peak
+        if peak >= max(_SITES_FLOOR, _process_peak * _SITES_GROWTH):
+            _process_peak = peak
+            self.sites = _sites()
+
+    def merge(self, other: "Profile") -> None:
+        super().merge(other)
+        if max(other.peak.values()) > max(self.peak.values()):
+            self.sites = other.sites
+        for stage in STAGES:
+            self.peak[stage] = max(self.peak[stage], other.peak[stage])
+
+    def timings(self) -> dict[str, float]:
+        result = super().timings()
+        for stage in STAGES:
+            result[f"{stage}_peak_kb"] = round(self.peak[stage] / 1024, 1)
+        result["peak_kb"] = round(max(self.peak.values()) / 1024, 1)
+        return result
+
+    def fields(self) -> dict[str, float]:
+        result = super().fields()
+        if self.sites:
+            result["sites"] = self.sites
+        return result
+
+
+NULL_PROFILE: Final = NullProfile()
+_current: ContextVar[NullProfile] = ContextVar("profile", default=NULL_PROFILE)
+
+
+def current() -> NullProfile:
+    """
+    Profile of the file processed by the current thread.
+    """
+    return _current.get()
+
+
+@contextmanager
+def profiled() -> Iterator[NullProfile]:
+    if _memory:
+        profile: NullProfile = MemoryProfile()
+    else:
+        profile = Profile() if _enabled else NullProfile()
+    token = _current.set(profile)
+    try:
+        yield profile
+    finally:
+        _current.reset(token)
+
+
+class Summary:
+    """
+    Totals of the profiles of all files in a run, and the files using most memory.
+    """
+
+    def __init__(self):
+        self.files = 0
+        self.totals: dict[str, float] = {}
+        self.heaviest: list[dict] = []
+
+    def add(self, fields: dict[str, float], file: str = "") -> None:
+        if not fields:
+            return
+        self.files += 1
+        for key, value in fields.items():
+            if key.endswith("peak_kb"):
+                # Files do not hold their memory at the same time
+                self.totals[key] = max(self.totals.get(key, 0), value)
+            elif key not in ("cues_per_sec", "sites"):
+                self.totals[key] = self.totals.get(key, 0) + value
+        if "peak_kb" in fields:
+            self.heaviest.append({"file": file, **fields})
+            self.heaviest.sort(key=lambda entry: entry["peak_kb"], reverse=True)
+            del self.heaviest[TOP:]
+
+    def fields(self) -> dict[str, float]:
+        result = {key: round(value, 6) for key, value in self.totals.items()}
+        result["files"] = self.files
+        wall = self.totals.get("wall", 0)
+        result["cues_per_sec"] = round(self.totals["cues"] / wall, 1) if wall else 0.0
+        return result
+
+    def memory_report(self) -> tuple[list[dict], list[dict]]:
+        """
+        The files with the highest peaks, and the allocation sites at the highest.
+        """
+        files = [
+            {
+                "file": entry["file"],
+                "peak_kb": entry["peak_kb"],
+                "bytes_in": entry["bytes_in"],
+                "cues": entry["cues"],
+            }
+            for entry in self.heaviest
+        ]
+        for entry in self.heaviest:
+            # Only files raising the peak of their process have sites
+            if entry.get("sites"):
+                return files, entry["sites"]
+        return files, []
@@ -0,0 +1,178 @@
+import codecs
+import io
+import mmap
+import re
+from collections.abc import Iterable, Iterator
+from typing import Final, Optional
+import webvtt
+from webvtt.errors import MalformedFileError
+from webvtt.models import Timestamp
+
+READERS: Final[tuple[str, ...]] = ("fast", "mmap", "webvtt")
+
+# Same patterns as webvtt-py, so both readers accept the same files
+_CUE_TIMINGS: Final = re.compile(
+    r"\s*((?:\d+:)?\d{2}:\d{2}.\d{3})\s*-->\s*((?:\d+:)?\d{2}:\d{2}.\d{3})"
+)
+_CUE_TEXT_TAGS: Final = re.compile("<.*?>")
+_CANONICAL_TIMESTAMP: Final = re.compile(r"\d{2}:[0-5]\d:[0-5]\d\.\d{3}")
+# Files with any other byte order mark are left to webvtt-py
+_OTHER_BOMS: Final = tuple(
+    bom for bom in webvtt.utils.CODEC_BOMS.values() if bom != codecs.BOM_UTF8
+)
+
+_default_reader: str = "fast"
+
+
+def configure(reader: str) -> None:
+    global _default_reader
+    if reader not in READERS:
+        raise ValueError(f"Unknown reader {reader}")
+    _default_reader = reader
+
+
+class Cue:
+    """
+    A cue as needed by prepare: timestamps and the raw payload lines.
+
+    Mirrors the attributes of `webvtt.Caption` used by `preprocess`.
+    """
+
+    __slots__ = ("identifier", "start", "end", "lines")
+
+    def __init__(self, identifier: Optional[str], start: str, end: str, lines: list[str]):
+        self.identifier = identifier
+        self.start = start
+        self.end = end
+        self.lines = lines
+
+    @property
+    def raw_text(self) -> str:
+        return "\n".join(self.lines)
+
+    @property
+    def text(self) -> str:
+        return _CUE_TEXT_TAGS.sub("", self.raw_text)
+
+
+def _timestamp(value: str) -> str:
+    if _CANONICAL_TIMESTAMP.fullmatch(value):
+        return value
+    # Rare forms (no hours, single digits) are normalized, or rejected, by webvtt-py
+    return str(Timestamp.from_string(value))
+
+
+def _is_cue_block(lines: list[str]) -> bool:
+    return bool(
+        (len(lines) >= 2 and _CUE_TIMINGS.match(lines[0]) and "-->" not in lines[1])
+        or (
+            len(lines) >= 3
+            and "-->" not in lines[0]
+            and _CUE_TIMINGS.match(lines[1])
+            and "-->" not in lines[2]
+        )
+    )
+
+
+def _cue(lines: list[str]) -> Cue:
+    identifier = None
+    start = end = None
+    payload = []
+    for line in lines:
+        timing = _CUE_TIMINGS.match(line)
+        if timing:
+            start, end = timing.group(1), timing.group(2)
+        elif not start:
+            identifier = line
+        else:
+            payload.append(line)
+    return Cue(identifier, _timestamp(start), _timestamp(end), payload)
+
+
+def parse_lines(lines: Iterable[str]) -> Iterator[Cue]:
+    """
+    Yield the cues of a WebVTT document given as lines without line breaks.
+
+    NOTE and STYLE blocks, and anything else that is not a cue, are skipped.
+    """
+    lines = iter(lines)
+    first = next(lines, None)
+    if first is None or not first.startswith("WEBVTT"):
+        raise MalformedFileError("Invalid format")
+    block = [first]
+    for line in lines:
+        if line.strip():
+            block.append(line)
+        elif block:
+            if _is_cue_block(block):
+                yield _cue(block)
+            block = []
+    if block and _is_cue_block(block):
+        yield _cue(block)
+
+
+def _buffered_lines(file: str) -> Iterator[str]:
+    # Universal newlines, like webvtt-py
+    with open(file, "r", encoding="utf-8-sig") as f:
+        for line in f:
+            yield line.rstrip("\n\r")
+
+
+def _mmap_lines(file: str) -> Iterator[str]:
+    with open(file, "rb") as f:
+        if f.seek(0, 2) == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if mm[:3] == codecs.BOM_UTF8:
+                mm.seek(3)
+            for raw_line in iter(mm.readline, b""):
+                line = raw_line.decode("utf-8")
+                if "\r" in line:
+                    # Lone carriage returns are line breaks too
+                    yield from line.replace("\r\n", "\n").replace("\r", "\n").split("\n")[
+                        : -1 if line.endswith("\n") else None
+                    ]
+                else:
+                    yield line.rstrip("\n")
+
+
+def _has_other_bom(file: str) -> bool:
+    with open(file, "rb") as f:
+        return f.read(4).startswith(_OTHER_BOMS)
+
+
+def decode(data: bytes) -> str:
+    """
+    Text of a WebVTT file, decoded as `webvtt.read` would.
+    """
+    for encoding, bom in webvtt.utils.CODEC_BOMS.items():
+        if data.startswith(bom):
+            return data[len(bom) :].decode(encoding)
+    return data.decode("utf-8")
+
+
+def text_cues(text: str, reader: Optional[str] = None) -> Iterable:
+    """
+    Cues of a WebVTT document held in memory, see `read_cues`.
+    """
+    reader = reader or _default_reader
+    # Universal newlines, like reading the file
+    lines = io.StringIO(text, newline=None)
+    if reader == "webvtt":
+        return webvtt.from_buffer(lines)
+    return parse_lines(line.rstrip("\n\r") for line in lines)
+
+
+def read_cues(file: str, reader: Optional[str] = None) -> Iterable:
+    """
+    Cues of a WebVTT file, read by the built-in streaming parser or webvtt-py.
+
+    `reader` is "fast" (buffered), "mmap" (memory-mapped) or "webvtt",
+    defaulting to the one set with `configure`.
+    """
+    reader = reader or _default_reader
+    if reader == "webvtt" or _has_other_bom(file):
+        return webvtt.read(file)
+    if reader == "mmap":
+        return parse_lines(_mmap_lines(file))
+    return parse_lines(_buffered_lines(file))
@@ -0,0 +1,105 @@
+import io
+import json
+from typing import Iterable, Iterator, Optional, Sequence
+from structlog import BoundLogger
+import helpers.postprocess
+import helpers.preprocess
+import helpers.profiling
+import helpers.reader
+import helpers.rules
+
+
+def normalize(text: str) -> str:
+    """
+    Cue text without the formatting finalize is allowed to change.
+
+    Speaker dashes get one space after them, dashes before speaker labels
+    are dropped and all whitespace, line breaks included, is collapsed.
+    """
+    rules = helpers.rules.current()
+    normalized = rules.dash.sub(r"\1- ", text)
+    normalized = rules.dash_before_name.sub("", normalized)
+    return " ".join(normalized.split())
+
+
+def prepared_text(captions: Iterable) -> str:
+    """
+    Text `preprocess.process_vtt` would write for `captions`.
+    """
+    return "".join(fragment for fragment, _ in helpers.preprocess.iter_fragments(captions))
+
+
+def finalized_captions(text: str) -> Iterator:
+    """
+    Captions `postprocess.process_vtt` would write for prepared `text`.
+    """
+    return helpers.postprocess.parse_lines(io.StringIO(text))
+
+
+def compare(original: Sequence, roundtrip: Sequence) -> list[dict]:
+    """
+    Differences in cue count, timings and normalized text.
+    """
+    mismatches = []
+    if len(original) != len(roundtrip):
+        mismatches.append(
+            {"field": "cues", "original": len(original), "roundtrip": len(roundtrip)}
+        )
+    for index, (before, after) in enumerate(zip(original, roundtrip)):
+        for field, value, result in (
+            ("start", before.start, after.start),
+            ("end", before.end, after.end),
+            ("text", normalize(before.text), normalize(after.text)),
+        ):
+            if value != result:
+                mismatches.append(
+                    {"cue": index, "field": field, "original": value, "roundtrip": result}
+                )
+    return mismatches
+
+
+def check_cues(original: Iterable) -> tuple[list[dict], int]:
+    """
+    Mismatches after prepare and finalize, and the number of original cues.
+    """
+    original = list(original)
+    roundtrip = list(finalized_captions(prepared_text(original)))
+    return compare(original, roundtrip), len(original)
+
+
+def process_vtt(file: str, log: BoundLogger, reader: Optional[str] = None) -> list[dict]:
+    """
+    Run prepare and finalize on `file` in memory and return the mismatches.
+
+    Nothing is written to disk.
+    """
+    profile = helpers.profiling.current()
+
+    log.info("Processing file", file=file)
+    profile.restart()
+    try:
+        mismatches, cue_count = check_cues(helpers.reader.read_cues(file, reader))
+    except Exception as e:
+        log.exception("Processing error", file=file, error=str(e))
+        raise Exception("Processing error") from e
+    if mismatches:
+        log.warning("Roundtrip mismatch", file=file, mismatches=len(mismatches))
+    log.info("File processed", cues=cue_count, **profile.timings())
+    return mismatches
+
+
+def write_report(path: str, mismatches: dict[str, list[dict]]) -> int:
+    """
+    Write the mismatches of every file into a JSON report.
+
+    Returns the number of files with mismatches.
+    """
+    failed = {file: found for file, found in sorted(mismatches.items()) if found}
+    report = {
+        "files": len(mismatches),
+        "mismatched_files": len(failed),
+        "mismatches": failed,
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    return len(failed)
@@ -0,0 +1,91 @@
+import hashlib
+import json
+import re
+from typing import Any, Final, Optional
+import helpers.cache
+
+# What prepare and finalize apply unless a rules file overrides it
+DEFAULTS: Final[dict[str, Any]] = {
+    # Pattern starting a line said by a new speaker, after any spaces
+    "speaker_dash": "-(?!-)",
+    # Pattern of a speaker name, a colon follows it
+    "speaker_name": "[A-Z]+",
+    # Pattern matched at the start of the text of a cue that is only a sound
+    "sound": r"^ *(?:\[|\()[^\]]*(?:\]|\)) *$|- *\[[^\]]+\]",
+    # Pattern of a lowercase letter, text without any is in uppercase
+    "lowercase": "[a-z]",
+    # A cue ending with one of these, maybe before a closing quote, ends a sentence
+    "punctuation": "!?.♪",
+    "quotes": "\"'",
+    # Longest line finalize writes
+    "line_length": 36,
+}
+
+
+class Rules:
+    """
+    A rule set compiled into the matchers prepare, finalize and roundtrip use.
+
+    Read-only once created, so threads share it. Only the settings are
+    pickled, a process worker compiles them again.
+    """
+
+    def __init__(self, settings: Optional[dict[str, Any]] = None):
+        settings = settings or {}
+        unknown = sorted(set(settings) - set(DEFAULTS))
+        if unknown:
+            raise ValueError(f"Unknown rules {', '.join(unknown)}")
+        self.settings: dict[str, Any] = {**DEFAULTS, **settings}
+        dash = self.settings["speaker_dash"]
+        name = self.settings["speaker_name"]
+        try:
+            # One match tells a speaker line and captures the name after the dash
+            self.speaker = re.compile(rf"^ *(?:{dash})(\s*(?:{name}):)?")
+            self.named_speaker = re.compile(rf"^((?:{name}):)")
+            self.sound = re.compile(self.settings["sound"])
+            self.lowercase = re.compile(self.settings["lowercase"])
+            self.dash = re.compile(rf"(\s*)(?:{dash})\s*")
+            self.dash_before_name = re.compile(rf"(?m)^\s*(?:{dash})\s*(?=(?:{name}):)\s*")
+        except re.error as e:
+            raise ValueError(f"Invalid rule pattern: {e}") from e
+        self.punctuation = tuple(self.settings["punctuation"])
+        self.quotes = tuple(self.settings["quotes"])
+        self.line_length = int(self.settings["line_length"])
+        self.version = hashlib.sha256(
+            json.dumps(self.settings, sort_keys=True).encode("utf-8")
+        ).hexdigest()[:16]
+
+    def __reduce__(self):
+        return Rules, (self.settings,)
+
+
+def load(path: Optional[str] = None) -> Rules:
+    """
+    Rules of a JSON file holding the settings to change, or the defaults.
+    """
+    if not path:
+        return Rules()
+    with open(path, "r", encoding="utf-8") as f:
+        settings = json.load(f)
+    if not isinstance(settings, dict):
+        raise ValueError(f"Rules file {path} must hold an object")
+    return Rules(settings)
+
+
+_current: Rules = Rules()
+
+
+def configure(rules: Optional[Rules] = None) -> None:
+    """
+    Apply `rules`, or the defaults, from now on in this process.
+    """
+    global _current
+    rules = rules or Rules()
+    if rules.version != _current.version:
+        # Cached results of other rules are wrong under these
+        helpers.cache.clear()
+    _current = rules
+
+
+def current() -> Rules:
+    return _current
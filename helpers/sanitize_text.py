@@ -2,16 +2,21 @@ import webvtt
 import re
 import random
 import unicodedata
+from typing import Optional
+
+# All Latin letters in the range U+0041 to U+017F
+LATIN_LETTERS = [
+    chr(cp)
+    for cp in range(0x41, 0x180)
+    if unicodedata.category(chr(cp)).startswith('L')
+]
+
+
+def random_unicode_text(text: str, rng: Optional[random.Random] = None) -> str:
+    rng = rng or random.Random()
 
-def random_unicode_text(text: str) -> str:
-    # Build a list of all Latin letters in the range U+0041 to U+017F
-    latin_letters = [
-        chr(cp)
-        for cp in range(0x41, 0x180)
-        if unicodedata.category(chr(cp)).startswith('L')
-    ]
     def repl(match):
-        return random.choice(latin_letters)
+        return rng.choice(LATIN_LETTERS)
     return re.sub(r"\w", repl, text)
 
 
@@ -0,0 +1,172 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from itertools import islice
+from typing import Any, Callable, Final, Iterable, Iterator, Optional
+import alive_progress
+
+# Files submitted per worker before the first of them completes
+IN_FLIGHT_PER_WORKER: Final[int] = 4
+# Files found ahead of the submissions, for the progress total
+DISCOVER_AHEAD: Final[int] = 100_000
+# Seconds between two updates of the progress bar
+PROGRESS_INTERVAL: Final[float] = 0.25
+
+# Tells the consumer that discovery is over
+_DONE: Final = None
+
+
+class Discovery:
+    """
+    Files and their sizes, found on a thread of their own ahead of the run.
+
+    Finding files (walking folders, hashing them for the manifest) runs up
+    to `ahead` files before the submissions, so the progress total is
+    known early without holding every file of a huge corpus. The size of a
+    file is kept until `finished` is called for it.
+    """
+
+    def __init__(self, files: Iterable[str], ahead: int = DISCOVER_AHEAD):
+        self.found = 0
+        self.found_bytes = 0
+        self.complete = False
+        self.sizes: dict[str, int] = {}
+        self._files = files
+        self._queue: queue.Queue = queue.Queue(ahead)
+        self._error: Optional[BaseException] = None
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._find, name="discovery", daemon=True)
+        self._thread.start()
+
+    def _find(self) -> None:
+        try:
+            for file in self._files:
+                try:
+                    size = os.path.getsize(file)
+                except OSError:
+                    # Reported by the worker that fails to read it
+                    size = 0
+                while not self._stopped.is_set():
+                    try:
+                        self._queue.put((file, size), timeout=PROGRESS_INTERVAL)
+                        break
+                    except queue.Full:
+                        continue
+                if self._stopped.is_set():
+                    return
+                self.found += 1
+                self.found_bytes += size
+        except BaseException as e:
+            self._error = e
+        finally:
+            self.complete = True
+            self._queue.put(_DONE)
+
+    def __iter__(self) -> Iterator[str]:
+        while (item := self._queue.get()) is not _DONE:
+            file, size = item
+            self.sizes[file] = size
+            yield file
+        if self._error is not None:
+            raise self._error
+
+    def finished(self, file: str) -> int:
+        """
+        Size of a file that is done, which is forgotten.
+        """
+        return self.sizes.pop(file, 0)
+
+    def stop(self) -> None:
+        """
+        Stop finding files, for a run that ends early.
+        """
+        self._stopped.set()
+        # Lets the thread put its last item
+        while self._thread.is_alive():
+            try:
+                self._queue.get(timeout=PROGRESS_INTERVAL)
+            except queue.Empty:
+                pass
+
+
+class Progress:
+    """
+    Progress bar weighted by the bytes of the files done, redrawn at most
+    every `interval` seconds.
+
+    Until discovery is complete the total is the bytes found so far, so
+    the bar may step back as more files are found.
+    """
+
+    def __init__(self, discovery: Discovery, bar: Any, interval: float = PROGRESS_INTERVAL):
+        self.discovery = discovery
+        self.bar = bar
+        self.interval = interval
+        self.done = 0
+        self.done_bytes = 0
+        self._shown = 0.0
+
+    def advance(self, file: str) -> None:
+        self.done += 1
+        self.done_bytes += self.discovery.finished(file)
+        now = time.monotonic()
+        if now - self._shown >= self.interval:
+            self._shown = now
+            self.show()
+
+    def show(self) -> None:
+        discovery = self.discovery
+        total = discovery.found_bytes
+        self.bar(self.done_bytes / total if total else 0.0)
+        found = f"{discovery.found}" if discovery.complete else f"{discovery.found}+"
+        self.bar.text(
+            f"{self.done}/{found} files, "
+            f"{self.done_bytes / 1_000_000:.1f}/{total / 1_000_000:.1f} MB"
+        )
+
+
+def progress_bar(title: str = "Processing files"):
+    return alive_progress.alive_bar(
+        manual=True,
+        title=title,
+        enrich_print=False,
+        stats="(eta: {eta})",
+        stats_end=False,
+        receipt_text=True,
+    )
+
+
+def run_window(
+    files: Iterable[str],
+    submit: Callable[[str], Future],
+    finished: Callable[[str, Future], None],
+    in_flight: int,
+) -> None:
+    """
+    Keep at most `in_flight` files submitted, submitting the next as one completes.
+
+    `finished` gets every completed future; when it raises, the futures
+    still pending are cancelled before the error propagates.
+    """
+    if in_flight < 1:
+        # Nothing would be submitted, the files would be silently skipped
+        raise ValueError("in_flight must be at least 1")
+    pending = iter(files)
+    futures: dict[Future, str] = {}
+    try:
+        while True:
+            for file in islice(pending, in_flight - len(futures)):
+                futures[submit(file)] = file
+            if not futures:
+                return
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            # In the order they were submitted, files done before a failure
+            # are still handed to `finished`
+            for future in [future for future in futures if future in done]:
+                finished(futures.pop(future), future)
+    except BaseException:
+        for future in futures:
+            future.cancel()
+        raise
@@ -0,0 +1,228 @@
+import glob
+import hashlib
+import heapq
+import json
+import os
+import re
+from typing import Any, Final, Iterable
+import helpers.executor
+import helpers.manifest
+
+RESULT_VERSION: Final[int] = 1
+REPORT_VERSION: Final[int] = 1
+
+_RESULT_NAME: Final = re.compile(r"\.webvtt_loc\.(\w+)\.shard-(\d+)-of-(\d+)\.json$")
+
+
+def parse(value: str) -> tuple[int, int]:
+    """
+    Index and count of a shard given as "i/N", the index counting from 1.
+    """
+    try:
+        index, count = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise ValueError(f"Shard {value} is not of the form i/N") from None
+    if not 1 <= index <= count:
+        raise ValueError(f"Shard {value} is not between 1/{count} and {count}/{count}")
+    return index, count
+
+
+def key(file: str, root: str) -> str:
+    # Relative, so nodes mounting the storage in different places agree
+    return os.path.relpath(file, root).replace(os.sep, "/")
+
+
+def _size(file: str) -> int:
+    try:
+        return os.path.getsize(file)
+    except OSError:
+        # Reported by the run, which fails to read it
+        return 0
+
+
+def assign(files: Iterable[str], count: int, root: str) -> dict[str, int]:
+    """
+    Shard of every file, from 1 to `count`, balanced by input bytes.
+
+    Files are dealt largest first to the shard holding the fewest bytes so
+    far, files of the same size in the order of the hash of their path
+    relative to `root`. Every node discovering the same files computes the
+    same shards, without talking to the others.
+    """
+    files = sorted(
+        files,
+        key=lambda file: (
+            -_size(file),
+            hashlib.sha256(key(file, root).encode("utf-8")).hexdigest(),
+        ),
+    )
+    loads = [(0, index) for index in range(1, count + 1)]
+    shards: dict[str, int] = {}
+    for file in files:
+        load, index = heapq.heappop(loads)
+        shards[file] = index
+        heapq.heappush(loads, (load + _size(file), index))
+    return shards
+
+
+def listing(files: Iterable[str], root: str) -> str:
+    """
+    Hash of the files discovered and their sizes, equal on every node of a run.
+    """
+    digest = hashlib.sha256()
+    for entry in sorted(f"{key(file, root)}\t{_size(file)}\n" for file in files):
+        digest.update(entry.encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def result_path(root: str, action: str, index: int, count: int) -> str:
+    return os.path.join(root, f".webvtt_loc.{action}.shard-{index}-of-{count}.json")
+
+
+def _entry(
+    result: helpers.executor.FileResult, root: str, size: int
+) -> dict[str, Any]:
+    entry: dict[str, Any] = {"bytes": size, "seconds": round(result.seconds, 4)}
+    if result.failure:
+        entry["status"] = "failed"
+        entry["failure"] = result.failure
+    elif isinstance(result.output, str):
+        entry["status"] = "processed"
+        entry["output"] = key(result.output, root)
+        entry["output_hash"] = helpers.manifest.file_hash(result.output)
+    else:
+        # Roundtrip writes no output, only its mismatches
+        entry["status"] = "processed"
+        entry["mismatches"] = len(result.output or [])
+    return entry
+
+
+def write_result(
+    path: str,
+    action: str,
+    index: int,
+    count: int,
+    root: str,
+    shards: dict[str, int],
+    results: dict[str, helpers.executor.FileResult],
+    seconds: float,
+) -> dict[str, Any]:
+    """
+    Write what this shard did with every file assigned to it.
+
+    Files without a result were skipped as current by the manifest.
+    """
+    files: dict[str, dict[str, Any]] = {}
+    for file, shard in shards.items():
+        if shard != index:
+            continue
+        size = _size(file)
+        if file in results:
+            files[key(file, root)] = _entry(results[file], root, size)
+        else:
+            files[key(file, root)] = {"bytes": size, "status": "current"}
+    result = {
+        "version": RESULT_VERSION,
+        "action": action,
+        "shard": index,
+        "shards": count,
+        "listing": listing(shards, root),
+        "discovered": len(shards),
+        "bytes": sum(entry["bytes"] for entry in files.values()),
+        "seconds": round(seconds, 4),
+        "files": files,
+    }
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+    return result
+
+
+def find_results(folder: str) -> dict[str, list[str]]:
+    """
+    Shard results saved in `folder`, keyed on their action.
+    """
+    found: dict[str, list[str]] = {}
+    for path in sorted(glob.glob(os.path.join(glob.escape(folder), ".webvtt_loc.*.json"))):
+        match = _RESULT_NAME.search(os.path.basename(path))
+        if match:
+            found.setdefault(match.group(1), []).append(path)
+    return found
+
+
+def load_result(path: str) -> dict[str, Any]:
+    with open(path, "r", encoding="utf-8") as f:
+        result = json.load(f)
+    if not isinstance(result, dict) or result.get("version") != RESULT_VERSION:
+        raise ValueError(f"{path} is not a shard result")
+    return result
+
+
+def merge(results: list[dict[str, Any]]) -> dict[str, Any]:
+    """
+    Report of a run from the results of its shards, all of one action.
+
+    Problems are shards that are missing or disagree on the files of the
+    run, and files reported by several shards or by none.
+    """
+    problems: list[str] = []
+    counts = sorted({result["shards"] for result in results})
+    if len(counts) > 1:
+        problems.append(f"Shard results of {counts} shards are mixed")
+    count = counts[-1]
+    if len({result["listing"] for result in results}) > 1:
+        problems.append("Shards discovered different files")
+    indexes = [result["shard"] for result in results]
+    missing_shards = [index for index in range(1, count + 1) if index not in indexes]
+    if missing_shards:
+        problems.append(f"Shards {missing_shards} are missing")
+
+    files: dict[str, dict[str, Any]] = {}
+    duplicated: dict[str, list[int]] = {}
+    for result in results:
+        for name, entry in result["files"].items():
+            if name in files:
+                duplicated.setdefault(name, [files[name]["shard"]]).append(result["shard"])
+                continue
+            files[name] = {**entry, "shard": result["shard"]}
+    if duplicated:
+        problems.append(f"{len(duplicated)} files were processed by several shards")
+    discovered = max(result["discovered"] for result in results)
+    missing_files = max(discovered - len(files), 0)
+    if missing_files:
+        problems.append(f"{missing_files} files were not reported by any shard")
+
+    statuses = [entry["status"] for entry in files.values()]
+    shard_bytes = {result["shard"]: result["bytes"] for result in results}
+    return {
+        "files": len(files),
+        "discovered": discovered,
+        "processed": statuses.count("processed"),
+        "current": statuses.count("current"),
+        "failed": statuses.count("failed"),
+        "shards": count,
+        "shard_bytes": shard_bytes,
+        "shard_seconds": {result["shard"]: result["seconds"] for result in results},
+        # Largest shard over the mean, 1.0 is a perfect balance
+        "imbalance": round(
+            max(shard_bytes.values()) * len(shard_bytes) / (sum(shard_bytes.values()) or 1),
+            3,
+        ),
+        "missing_shards": missing_shards,
+        "missing_files": missing_files,
+        "duplicated": duplicated,
+        "problems": problems,
+        "failures": [entry["failure"] for entry in files.values() if "failure" in entry],
+        "outputs": {name: files[name] for name in sorted(files)},
+    }
+
+
+def write_report(path: str, reports: dict[str, dict[str, Any]]) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(
+            {"version": REPORT_VERSION, "actions": reports},
+            f,
+            ensure_ascii=False,
+            indent=2,
+        )
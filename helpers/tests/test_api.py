@@ -0,0 +1,43 @@
+from helpers.api import finalize_text, finalize_texts, prepare_text, prepare_texts
+from helpers import postprocess, preprocess
+from unittest.mock import MagicMock
+import glob
+import os
+import pytest
+import shutil
+import webvtt
+
+SAMPLES = sorted(
+    glob.glob(os.path.join(os.path.dirname(__file__), "..", "..", "tests", "*.webvtt"))
+)
+
+
+def read(path: str) -> str:
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+
+class TestTextApi:
+    @pytest.mark.parametrize("sample", SAMPLES, ids=os.path.basename)
+    def test_matches_process_vtt(self, tmp_path, sample):
+        vtt_file = str(tmp_path / os.path.basename(sample))
+        shutil.copyfile(sample, vtt_file)
+        prepared = preprocess.process_vtt(vtt_file, MagicMock())
+        final = postprocess.process_vtt(prepared, MagicMock())
+
+        text = prepare_text(read(sample))
+        assert text == read(prepared)
+        assert finalize_text(text) == read(final)
+
+    def test_malformed_text(self):
+        with pytest.raises(webvtt.errors.MalformedFileError):
+            prepare_text("not a webvtt file")
+
+    @pytest.mark.parametrize("workers", [1, 2])
+    def test_batches_keep_the_order(self, workers):
+        texts = [read(sample) for sample in SAMPLES] * 2
+        prepared = prepare_texts(iter(texts), workers=workers)
+        assert prepared == [prepare_text(text) for text in texts]
+        assert finalize_texts(prepared, workers=workers) == [
+            finalize_text(text) for text in prepared
+        ]
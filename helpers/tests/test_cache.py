@@ -0,0 +1,95 @@
+from helpers.cache import LRUCache, latest, total
+from helpers import cache, preprocess
+import helpers.rules as helpers_rules
+import json
+import os
+import pytest
+
+
+@pytest.fixture
+def lru(tmp_path):
+    source = tmp_path / "rules.py"
+    source.write_text("RULES = 1\n", encoding="utf-8")
+    yield LRUCache("test.lru", (str(source),), size=2)
+    cache._caches.pop("test.lru")
+
+
+class TestLRUCache:
+    def test_least_recently_used_is_evicted(self, lru):
+        lru.put("a", (1,))
+        lru.put("b", (2,))
+        assert lru.get("a") == (1,)
+        lru.put("c", (3,))
+        assert lru.get("b") is None
+        assert lru.get("a") == (1,)
+        assert lru.stats() == {"hits": 2, "misses": 1, "evictions": 1, "entries": 2}
+
+    def test_size_zero_caches_nothing(self, lru):
+        lru.size = 0
+        lru.put("a", (1,))
+        assert lru.get("a") is None
+
+    def test_saved_entries_are_loaded(self, lru, tmp_path):
+        folder = str(tmp_path / "cache")
+        lru.put("a", ("x", "y"))
+        lru.save(folder)
+        lru.clear()
+        lru.load(folder)
+        assert lru.get("a") == ("x", "y")
+
+    def test_other_rules_version_is_discarded(self, lru, tmp_path):
+        folder = str(tmp_path / "cache")
+        lru.put("a", (1,))
+        lru.save(folder)
+        with open(lru.sources[0], "a", encoding="utf-8") as f:
+            f.write("RULES = 2\n")
+        lru.clear()
+        lru.load(folder)
+        assert lru.get("a") is None
+
+    def test_changed_rules_module_is_discarded(self, lru, tmp_path, monkeypatch):
+        folder = str(tmp_path / "cache")
+        lru.put("a", (1,))
+        lru.save(folder)
+        module = tmp_path / "compiled.py"
+        module.write_text("# Compiles the rules otherwise\n", encoding="utf-8")
+        monkeypatch.setattr(helpers_rules, "__file__", str(module))
+        lru.clear()
+        lru.load(folder)
+        assert lru.get("a") is None
+
+    def test_worker_parts_are_merged(self, lru, tmp_path):
+        folder = str(tmp_path / "cache")
+        lru.put("a", (1,))
+        lru.save_part(folder)
+        lru.clear()
+        lru.put("b", (2,))
+        lru.save(folder)
+        assert os.listdir(folder) == ["test.lru.json"]
+        with open(lru.path(folder), encoding="utf-8") as f:
+            assert json.load(f)["entries"] == [["a", [1]], ["b", [2]]]
+
+
+class TestCounters:
+    def test_total_of_latest_process_counters(self):
+        first = {"c": {"hits": 1, "misses": 2}}
+        second = {"c": {"hits": 3, "misses": 2}}
+        assert latest(second, first) == second
+        assert total([second, {"c": {"hits": 1, "misses": 0}}]) == {
+            "c": {"hits": 4, "misses": 2}
+        }
+
+
+class TestPrepareCache:
+    def test_cached_scans_give_the_same_text(self):
+        text = "WEBVTT\n\n" + "".join(
+            f"00:00:0{i}.000 --> 00:00:0{i}.500\n{line}\n\n"
+            for i, line in enumerate(["-[MUSIC]", "- JOE: Hi.", "-[MUSIC]", "- JOE: Hi."])
+        )
+        cache.configure(0)
+        expected = preprocess.prepare_document(text)
+        cache.configure()
+        assert preprocess.prepare_document(text) == expected
+        assert cache.stats()["prepare.cues"]["hits"] == 2
+        assert preprocess.prepare_document(text) == expected
+        assert cache.stats()["prepare.cues"]["hits"] == 6
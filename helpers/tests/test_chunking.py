@@ -0,0 +1,62 @@
+from helpers import chunking
+from helpers.api import finalize_text, prepare_text
+from helpers.tests.test_preprocess import random_captions
+import glob
+import os
+import pytest
+
+SAMPLES = sorted(
+    glob.glob(os.path.join(os.path.dirname(__file__), "..", "..", "tests", "*.webvtt"))
+)
+
+
+def document(seed: int, count: int, newline: str = "\n") -> str:
+    blocks = ["WEBVTT"]
+    for caption in random_captions(seed, count):
+        # An empty line would end the cue early
+        lines = [line if line.strip() else "word" for line in caption.lines]
+        blocks.append("\n".join([f"{caption.start} --> {caption.end}", *lines]))
+    return "\n".join(f"{block}\n" for block in blocks).replace("\n", newline)
+
+
+def chunked(action: str, text: str, chunk_size: int) -> chunking.Chunk:
+    chunks = chunking.split(action, text, chunk_size)
+    return chunking.stitch(
+        action,
+        [chunking.transform(action, index, chunk) for index, chunk in enumerate(chunks)],
+    )
+
+
+class TestChunking:
+    @pytest.mark.parametrize("seed", range(5))
+    @pytest.mark.parametrize("newline", ["\n", "\r\n", "\r"])
+    @pytest.mark.parametrize("chunk_size", [1, 300, 5000])
+    def test_matches_unchunked_output(self, seed, newline, chunk_size):
+        text = document(seed, 500, newline)
+
+        prepared = chunked("prepare", text, chunk_size)
+        assert prepared.text == prepare_text(text)
+        assert prepared.cues == 500
+
+        final = chunked("finalize", prepared.text, chunk_size)
+        assert final.text == finalize_text(prepared.text)
+        assert final.cues == 500
+
+    @pytest.mark.parametrize("sample", SAMPLES, ids=os.path.basename)
+    def test_samples(self, sample):
+        with open(sample, encoding="utf-8-sig") as f:
+            text = f.read()
+        prepared = chunked("prepare", text, 50)
+        assert prepared.text == prepare_text(text)
+        assert chunked("finalize", prepared.text, 50).text == finalize_text(
+            prepared.text
+        )
+
+    def test_small_document_is_one_chunk(self):
+        text = document(0, 10)
+        assert chunking.split("prepare", text, len(text)) == [text]
+
+    def test_chunks_start_with_a_cue(self):
+        text = document(1, 200)
+        for chunk in chunking.split("prepare", text, 100)[1:]:
+            assert chunk.startswith(f"{chunking.HEADER}\n00:")
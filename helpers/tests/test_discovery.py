@@ -0,0 +1,65 @@
+from helpers.discovery import walk
+from unittest.mock import MagicMock
+import os
+import pytest
+
+
+def touch(root, *relpaths: str) -> None:
+    for relpath in relpaths:
+        path = root / relpath
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text("WEBVTT\n", encoding="utf-8")
+
+
+def found(root, **options) -> list[str]:
+    return [os.path.relpath(path, root) for path in walk(str(root), MagicMock(), **options)]
+
+
+class TestWalk:
+    def test_skips_output_folders(self, tmp_path):
+        touch(
+            tmp_path,
+            "a.webvtt",
+            "notes.txt",
+            "prepared/a.webvtt",
+            "prepared/final/a.webvtt.vtt",
+            "s01/b.webvtt",
+            "s01/prepared/b.webvtt",
+        )
+        assert found(tmp_path) == ["a.webvtt", os.path.join("s01", "b.webvtt")]
+        assert len(found(tmp_path, prune=())) == 4
+
+    def test_include_and_exclude(self, tmp_path):
+        touch(tmp_path, "a.webvtt", "b.vtt", "extras/c.webvtt", "s01/d.webvtt")
+        assert found(tmp_path, include=["*.vtt"]) == ["b.vtt"]
+        assert found(tmp_path, exclude=["extras"]) == [
+            "a.webvtt",
+            os.path.join("s01", "d.webvtt"),
+        ]
+        assert found(tmp_path, exclude=["s01/*"]) == [
+            "a.webvtt",
+            os.path.join("extras", "c.webvtt"),
+        ]
+
+    def test_is_lazy(self, tmp_path):
+        touch(tmp_path, "a.webvtt", "s01/b.webvtt")
+        files = walk(str(tmp_path), MagicMock())
+        assert os.path.basename(next(files)) == "a.webvtt"
+        # Folders are read when the walk reaches them
+        (tmp_path / "s01" / "c.webvtt").write_text("WEBVTT\n", encoding="utf-8")
+        assert [os.path.basename(path) for path in files] == ["b.webvtt", "c.webvtt"]
+
+    @pytest.mark.skipif(not hasattr(os, "symlink"), reason="no symlinks")
+    def test_symlink_loop(self, tmp_path):
+        touch(tmp_path, "s01/a.webvtt")
+        os.symlink(tmp_path, tmp_path / "s01" / "loop", target_is_directory=True)
+        os.symlink(tmp_path / "s01", tmp_path / "alias", target_is_directory=True)
+        log = MagicMock()
+        files = list(walk(str(tmp_path), log))
+        assert len(files) == 1
+        assert log.warning.call_count == 2
+
+    def test_broken_symlink_is_skipped(self, tmp_path):
+        touch(tmp_path, "a.webvtt")
+        os.symlink(tmp_path / "missing.webvtt", tmp_path / "b.webvtt")
+        assert found(tmp_path) == ["a.webvtt"]
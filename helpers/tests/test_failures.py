@@ -0,0 +1,53 @@
+from helpers.failures import failed_stage, failure, load_files, write_summary
+import json
+import pytest
+
+
+class TestFailures:
+    @pytest.mark.parametrize(
+        "action, last_lap, stage",
+        [
+            ("prepare", None, "parse"),
+            ("prepare", "parse", "transform"),
+            ("prepare", "transform", "write"),
+            ("prepare", "write", "parse"),
+            ("finalize", "transform", "wrap"),
+            ("finalize", "wrap", "write"),
+        ],
+    )
+    def test_failed_stage(self, action, last_lap, stage):
+        assert failed_stage(action, last_lap) == stage
+
+    def test_failure_reports_the_original_error(self):
+        try:
+            try:
+                raise ValueError("No timestamp found in line")
+            except ValueError as e:
+                raise Exception("Processing error") from e
+        except Exception as e:
+            entry = failure("finalize", "a.webvtt", "parse", e)
+        assert entry == {
+            "file": "a.webvtt",
+            "stage": "transform",
+            "type": "ValueError",
+            "message": "No timestamp found in line",
+        }
+
+    def test_summary_lists_files_for_a_later_run(self, tmp_path):
+        path = str(tmp_path / "failures.json")
+        failures = [
+            {"file": "b.webvtt", "stage": "parse", "type": "E", "message": ""},
+            {"file": "a.webvtt", "stage": "write", "type": "E", "message": ""},
+        ]
+        write_summary(path, "prepare", 10, failures)
+        with open(path, encoding="utf-8") as f:
+            summary = json.load(f)
+        assert summary["files"] == 10
+        assert summary["failed"] == 2
+        assert load_files(path) == ["a.webvtt", "b.webvtt"]
+
+    def test_load_rejects_other_files(self, tmp_path):
+        path = tmp_path / "report.json"
+        path.write_text('{"files": 1}', encoding="utf-8")
+        with pytest.raises(ValueError):
+            load_files(str(path))
@@ -0,0 +1,103 @@
+from helpers import formats, postprocess
+from helpers.api import prepare_text
+import io
+import pytest
+import webvtt
+import xml.etree.ElementTree as ElementTree
+
+PREPARED = prepare_text(
+    """WEBVTT
+
+00:00:01.000 --> 00:00:02.000
+- Where were you?
+- <i>Out</i> & about
+
+00:00:03.000 --> 00:00:04.500
+[music]
+
+01:00:05.000 --> 01:00:06.000
+A line long enough to be wrapped by finalize, twice over.
+"""
+)
+
+
+def write_vtt(captions) -> str:
+    out = io.StringIO()
+    writer = formats.VttWriter(out)
+    writer.begin()
+    for caption in captions:
+        writer.write(caption)
+    writer.end()
+    return out.getvalue()
+
+
+class TestVttWriter:
+    def test_matches_webvtt(self):
+        captions = [
+            webvtt.Caption("00:00:01.000", "00:00:02.000", "- One\n- Two"),
+            webvtt.Caption("00:00:02.000", "00:00:03.000", ""),
+            webvtt.Caption("00:00:03.000", "00:00:04.000", "Three"),
+        ]
+        assert write_vtt(captions) == webvtt.WebVTT(captions=captions).content
+
+    def test_empty(self):
+        assert write_vtt([]) == webvtt.WebVTT().content
+
+    def test_record_without_lines(self):
+        record = postprocess.CaptionRecord(0, 1000, ())
+        caption = webvtt.Caption("00:00:00.000", "00:00:01.000", "")
+        assert write_vtt([record]) == webvtt.WebVTT(captions=[caption]).content
+
+
+class TestFormats:
+    def test_writer_needs_write(self):
+        class Incomplete(formats.Writer):
+            extension = "txt"
+
+        with pytest.raises(TypeError):
+            Incomplete(io.StringIO())
+
+    def test_parse(self):
+        assert formats.parse("srt, VTT,srt") == ("srt", "vtt")
+        with pytest.raises(ValueError, match="ass"):
+            formats.parse("vtt,ass")
+        with pytest.raises(ValueError):
+            formats.parse(" , ")
+
+    def test_output_paths(self):
+        assert postprocess.output_path("a/b.webvtt", "srt") == "a/final/b.webvtt.srt"
+        assert postprocess.output_path("a/b.vtt", "ttml") == "a/final/b.ttml"
+        assert postprocess.output_path("a/b.vtt") == "a/final/b.vtt"
+
+    def test_vtt_unchanged(self):
+        finalized = postprocess.finalize_document(PREPARED, formats.FORMATS)
+        assert finalized.text == finalized.texts["vtt"]
+        assert finalized.text == postprocess.finalize_document(PREPARED).text
+        assert finalized.cues == 3
+
+    def test_srt_matches_webvtt_py(self, tmp_path):
+        finalized = postprocess.finalize_document(PREPARED, ("srt", "vtt"))
+        vtt = tmp_path / "final.vtt"
+        vtt.write_text(finalized.texts["vtt"], encoding="utf-8")
+        webvtt.read(str(vtt)).save_as_srt()
+        assert finalized.text == (tmp_path / "final.srt").read_text(encoding="utf-8")
+
+    def test_srt_of_no_captions(self):
+        out = io.StringIO()
+        writer = formats.SrtWriter(out)
+        writer.begin()
+        writer.end()
+        assert out.getvalue() == ""
+
+    def test_ttml(self):
+        ttml = postprocess.finalize_document(PREPARED, ("ttml",)).text
+        root = ElementTree.fromstring(ttml.encode("utf-8"))
+        namespace = "{http://www.w3.org/ns/ttml}"
+        paragraphs = root.findall(f"./{namespace}body/{namespace}div/{namespace}p")
+        assert [p.get("begin") for p in paragraphs] == [
+            "00:00:01.000",
+            "00:00:03.000",
+            "01:00:05.000",
+        ]
+        assert paragraphs[0].findall(f"{namespace}br")
+        assert "Out & about" in "".join(paragraphs[0].itertext())
@@ -0,0 +1,77 @@
+from helpers import journal
+from helpers.executor import FileResult
+from unittest.mock import MagicMock
+import os
+import pytest
+
+
+class TestAtomicOpen:
+    def test_complete(self, tmp_path):
+        path = tmp_path / "out.vtt"
+        with journal.atomic_open(str(path)) as f:
+            f.write("WEBVTT\n")
+            assert not path.exists()
+        assert path.read_text(encoding="utf-8") == "WEBVTT\n"
+        assert os.listdir(tmp_path) == ["out.vtt"]
+
+    def test_interrupted(self, tmp_path):
+        path = tmp_path / "out.vtt"
+        path.write_text("earlier output", encoding="utf-8")
+        with pytest.raises(KeyboardInterrupt):
+            with journal.atomic_open(str(path)) as f:
+                f.write("WEBVTT\n")
+                raise KeyboardInterrupt
+        assert path.read_text(encoding="utf-8") == "earlier output"
+        assert os.listdir(tmp_path) == ["out.vtt"]
+
+
+class TestJournal:
+    def completed(self, tmp_path, name):
+        output = tmp_path / f"{name}.out"
+        output.write_text("done", encoding="utf-8")
+        return FileResult(name, str(output))
+
+    def test_resume(self, tmp_path):
+        path = str(tmp_path / "run.journal")
+        first = journal.Journal(path, "tool", {"a": "hash-a"})
+        first.open()
+        first.add(self.completed(tmp_path, "a"))
+        first.add(FileResult("b", None, failure={"file": "b"}))
+        first.close(complete=False)
+        # Killed while writing the next line
+        with open(path, "a", encoding="utf-8") as f:
+            f.write('{"file": "c", "out')
+
+        resumed = journal.Journal(path, "tool", {})
+        resumed.load(MagicMock())
+        assert list(resumed.entries) == ["a"]
+        assert resumed.entries["a"]["hash"] == "hash-a"
+        resumed.open()
+        resumed.add(self.completed(tmp_path, "c"))
+        resumed.close(complete=False)
+        again = journal.Journal(path, "tool", {})
+        again.load(MagicMock())
+        assert list(again.entries) == ["a", "c"]
+        again.close(complete=True)
+        assert not os.path.exists(path)
+
+    def test_other_tool_is_not_resumed(self, tmp_path):
+        path = str(tmp_path / "run.journal")
+        first = journal.Journal(path, "tool", {})
+        first.open()
+        first.add(self.completed(tmp_path, "a"))
+        first.close(complete=False)
+        log = MagicMock()
+        other = journal.Journal(path, "other tool", {})
+        other.load(log)
+        assert other.entries == {}
+        log.warning.assert_called_once()
+
+    def test_nothing_written_without_results(self, tmp_path):
+        path = str(tmp_path / "run.journal")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("left by an earlier run\n")
+        empty = journal.Journal(path, "tool", {})
+        empty.open()
+        empty.close(complete=False)
+        assert not os.path.exists(path)
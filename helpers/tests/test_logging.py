@@ -0,0 +1,94 @@
+from helpers import logging as helpers_logging
+from concurrent.futures import ProcessPoolExecutor
+import json
+import pytest
+import threading
+
+
+def read_events(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def log_from_worker(path, count):
+    log = helpers_logging.create_worker_log(str(path))
+    for index in range(count):
+        log.info("Worker event", index=index, padding="x" * 200)
+    return True
+
+
+@pytest.fixture(autouse=True)
+def flushed():
+    yield
+    helpers_logging.shutdown()
+
+
+class TestQueueSink:
+    def test_events_written_in_order(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        log = helpers_logging.create_log("run")
+        threads = [
+            threading.Thread(
+                target=lambda n=n: [log.info("Event", thread=n, index=i) for i in range(500)]
+            )
+            for n in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        try:
+            raise ValueError("broken")
+        except ValueError:
+            log.exception("Processing error")
+        helpers_logging.shutdown()
+        events = read_events("run.jsonl")
+        assert len(events) == 2001
+        for n in range(4):
+            indexes = [e["index"] for e in events if e.get("thread") == n]
+            assert indexes == list(range(500))
+        # Tracebacks are taken in the logging thread, before the exception is gone
+        assert events[-1]["exception"][0]["exc_type"] == "ValueError"
+        assert events[-1]["level"] == "error"
+
+    def test_level(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        log = helpers_logging.create_log("run", helpers_logging.LogSettings("warning"))
+        log.info("Hidden")
+        log.warning("Shown")
+        helpers_logging.shutdown()
+        assert [e["msg"] for e in read_events("run.jsonl")] == ["Shown"]
+
+    def test_drop_overflow(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        helpers_logging.create_log("run", helpers_logging.LogSettings("info", 1, "drop"))
+        sink = helpers_logging._sink
+        render, writable = sink._render, threading.Event()
+
+        def slow_render(*args):
+            # Holds the writer up, as a slow disk would
+            writable.wait()
+            return render(*args)
+
+        sink._render = slow_render
+        for index in range(200):
+            sink.put({"msg": "Event", "index": index})
+        dropped = sink.dropped
+        writable.set()
+        helpers_logging.shutdown()
+        events = read_events("run.jsonl")
+        assert dropped > 0
+        assert events[-1]["msg"] == "Log events dropped"
+        reports = [e["dropped"] for e in events if e["msg"] == "Log events dropped"]
+        assert len(events) - len(reports) + sum(reports) == 200
+
+    def test_worker_processes_append_whole_lines(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        log = helpers_logging.create_log("run")
+        log.info("Starting")
+        with ProcessPoolExecutor(max_workers=2) as pool:
+            assert all(pool.map(log_from_worker, ["run"] * 4, [300] * 4))
+        helpers_logging.shutdown()
+        events = read_events("run.jsonl")
+        assert len(events) == 1 + 4 * 300
+        assert len({e["worker"] for e in events[1:]}) >= 1
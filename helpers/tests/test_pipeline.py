@@ -0,0 +1,117 @@
+from helpers.pipeline import Pipeline, submit_chunked, transform
+from helpers import pipeline, postprocess, preprocess
+from unittest.mock import MagicMock
+from concurrent.futures import Future, ThreadPoolExecutor
+import asyncio
+import glob
+import os
+import pytest
+import threading
+
+SAMPLES = sorted(
+    glob.glob(os.path.join(os.path.dirname(__file__), "..", "..", "tests", "*.webvtt"))
+)
+
+
+class TestTransform:
+    @pytest.mark.parametrize("sample", SAMPLES, ids=os.path.basename)
+    def test_matches_process_vtt(self, tmp_path, sample):
+        vtt_file = tmp_path / os.path.basename(sample)
+        vtt_file.write_bytes(open(sample, "rb").read())
+        prepared = preprocess.process_vtt(str(vtt_file), MagicMock())
+        result = transform("prepare", str(vtt_file), vtt_file.read_bytes())
+        assert result.output == prepared
+        with open(prepared, encoding="utf-8") as f:
+            assert result.text == f.read()
+
+        final = postprocess.process_vtt(prepared, MagicMock())
+        with open(prepared, "rb") as f:
+            result = transform("finalize", prepared, f.read())
+        assert result.output == final
+        with open(final, encoding="utf-8") as f:
+            assert result.text == f.read()
+
+    def test_failure_is_returned_with_keep_going(self):
+        result = transform("prepare", "a.webvtt", b"not a webvtt file", keep_going=True)
+        assert result.failure["stage"] == "parse"
+        assert result.failure["type"] == "MalformedFileError"
+
+
+class TestPipeline:
+    def run(self, files, keep_going=True):
+        done = []
+        pipeline = Pipeline("prepare", MagicMock(), done.append, keep_going, 2, 2)
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            asyncio.run(pipeline.run(files, pool, 2))
+        return {result.file: result for result in done}
+
+    def test_read_and_write_failures(self, tmp_path):
+        good = tmp_path / "a.webvtt"
+        good.write_bytes(open(SAMPLES[0], "rb").read())
+        blocked = tmp_path / "s01" / "b.webvtt"
+        blocked.parent.mkdir()
+        blocked.write_bytes(good.read_bytes())
+        # The output folder cannot be created
+        (blocked.parent / "prepared").write_text("", encoding="utf-8")
+        missing = tmp_path / "c.webvtt"
+
+        results = self.run([str(good), str(blocked), str(missing)])
+        assert os.path.exists(results[str(good)].output)
+        assert results[str(blocked)].failure["stage"] == "write"
+        assert results[str(missing)].failure["stage"] == "parse"
+
+    def test_first_failure_stops_the_run(self, tmp_path):
+        with pytest.raises(Exception, match="Processing error"):
+            self.run([str(tmp_path / "missing.webvtt")], keep_going=False)
+
+    @pytest.mark.parametrize("read_ahead, write_behind", [(0, 2), (2, 0)])
+    def test_queues_need_room(self, read_ahead, write_behind):
+        with pytest.raises(ValueError):
+            Pipeline("prepare", MagicMock(), print, True, read_ahead, write_behind)
+
+
+class TestSubmitChunked:
+    def submit(self, tmp_path, monkeypatch, chunk_size):
+        vtt_file = tmp_path / "a.webvtt"
+        vtt_file.write_bytes(open(SAMPLES[0], "rb").read())
+        io_threads = []
+        read_file, write_file = pipeline.read_file, pipeline.write_file
+
+        def recorded(function):
+            def call(*args):
+                io_threads.append(threading.current_thread().name)
+                return function(*args)
+
+            return call
+
+        monkeypatch.setattr(pipeline, "read_file", recorded(read_file))
+        monkeypatch.setattr(pipeline, "write_file", recorded(write_file))
+        whole = Future()
+        whole.set_result("whole")
+        pool = ThreadPoolExecutor(2, thread_name_prefix="worker")
+        io = ThreadPoolExecutor(1, thread_name_prefix="io")
+        with pool, io:
+            done = submit_chunked(
+                pool,
+                io,
+                "prepare",
+                str(vtt_file),
+                MagicMock(),
+                lambda: whole,
+                chunk_size=chunk_size,
+            )
+            result = done.result()
+        return result, io_threads
+
+    def test_file_io_runs_on_the_io_thread(self, tmp_path, monkeypatch):
+        result, io_threads = self.submit(tmp_path, monkeypatch, 200)
+        whole = transform("prepare", "a.webvtt", open(SAMPLES[0], "rb").read())
+        with open(result.output, encoding="utf-8") as f:
+            assert f.read() == whole.text
+        # The file is read, and its output written, off the caller and the workers
+        assert io_threads and all(name.startswith("io") for name in io_threads)
+
+    def test_file_of_one_chunk_is_submitted_whole(self, tmp_path, monkeypatch):
+        # Larger than the chunk size, without a cue boundary after it
+        result, _ = self.submit(tmp_path, monkeypatch, os.path.getsize(SAMPLES[0]) - 1)
+        assert result == "whole"
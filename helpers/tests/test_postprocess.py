@@ -1,6 +1,34 @@
-from helpers.postprocess import parse_vtt_line, read_file, wrap_text_lines, process_line
+from helpers.postprocess import (
+    NEWLINE,
+    SPEAKER,
+    TEXT,
+    TIMESTAMP,
+    TIMESTAMP_PATTERN,
+    format_timestamp,
+    iter_merged_lines,
+    parse_timestamp,
+    parse_vtt_line,
+    process_line,
+    read_file,
+    split_vtt_line,
+    tokenize,
+    wrap_caption_lines,
+    wrap_text_lines,
+)
+from helpers.preprocess import process_vtt
+from unittest.mock import MagicMock
+import glob
+import pytest
+import random
+import re
+import shutil
 import tempfile
 import os
+import webvtt
+
+SAMPLES = sorted(
+    glob.glob(os.path.join(os.path.dirname(__file__), "..", "..", "tests", "*.webvtt"))
+)
 
 
 class TestReadFile:
@@ -77,6 +105,37 @@ class TestParseVttLine:
         assert caption.text == "- ĢĴÖ ÝàĵüšÑħ ÝžŨb ĝĜÚ ĮÔnſnÃİ?"
 
 
+class TestCaptionRecord:
+    @pytest.mark.parametrize(
+        "value, ms",
+        [("00:00:00.000", 0), ("00:01:02.345", 62345), ("12:59:59.999", 46799999)],
+    )
+    def test_timestamps(self, value, ms):
+        assert parse_timestamp(value) == ms
+        assert format_timestamp(ms) == value
+
+    def test_invalid_timestamp(self):
+        with pytest.raises(webvtt.errors.MalformedCaptionError):
+            parse_timestamp("00:60:00.000")
+
+    @pytest.mark.parametrize("sample", SAMPLES)
+    def test_matches_webvtt_caption(self, tmp_path, sample):
+        prepared = shutil.copyfile(sample, tmp_path / os.path.basename(sample))
+        with open(process_vtt(str(prepared), MagicMock()), encoding="utf-8") as f:
+            lines = list(iter_merged_lines(f))
+        for line in lines:
+            # Captions built the way finalize did before the records
+            start, end = re.match(TIMESTAMP_PATTERN, line).group(1)[2:-2].split(" --> ")
+            wrapped = wrap_caption_lines(split_vtt_line(line)[2])
+            expected = webvtt.Caption(start, end, "\n".join(wrapped))
+            record = parse_vtt_line(line)
+            assert (record.start, record.end, list(record.lines), record.text) == (
+                expected.start,
+                expected.end,
+                expected.lines,
+                expected.text,
+            )
+
 
 class TestWrapTextLines:
     def test_wrap_text_lines_basic(self):
@@ -128,3 +187,132 @@ class TestProcessLine:
         print(repr(result))
         print(repr(expected))
         assert result == expected
+
+
+class TestStreaming:
+    def test_iter_merged_lines_is_lazy(self):
+        consumed = []
+
+        def lines():
+            for line in [
+                "⎡⎡00:00:01.000 --> 00:00:02.000⎦⎦ One",
+                "continued.",
+                "⎡⎡00:00:02.000 --> 00:00:03.000⎦⎦ Two.",
+                "⎡⎡00:00:03.000 --> 00:00:04.000⎦⎦ Three.",
+            ]:
+                consumed.append(line)
+                yield line
+
+        merged = iter_merged_lines(lines())
+        # The first caption is complete once the next one starts
+        assert next(merged) == "⎡⎡00:00:01.000 --> 00:00:02.000⎦⎦ One continued."
+        assert len(consumed) == 3
+        assert list(merged) == [
+            "⎡⎡00:00:02.000 --> 00:00:03.000⎦⎦ Two.",
+            "⎡⎡00:00:03.000 --> 00:00:04.000⎦⎦ Three.",
+        ]
+
+
+def legacy_merged_lines(lines) -> list[str]:
+    # process_line before the tokenizer, kept as the reference output
+    pattern = r"(⎡⎡\d{2}:\d{2}:\d{2}\.\d{3} --> \d{2}:\d{2}:\d{2}\.\d{3}⎦⎦)"
+    result = []
+    for line in lines:
+        line = line.rstrip("\n")
+        if not line.strip():
+            continue
+        matches = list(re.finditer(pattern, line))
+        if not matches:
+            if result:
+                result[-1] += " " + line
+            else:
+                result.append(line)
+        elif len(matches) == 1 and matches[0].start() == 0:
+            result.append(line)
+        else:
+            splits = [0] + [m.start() for m in matches] + [len(line)]
+            for i in range(len(splits) - 1):
+                segment = line[splits[i] : splits[i + 1]].strip()
+                if not segment:
+                    continue
+                if i == 0 and not re.match(pattern, segment):
+                    if result:
+                        result[-1] += " " + segment
+                    else:
+                        result.append(segment)
+                else:
+                    result.append(segment)
+    return result
+
+
+def legacy_split(line: str):
+    # split_vtt_line before the tokenizer
+    ts_match = re.match(r"⎡⎡(\d{2}:\d{2}:\d{2}\.\d{3}) --> (\d{2}:\d{2}:\d{2}\.\d{3})⎦⎦", line)
+    if not ts_match:
+        raise ValueError("No timestamp found in line")
+    text = line[ts_match.end() :].strip()
+    matches = list(re.finditer(r"⎡⎡Speaker (?:([^:⎦]+):?)?⎦⎦", text))
+    lines = []
+    if matches:
+        pre_text = text[: matches[0].start()].strip()
+        if pre_text:
+            lines.append(pre_text)
+    for idx, m in enumerate(matches):
+        end_idx = matches[idx + 1].start() if idx + 1 < len(matches) else len(text)
+        content = text[m.end() : end_idx].strip()
+        name = m.group(1)
+        if len(matches) == 1:
+            lines.append(f"{name + ': ' if name else '- '}{content}".strip())
+        elif name:
+            lines.append(f"- {name}: {content}".strip())
+        else:
+            lines.append(f"- {content}".strip())
+    return ts_match.group(1), ts_match.group(2), lines or [text]
+
+
+def random_prepared_lines(seed: int, count: int) -> list[str]:
+    rng = random.Random(seed)
+    pieces = [
+        "⎡⎡00:00:01.000 --> 00:00:02.500⎦⎦", "⎡⎡01:02:03.004 --> 01:02:04.000⎦⎦",
+        "⎡⎡Speaker ⎦⎦", "⎡⎡Speaker JOE:⎦⎦", "⎡⎡Speaker ANN⎦⎦", "⎡⎡Speaker  BOB :⎦⎦",
+        "⎡⎡", "⎦⎦", "⎡⎡Speaker", "⎡⎡00:00:01.000", "⎡⎡⎡Speaker ⎦⎦", "word", "Ünïcode",
+        " ", "  ", "\t", "　", "-", ".", "[music]", "⎡⎡Speaker A:B⎦⎦",
+    ]
+    return [
+        "".join(rng.choice(pieces) for _ in range(rng.randint(0, 8))) + "\n"
+        for _ in range(count)
+    ]
+
+
+class TestTokenizer:
+    @pytest.mark.parametrize("seed", range(10))
+    def test_matches_legacy_merging(self, seed):
+        lines = random_prepared_lines(seed, 1000)
+        assert list(iter_merged_lines(lines)) == legacy_merged_lines(lines)
+        result = []
+        for line in lines:
+            if line.strip():
+                process_line(line.rstrip("\n"), result)
+        assert result == legacy_merged_lines(lines)
+
+    @pytest.mark.parametrize("seed", range(10))
+    def test_matches_legacy_split(self, seed):
+        for line in legacy_merged_lines(random_prepared_lines(seed, 1000)):
+            try:
+                expected = legacy_split(line)
+            except ValueError:
+                with pytest.raises(ValueError):
+                    split_vtt_line(line)
+                continue
+            start, end, lines = split_vtt_line(line)
+            assert (format_timestamp(start), format_timestamp(end), lines) == expected
+
+    def test_tokens(self):
+        tokens = list(tokenize(["⎡⎡00:00:01.000 --> 00:00:02.000⎦⎦ ⎡⎡Speaker JOE:⎦⎦ Hi ⎡⎡x\n", "\n"]))
+        assert tokens == [
+            (TIMESTAMP, "⎡⎡00:00:01.000 --> 00:00:02.000⎦⎦", ("00:00:01.000", "00:00:02.000")),
+            (TEXT, " ", None),
+            (SPEAKER, "⎡⎡Speaker JOE:⎦⎦", "JOE"),
+            (TEXT, " Hi ⎡⎡x", None),
+            (NEWLINE, "\n", None),
+        ]
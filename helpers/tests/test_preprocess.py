@@ -2,12 +2,20 @@ from unittest.mock import patch, mock_open, MagicMock
 from helpers.preprocess import process_vtt
 import pytest
 
+
+@pytest.fixture(autouse=True)
+def no_rename():
+    # Outputs are written to a mocked temporary file, renamed once complete
+    with patch("helpers.journal.os.replace"):
+        yield
+
+
 class TestFragments:
     @pytest.fixture
     def log(self):
         return MagicMock()
 
-    @patch("helpers.preprocess.webvtt.read")
+    @patch("helpers.reader.webvtt.read")
     @patch("builtins.open", new_callable=mock_open)
     def test_join_lines(self, mock_file, mock_webvtt_read, log):
         caption = MagicMock()
@@ -17,7 +25,7 @@ class TestFragments:
         caption.raw_text = "She had that level\nof love and care."
         mock_webvtt_read.return_value = [caption]
 
-        process_vtt("testfile", log)
+        process_vtt("testfile", log, reader="webvtt")
 
         handle = mock_file()
         written = "".join(call.args[0] for call in handle.write.call_args_list)
@@ -27,7 +35,7 @@ class TestFragments:
 
         assert written == expected
 
-    @patch("helpers.preprocess.webvtt.read")
+    @patch("helpers.reader.webvtt.read")
     @patch("builtins.open", new_callable=mock_open)
     def test_speaker_on_second_line(self, mock_file, mock_webvtt_read, log):
         caption = MagicMock()
@@ -38,7 +46,7 @@ class TestFragments:
         caption.lines=['called "Big Banana" before.', '-Good.']
         mock_webvtt_read.return_value = [caption]
 
-        process_vtt("testfile", log)
+        process_vtt("testfile", log, reader="webvtt")
 
         handle = mock_file()
         written = "".join(call.args[0] for call in handle.write.call_args_list)
@@ -49,7 +57,7 @@ class TestFragments:
         print(repr(expected))
         assert written == expected
 
-    @patch("helpers.preprocess.webvtt.read")
+    @patch("helpers.reader.webvtt.read")
     @patch("builtins.open", new_callable=mock_open)
     def test_simple_cue(self, mock_file, mock_webvtt_read, log):
         caption = MagicMock()
@@ -59,7 +67,7 @@ class TestFragments:
         caption.raw_text = "I was in shock."
         mock_webvtt_read.return_value = [caption]
 
-        process_vtt("testfile", log)
+        process_vtt("testfile", log, reader="webvtt")
 
         handle = mock_file()
         written = "".join(call.args[0] for call in handle.write.call_args_list)
@@ -67,7 +75,7 @@ class TestFragments:
 
         assert written == expected
 
-    @patch("helpers.preprocess.webvtt.read")
+    @patch("helpers.reader.webvtt.read")
     @patch("builtins.open", new_callable=mock_open)
     def test_join_multiple_cues(self, mock_file, mock_webvtt_read, log):
         caption1 = MagicMock()
@@ -84,7 +92,7 @@ class TestFragments:
 
         mock_webvtt_read.return_value = [caption1, caption2]
 
-        process_vtt("testfile", log)
+        process_vtt("testfile", log, reader="webvtt")
 
         handle = mock_file()
         written = "".join(call.args[0] for call in handle.write.call_args_list)
@@ -95,7 +103,7 @@ class TestFragments:
 
         assert written == expected
 
-    @patch("helpers.preprocess.webvtt.read")
+    @patch("helpers.reader.webvtt.read")
     @patch("builtins.open", new_callable=mock_open)
     def test_multiple_speakers(self, mock_file, mock_webvtt_read, log):
         caption = MagicMock()
@@ -106,7 +114,7 @@ class TestFragments:
         caption.lines = ["-A hostel in New York?", "-Yeah."]
         mock_webvtt_read.return_value = [caption]
 
-        process_vtt("testfile", log)
+        process_vtt("testfile", log, reader="webvtt")
 
         handle = mock_file()
         written = "".join(call.args[0] for call in handle.write.call_args_list)
@@ -118,7 +126,7 @@ class TestFragments:
         print(written)
         assert written == expected
 
-    @patch("helpers.preprocess.webvtt.read")
+    @patch("helpers.reader.webvtt.read")
     @patch("builtins.open", new_callable=mock_open)
     def test_multiple_speakers_with_name(self, mock_file, mock_webvtt_read, log):
         caption = MagicMock()
@@ -129,7 +137,7 @@ class TestFragments:
         caption.lines = ["-Hi, everyone. How are you?", "-TANISHA: Cold."]
         mock_webvtt_read.return_value = [caption]
 
-        process_vtt("testfile", log)
+        process_vtt("testfile", log, reader="webvtt")
 
         handle = mock_file()
         written = "".join(call.args[0] for call in handle.write.call_args_list)
@@ -141,7 +149,7 @@ class TestFragments:
         print(written)
         assert written == expected
 
-    @patch("helpers.preprocess.webvtt.read")
+    @patch("helpers.reader.webvtt.read")
     @patch("builtins.open", new_callable=mock_open)
     def test_named_speaker_no_dash(self, mock_file, mock_webvtt_read, log):
         caption = MagicMock()
@@ -153,7 +161,7 @@ class TestFragments:
         caption.lines = ["BANANAS: Previously on", '"House of Villains"...']
         mock_webvtt_read.return_value = [caption]
 
-        process_vtt("testfile", log)
+        process_vtt("testfile", log, reader="webvtt")
 
         handle = mock_file()
         written = "".join(call.args[0] for call in handle.write.call_args_list)
@@ -164,7 +172,7 @@ class TestFragments:
         print(written)
         assert written == expected
 
-    @patch("helpers.preprocess.webvtt.read")
+    @patch("helpers.reader.webvtt.read")
     @patch("builtins.open", new_callable=mock_open)
     def test_multiple_speakers_and_sounds(self, mock_file, mock_webvtt_read, log):
         # First caption
@@ -185,7 +193,7 @@ class TestFragments:
 
         mock_webvtt_read.return_value = [caption1, caption2]
 
-        process_vtt("testfile", log)
+        process_vtt("testfile", log, reader="webvtt")
 
         handle = mock_file()
         written = "".join(call.args[0] for call in handle.write.call_args_list)
@@ -199,7 +207,7 @@ class TestFragments:
         print(repr(expected))
         assert written == expected
 
-    @patch("helpers.preprocess.webvtt.read")
+    @patch("helpers.reader.webvtt.read")
     @patch("builtins.open", new_callable=mock_open)
     def test_named_speaker_and_simple_line(self, mock_file, mock_webvtt_read, log):
         # First caption: named speaker
@@ -220,7 +228,7 @@ class TestFragments:
 
         mock_webvtt_read.return_value = [caption1, caption2]
 
-        process_vtt("testfile", log)
+        process_vtt("testfile", log, reader="webvtt")
 
         handle = mock_file()
         written = "".join(call.args[0] for call in handle.write.call_args_list)
@@ -230,7 +238,7 @@ class TestFragments:
         )
         assert written == expected
 
-    @patch("helpers.preprocess.webvtt.read")
+    @patch("helpers.reader.webvtt.read")
     @patch("builtins.open", new_callable=mock_open)
     def test_starting_dashes(self, mock_file, mock_webvtt_read, log):
         # Simulate a caption with censored word
@@ -241,7 +249,7 @@ class TestFragments:
         caption.raw_text = "---ing loser."
         # No speaker, no dash at start, just censored word
         mock_webvtt_read.return_value = [caption]
-        process_vtt("testfile", log)
+        process_vtt("testfile", log, reader="webvtt")
         handle = mock_file()
         written = "".join(call.args[0] for call in handle.write.call_args_list)
         expected = "⎡⎡00:01:29.584 --> 00:01:32.125⎦⎦ ---ing loser. \n"
@@ -250,7 +258,7 @@ class TestFragments:
 
         assert written == expected
 
-    @patch("helpers.preprocess.webvtt.read")
+    @patch("helpers.reader.webvtt.read")
     @patch("builtins.open", new_callable=mock_open)
     def test_single_multiline_speaker(self, mock_file, mock_webvtt_read, log):
         caption = MagicMock()
@@ -261,7 +269,7 @@ class TestFragments:
         caption.lines = ["- The initial news reports", "about the murder was shocking."]
         mock_webvtt_read.return_value = [caption]
 
-        process_vtt("testfile", log)
+        process_vtt("testfile", log, reader="webvtt")
 
         handle = mock_file()
         written = "".join(call.args[0] for call in handle.write.call_args_list)
@@ -270,7 +278,7 @@ class TestFragments:
         print(repr(expected))
         assert written == expected
 
-    @patch("helpers.preprocess.webvtt.read")
+    @patch("helpers.reader.webvtt.read")
     @patch("builtins.open", new_callable=mock_open)
     def test_sound_and_multiline_speaker(self, mock_file, mock_webvtt_read, log):
         # First caption: sound effect
@@ -291,7 +299,7 @@ class TestFragments:
 
         mock_webvtt_read.return_value = [caption1, caption2]
 
-        process_vtt("testfile", log)
+        process_vtt("testfile", log, reader="webvtt")
 
         handle = mock_file()
         written = "".join(call.args[0] for call in handle.write.call_args_list)
@@ -303,7 +311,7 @@ class TestFragments:
         print(repr(expected))
         assert written == expected
 
-    @patch("helpers.preprocess.webvtt.read")
+    @patch("helpers.reader.webvtt.read")
     @patch("builtins.open", new_callable=mock_open)
     def test_single_speaker_with_leading_space(self, mock_file, mock_webvtt_read, log):
         caption = MagicMock()
@@ -314,7 +322,7 @@ class TestFragments:
         caption.lines = [" - Welcome back, y'all"]
         mock_webvtt_read.return_value = [caption]
 
-        process_vtt("testfile", log)
+        process_vtt("testfile", log, reader="webvtt")
 
         handle = mock_file()
         written = "".join(call.args[0] for call in handle.write.call_args_list)
@@ -322,7 +330,7 @@ class TestFragments:
         
         assert written == expected
 
-    @patch("helpers.preprocess.webvtt.read")
+    @patch("helpers.reader.webvtt.read")
     @patch("builtins.open", new_callable=mock_open)
     def test_music(self, mock_file, mock_webvtt_read, log):
         # First caption: music notes with leading spaces
@@ -343,7 +351,7 @@ class TestFragments:
 
         mock_webvtt_read.return_value = [caption1, caption2]
 
-        process_vtt("testfile", log)
+        process_vtt("testfile", log, reader="webvtt")
 
         handle = mock_file()
         written = "".join(call.args[0] for call in handle.write.call_args_list)
@@ -354,3 +362,87 @@ class TestFragments:
         print(repr(written))
         print(repr(expected))
         assert written == expected
+
+
+def legacy_fragments(captions) -> str:
+    # process_vtt before the single-pass scan, kept as the reference output
+    import re
+
+    SPEAKER_MATCH_RE = r"^ *-(?!-)"
+    SPEAKER_CAPTURE_RE = r"^ *-(\s*[A-Z]+:)?"
+    SOUND_RE = r"^ *(?:\[|\()[^\]]*(?:\]|\)) *$"
+
+    written = ""
+    newline_in_previous = True
+    for caption in captions:
+        fragment = f"⎡⎡{caption.start} --> {caption.end}⎦⎦ "
+        if any(re.match(SPEAKER_MATCH_RE, line) for line in caption.lines):
+            for counter, line in enumerate(caption.lines):
+                line = line.strip()
+                if re.match(SPEAKER_MATCH_RE, line):
+                    if counter > 0:
+                        fragment += "\n"
+                    fragment += re.sub(SPEAKER_CAPTURE_RE, r"⎡⎡Speaker \1⎦⎦ ", line)
+                else:
+                    fragment += " " + line
+        else:
+            cue_text = " ".join(caption.raw_text.splitlines()) + " "
+            fragment += re.sub(r"^([A-Z]+:)", r"⎡⎡Speaker \1⎦⎦ ", cue_text)
+        if re.match(SOUND_RE, caption.text) or re.match(r"- *\[[^\]]+\]", caption.text):
+            if newline_in_previous:
+                fragment += "\n"
+            else:
+                fragment = "\n" + fragment + "\n"
+            newline_in_previous = True
+        elif fragment.endswith("] "):
+            fragment += "\n"
+            newline_in_previous = True
+        elif re.search(r"[!?\.♪][\"']? *$", caption.text):
+            fragment += "\n"
+            newline_in_previous = True
+        else:
+            newline_in_previous = False
+        fragment = re.sub(r"\n\n$", "\n", fragment)
+        written += re.sub(" +", " ", fragment)
+    return written
+
+
+def random_captions(seed: int, count: int):
+    import random
+    import webvtt
+
+    rng = random.Random(seed)
+    pieces = [
+        "word", "WORD", "Ünïcode", "-", "--", "---ing", " - ", "\t-", "-JOE:",
+        "- ANN:", "JOE:", "[music]", "(laughs)", "[", "]", "] ", "♪", "♪♪",
+        ".", "!", "?", '"', "'", ".'", '?"', "  ", " ", "<i>", "</i>", "",
+    ]
+    captions = []
+    for index in range(count):
+        lines = [
+            "".join(rng.choice(pieces) for _ in range(rng.randint(0, 6)))
+            for _ in range(rng.randint(1, 3))
+        ]
+        ms = index * 1000
+        start = f"00:{ms // 60000 % 60:02d}:{ms // 1000 % 60:02d}.000"
+        captions.append(webvtt.Caption(start, start, lines))
+    return captions
+
+
+class TestScanCue:
+    @pytest.fixture
+    def log(self):
+        return MagicMock()
+
+    @pytest.mark.parametrize("seed", range(10))
+    @patch("helpers.reader.webvtt.read")
+    @patch("builtins.open", new_callable=mock_open)
+    def test_matches_legacy_output(self, mock_file, mock_webvtt_read, seed, log):
+        captions = random_captions(seed, 2000)
+        mock_webvtt_read.return_value = captions
+
+        process_vtt("testfile", log, reader="webvtt")
+
+        handle = mock_file()
+        written = "".join(call.args[0] for call in handle.write.call_args_list)
+        assert written == legacy_fragments(captions)
@@ -0,0 +1,132 @@
+from unittest.mock import MagicMock
+import pickle
+import shutil
+import os
+from helpers import postprocess, preprocess, profiling
+import pytest
+
+
+SAMPLE = os.path.join(os.path.dirname(__file__), "..", "..", "tests", "sample1.webvtt")
+
+
+class TestProfile:
+    def test_laps_add_up_per_stage(self):
+        profile = profiling.Profile()
+        profile.lap("parse")
+        profile.lap("write")
+        profile.lap("parse")
+        fields = profile.fields()
+        assert fields["wrap_wall"] == 0
+        assert fields["wall"] == pytest.approx(
+            fields["parse_wall"] + fields["write_wall"], abs=1e-5
+        )
+
+    def test_disabled_profile_adds_no_fields(self):
+        profiling.configure(False)
+        with profiling.profiled() as profile:
+            assert profiling.current() is profile
+            assert profile.fields() == {}
+
+    def test_summary(self):
+        summary = profiling.Summary()
+        summary.add({"wall": 1.0, "cues": 10, "cues_per_sec": 10.0})
+        summary.add({"wall": 3.0, "cues": 30, "cues_per_sec": 10.0})
+        summary.add({})
+        assert summary.fields() == {
+            "wall": 4.0,
+            "cues": 40,
+            "files": 2,
+            "cues_per_sec": 10.0,
+        }
+
+
+class TestMemoryProfile:
+    @pytest.fixture(autouse=True)
+    def enabled(self, monkeypatch):
+        monkeypatch.setattr(profiling, "_SITES_FLOOR", 0)
+        profiling.configure(False, memory=True)
+        yield
+        profiling.configure(False)
+
+    def test_peak_per_stage(self):
+        with profiling.profiled() as profile:
+            assert isinstance(profile, profiling.MemoryProfile)
+            profile.lap("parse")
+            held = [bytearray(1024) for _ in range(1024)]
+            profile.lap("transform")
+            del held
+            profile.lap("wrap")
+        fields = profile.fields()
+        assert fields["transform_peak_kb"] >= 1024
+        assert fields["parse_peak_kb"] < 1024
+        assert fields["peak_kb"] >= fields["transform_peak_kb"]
+        assert any(__file__ in site["site"] for site in fields["sites"])
+
+    def test_skipped_memory_keeps_the_peak_of_others(self):
+        with profiling.profiled() as measured:
+            held = [bytearray(1024) for _ in range(1024)]
+            # A write of another file, on another thread of the process
+            with profiling.profiled() as write:
+                write.skip_memory()
+                write.restart()
+                write.lap("write")
+            measured.lap("transform")
+            del held
+        assert write.peak["write"] == 0
+        assert measured.peak["transform"] >= 1024 * 1024
+
+    def test_pickled_profile_restarts_in_the_new_process(self):
+        profile = profiling.MemoryProfile()
+        profile.lap("parse")
+        copy = pickle.loads(pickle.dumps(profile))
+        assert copy.peak == profile.peak
+        assert copy._memory_start is None
+        copy.restart()
+        copy.lap("write")
+        assert copy.peak["write"] >= 0
+
+    def test_summary_keeps_the_heaviest_files(self):
+        summary = profiling.Summary()
+        sites = [{"site": "a.py:1", "kb": 10.0, "count": 1}]
+        for index in range(profiling.TOP + 2):
+            fields = {"cues": 1, "bytes_in": 10, "peak_kb": float(index), "wall": 1.0}
+            if index == profiling.TOP:
+                fields["sites"] = sites
+            summary.add(fields, f"file{index}")
+        assert summary.fields()["peak_kb"] == profiling.TOP + 1
+        files, top_sites = summary.memory_report()
+        assert [entry["file"] for entry in files][:2] == ["file11", "file10"]
+        assert len(files) == profiling.TOP
+        assert top_sites == sites
+
+
+class TestProcessVtt:
+    @pytest.fixture(autouse=True)
+    def enabled(self):
+        profiling.configure(True)
+        yield
+        profiling.configure(False)
+
+    def processed_event(self, log: MagicMock) -> dict:
+        (call,) = [c for c in log.info.call_args_list if c.args == ("File processed",)]
+        return call.kwargs
+
+    def test_prepare_and_finalize_fields(self, tmp_path):
+        source = tmp_path / "sample1.webvtt"
+        shutil.copyfile(SAMPLE, source)
+        log = MagicMock()
+        with profiling.profiled():
+            prepared = preprocess.process_vtt(str(source), log)
+        fields = self.processed_event(log)
+        assert fields["bytes_in"] == os.path.getsize(source)
+        assert fields["bytes_out"] == os.path.getsize(prepared)
+        assert fields["parse_wall"] > 0
+        assert fields["wrap_wall"] == 0
+
+        log = MagicMock()
+        with profiling.profiled():
+            postprocess.process_vtt(prepared, log)
+        fields = self.processed_event(log)
+        assert fields["cues"] > 0
+        assert fields["wrap_wall"] > 0
+        assert set(profiling.STAGES) <= {key.split("_")[0] for key in fields}
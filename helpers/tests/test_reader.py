@@ -0,0 +1,115 @@
+from helpers.preprocess import process_vtt
+from helpers.reader import READERS, read_cues
+from benchmarks.corpus import CorpusSpec, generate_corpus
+from webvtt.errors import MalformedFileError
+from unittest.mock import MagicMock
+import glob
+import os
+import shutil
+import pytest
+import webvtt
+
+SAMPLES = sorted(
+    glob.glob(os.path.join(os.path.dirname(__file__), "..", "..", "tests", "*.webvtt"))
+)
+EDGE_CASES = {
+    "identifiers_and_settings": (
+        "WEBVTT - with a title\n\n"
+        "1\n00:00:01.000 --> 00:00:02.000 align:start line:90%\n<i>Hello</i> there.\n\n"
+        "intro\n00:00:02.000-->00:00:03.500\n-Two\n- lines\n"
+    ),
+    "note_and_style": (
+        "WEBVTT\n\nSTYLE\n::cue { color: red }\n\n"
+        "NOTE a comment\nover two lines\n\n"
+        "00:00:01.000 --> 00:00:02.000\nText\n\nNOTE\n\n"
+        "00:00:02.000 --> 00:00:03.000\nMore text"
+    ),
+    "short_timestamps": "WEBVTT\n\n00:01.000 --> 01:02.500\nNo hours\n",
+    "line_breaks": "WEBVTT\r\n\r\n00:00:01.000 --> 00:00:02.000\r\nCRLF\r\n\r\n"
+    "00:00:02.000 --> 00:00:03.000\rLone CR\r\r00:00:03.000 --> 00:00:04.000\nLF\n",
+    "blank_lines_with_spaces": (
+        "WEBVTT\n   \n00:00:01.000 --> 00:00:02.000\n  indented\n \t \n"
+        "00:00:02.000 --> 00:00:03.000\nafter spaces\n\n\n\n"
+    ),
+    "cue_without_blank_after_header": (
+        "WEBVTT\n00:00:01.000 --> 00:00:02.000\nRight after the header\n"
+    ),
+    "invalid_blocks": (
+        "WEBVTT\n\n00:00:01.000 --> 00:00:02.000\n\n"
+        "00:00:02.000 --> 00:00:03.000\n00:00:03.000 --> 00:00:04.000\n\n"
+        "00:00:04.000 --> 00:00:05.000\nKept\n"
+    ),
+}
+
+
+def cue_fields(cues) -> list[tuple]:
+    return [(c.start, c.end, list(c.lines), c.text, c.raw_text) for c in cues]
+
+
+def write(folder, name: str, data: bytes) -> str:
+    path = os.path.join(folder, name)
+    with open(path, "wb") as f:
+        f.write(data)
+    return path
+
+
+class TestReadCues:
+    @pytest.mark.parametrize("reader", ["fast", "mmap"])
+    @pytest.mark.parametrize("name", EDGE_CASES)
+    def test_matches_webvtt_py(self, tmp_path, reader, name):
+        path = write(tmp_path, "case.webvtt", EDGE_CASES[name].encode("utf-8"))
+        assert cue_fields(read_cues(path, reader)) == cue_fields(webvtt.read(path))
+
+    @pytest.mark.parametrize("reader", ["fast", "mmap"])
+    def test_utf8_bom(self, tmp_path, reader):
+        text = EDGE_CASES["identifiers_and_settings"]
+        path = write(tmp_path, "bom.webvtt", b"\xef\xbb\xbf" + text.encode("utf-8"))
+        assert cue_fields(read_cues(path, reader)) == cue_fields(webvtt.read(path))
+
+    def test_other_boms_fall_back_to_webvtt_py(self, tmp_path):
+        text = EDGE_CASES["note_and_style"]
+        path = write(tmp_path, "utf16.webvtt", text.encode("utf-16"))
+        assert cue_fields(read_cues(path, "fast")) == cue_fields(webvtt.read(path))
+
+    @pytest.mark.parametrize("reader", READERS)
+    @pytest.mark.parametrize("text", ["", "Not a caption file\n"])
+    def test_missing_header(self, tmp_path, reader, text):
+        path = write(tmp_path, "bad.webvtt", text.encode("utf-8"))
+        with pytest.raises(MalformedFileError):
+            list(read_cues(path, reader))
+
+    @pytest.mark.parametrize("reader", ["fast", "mmap"])
+    def test_invalid_timestamp(self, tmp_path, reader):
+        text = "WEBVTT\n\n00:00:61.000 --> 00:01:02.000\nToo many seconds\n"
+        path = write(tmp_path, "bad.webvtt", text.encode("utf-8"))
+        with pytest.raises(webvtt.errors.MalformedCaptionError):
+            list(read_cues(path, reader))
+
+
+class TestPrepareOutput:
+    """
+    Prepare output is the same with every reader.
+    """
+
+    def prepared(self, files: list[str], folder, reader: str) -> list[str]:
+        outputs = []
+        for file in files:
+            copy = os.path.join(folder, reader, os.path.basename(file))
+            os.makedirs(os.path.dirname(copy), exist_ok=True)
+            shutil.copyfile(file, copy)
+            with open(process_vtt(copy, MagicMock(), reader), encoding="utf-8") as f:
+                outputs.append(f.read())
+        return outputs
+
+    @pytest.mark.parametrize("seed", range(3))
+    def test_benchmark_corpus(self, tmp_path, seed):
+        spec = CorpusSpec(seed=seed, files=4, min_cues=50, max_cues=300)
+        files = generate_corpus(str(tmp_path / "corpus"), spec)
+        expected = self.prepared(files, tmp_path, "webvtt")
+        assert self.prepared(files, tmp_path, "fast") == expected
+        assert self.prepared(files, tmp_path, "mmap") == expected
+
+    def test_samples(self, tmp_path):
+        expected = self.prepared(SAMPLES, tmp_path, "webvtt")
+        assert self.prepared(SAMPLES, tmp_path, "fast") == expected
+        assert self.prepared(SAMPLES, tmp_path, "mmap") == expected
@@ -0,0 +1,59 @@
+from helpers.roundtrip import compare, normalize, prepared_text, process_vtt, write_report
+from helpers.preprocess import process_vtt as prepare
+from helpers.reader import Cue, read_cues
+from unittest.mock import MagicMock
+import glob
+import json
+import os
+import shutil
+import pytest
+
+SAMPLES = sorted(
+    glob.glob(os.path.join(os.path.dirname(__file__), "..", "..", "tests", "*.webvtt"))
+)
+
+
+def cue(start: str, end: str, *lines: str) -> Cue:
+    return Cue(None, start, end, list(lines))
+
+
+class TestRoundtrip:
+    @pytest.mark.parametrize("sample", SAMPLES)
+    def test_prepared_text_matches_prepare(self, tmp_path, sample):
+        file = shutil.copyfile(sample, tmp_path / os.path.basename(sample))
+        with open(prepare(str(file), MagicMock()), encoding="utf-8") as f:
+            assert prepared_text(read_cues(str(file))) == f.read()
+
+    @pytest.mark.parametrize("sample", SAMPLES)
+    def test_samples_are_lossless_and_nothing_is_written(self, tmp_path, sample):
+        file = shutil.copyfile(sample, tmp_path / os.path.basename(sample))
+        assert process_vtt(str(file), MagicMock()) == []
+        assert os.listdir(tmp_path) == [os.path.basename(sample)]
+
+    def test_normalize(self):
+        assert normalize("-Hello\n-BOB: Hi  there") == "- Hello BOB: Hi there"
+
+    def test_compare(self):
+        original = [
+            cue("00:00:01.000", "00:00:02.000", "One."),
+            cue("00:00:02.000", "00:00:03.000", "Two."),
+        ]
+        roundtrip = [
+            cue("00:00:01.000", "00:00:02.500", "One."),
+        ]
+        assert compare(original, roundtrip) == [
+            {"field": "cues", "original": 2, "roundtrip": 1},
+            {"cue": 0, "field": "end", "original": "00:00:02.000", "roundtrip": "00:00:02.500"},
+        ]
+        assert compare(original, original) == []
+
+    def test_write_report(self, tmp_path):
+        mismatch = {"cue": 0, "field": "text", "original": "a", "roundtrip": "b"}
+        path = tmp_path / "report.json"
+        assert write_report(str(path), {"b.webvtt": [mismatch], "a.webvtt": []}) == 1
+        report = json.loads(path.read_text(encoding="utf-8"))
+        assert report == {
+            "files": 2,
+            "mismatched_files": 1,
+            "mismatches": {"b.webvtt": [mismatch]},
+        }
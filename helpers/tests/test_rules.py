@@ -0,0 +1,100 @@
+from helpers import cache, manifest, rules
+from helpers.api import finalize_text, prepare_text, prepare_texts
+import pickle
+import pytest
+
+DOCUMENT = """WEBVTT
+
+00:00:01.000 --> 00:00:02.000
+– joe: Where were you?
+– ann: Out
+
+00:00:03.000 --> 00:00:04.000
+* music *
+"""
+
+
+@pytest.fixture
+def custom():
+    configured = rules.Rules(
+        {
+            "speaker_dash": "[-–](?![-–])",
+            "speaker_name": "[a-z]+",
+            "sound": r"^ *\*.*\* *$",
+            "line_length": 20,
+        }
+    )
+    rules.configure(configured)
+    yield configured
+    rules.configure()
+
+
+class TestRules:
+    def test_defaults(self):
+        assert rules.Rules().settings == rules.DEFAULTS
+        assert rules.Rules().version == rules.Rules({}).version
+
+    def test_version_follows_settings(self):
+        other = rules.Rules({"line_length": 42})
+        assert other.version != rules.Rules().version
+        assert rules.Rules({"line_length": 42}).version == other.version
+
+    def test_pickled_as_settings(self):
+        other = rules.Rules({"speaker_name": "[A-Za-z]+"})
+        copy = pickle.loads(pickle.dumps(other))
+        assert copy.version == other.version
+        assert copy.speaker.pattern == other.speaker.pattern
+
+    def test_unknown_rule(self):
+        with pytest.raises(ValueError, match="speaker_names"):
+            rules.Rules({"speaker_names": "[a-z]+"})
+
+    def test_invalid_pattern(self):
+        with pytest.raises(ValueError, match="Invalid rule pattern"):
+            rules.Rules({"sound": "[unclosed"})
+
+    def test_load(self, tmp_path):
+        path = tmp_path / "rules.json"
+        path.write_text('{"punctuation": "!?.♪…"}', encoding="utf-8")
+        assert rules.load(str(path)).punctuation == tuple("!?.♪…")
+        assert rules.load(None).version == rules.Rules().version
+        path.write_text("[]", encoding="utf-8")
+        with pytest.raises(ValueError):
+            rules.load(str(path))
+
+    def test_custom_rules(self, custom):
+        prepared = prepare_text(DOCUMENT)
+        assert "⎡⎡Speaker joe:⎦⎦ Where were you?" in prepared
+        assert "⎡⎡Speaker ann:⎦⎦ Out" in prepared
+        # A sound gets a line of its own
+        assert "Out\n⎡⎡00:00:03.000 --> 00:00:04.000⎦⎦ * music * \n" in prepared
+        final = finalize_text(prepared)
+        assert "- joe: Where were\nyou?\n- ann: Out\n" in final
+
+    def test_default_rules_do_not_see_custom_speakers(self):
+        prepared = prepare_text(DOCUMENT)
+        assert "Speaker" not in prepared
+        assert "Out ⎡⎡00:00:03.000" in prepared
+
+    def test_workers_get_the_rules(self, custom):
+        assert prepare_texts([DOCUMENT] * 2, workers=2) == [prepare_text(DOCUMENT)] * 2
+
+    def test_versions_depend_on_rules(self, tmp_path):
+        source = str(tmp_path / "module.py")
+        with open(source, "w", encoding="utf-8") as f:
+            f.write("RULES = 1\n")
+        before = (cache.rules_version(source), manifest.tool_version("prepare"))
+        rules.configure(rules.Rules({"line_length": 42}))
+        try:
+            after = (cache.rules_version(source), manifest.tool_version("prepare"))
+        finally:
+            rules.configure()
+        assert before[0] != after[0]
+        assert before[1] != after[1]
+
+    def test_configure_clears_cached_results(self, custom):
+        prepared = prepare_text(DOCUMENT)
+        rules.configure()
+        assert prepare_text(DOCUMENT) != prepared
+        rules.configure(custom)
+        assert prepare_text(DOCUMENT) == prepared
@@ -0,0 +1,95 @@
+from helpers import scheduler
+from concurrent.futures import Future, ThreadPoolExecutor
+from unittest.mock import MagicMock
+import pytest
+
+
+class TestRunWindow:
+    def test_in_flight_is_bounded(self):
+        submitted, done = [], []
+        with ThreadPoolExecutor(max_workers=8) as pool:
+
+            def submit(file):
+                submitted.append(file)
+                assert len(submitted) - len(done) <= 3
+                return pool.submit(str.upper, file)
+
+            scheduler.run_window(
+                (f"file{n}" for n in range(50)),
+                submit,
+                lambda file, future: done.append(future.result()),
+                3,
+            )
+        assert sorted(done) == sorted(f"FILE{n}" for n in range(50))
+
+    def test_window_needs_room(self):
+        submit = MagicMock()
+        with pytest.raises(ValueError):
+            scheduler.run_window(["a"], submit, MagicMock(), 0)
+        submit.assert_not_called()
+
+    def test_error_cancels_pending(self):
+        failed = Future()
+        failed.set_exception(ValueError("broken"))
+        waiting = Future()
+        futures = iter([failed, waiting])
+        with pytest.raises(ValueError):
+            scheduler.run_window(
+                ["a", "b", "c"],
+                lambda file: next(futures),
+                lambda file, future: future.result(),
+                2,
+            )
+        assert waiting.cancelled()
+
+
+class TestDiscovery:
+    def test_sizes(self, tmp_path):
+        files = []
+        for n in range(3):
+            path = tmp_path / f"{n}.webvtt"
+            path.write_bytes(b"x" * (n + 1) * 10)
+            files.append(str(path))
+        discovery = scheduler.Discovery(files, ahead=1)
+        assert list(discovery) == files
+        assert discovery.complete
+        assert (discovery.found, discovery.found_bytes) == (3, 60)
+        assert discovery.finished(files[2]) == 30
+        # Forgotten once done
+        assert discovery.finished(files[2]) == 0
+
+    def test_error_reaches_consumer(self):
+        def walk():
+            yield "missing.webvtt"
+            raise OSError("walk failed")
+
+        with pytest.raises(OSError, match="walk failed"):
+            list(scheduler.Discovery(walk()))
+
+    def test_stop(self):
+        def endless():
+            while True:
+                yield "missing.webvtt"
+
+        discovery = scheduler.Discovery(endless(), ahead=2)
+        assert next(iter(discovery)) == "missing.webvtt"
+        discovery.stop()
+        assert not discovery._thread.is_alive()
+
+
+class TestProgress:
+    def test_byte_weighted_and_throttled(self, tmp_path):
+        small, large = tmp_path / "small.webvtt", tmp_path / "large.webvtt"
+        small.write_bytes(b"x" * 100)
+        large.write_bytes(b"x" * 300)
+        discovery = scheduler.Discovery([str(small), str(large)])
+        files = list(discovery)
+        bar = MagicMock()
+        progress = scheduler.Progress(discovery, bar, interval=3600)
+        progress.advance(files[0])
+        progress.advance(files[1])
+        # The second update falls within the interval
+        bar.assert_called_once_with(0.25)
+        progress.show()
+        bar.assert_called_with(1.0)
+        assert bar.text.call_args.args[0].startswith("2/2 files")
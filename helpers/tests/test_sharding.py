@@ -0,0 +1,75 @@
+from helpers import sharding
+from helpers.executor import FileResult
+import pytest
+
+
+@pytest.fixture
+def files(tmp_path):
+    paths = []
+    # One feature-length file and many episodes
+    for name, size in [("feature", 9000), *((f"episode{i}", 1000) for i in range(12))]:
+        path = tmp_path / f"{name}.webvtt"
+        path.write_text("x" * size, encoding="utf-8")
+        paths.append(str(path))
+    return paths
+
+
+def shard_result(files, root, index, count, shards=None):
+    shards = shards or sharding.assign(files, count, root)
+    results = {
+        file: FileResult(file, None, seconds=0.5)
+        for file, shard in shards.items()
+        if shard == index
+    }
+    path = sharding.result_path(root, "roundtrip", index, count)
+    return sharding.write_result(path, "roundtrip", index, count, root, shards, results, 1.0)
+
+
+class TestSharding:
+    def test_parse(self):
+        assert sharding.parse("2/4") == (2, 4)
+        for value in ("0/4", "5/4", "2", "a/b"):
+            with pytest.raises(ValueError):
+                sharding.parse(value)
+
+    def test_assign_balances_bytes(self, files, tmp_path):
+        shards = sharding.assign(files, 2, str(tmp_path))
+        loads = {1: 0, 2: 0}
+        for file, shard in shards.items():
+            loads[shard] += len(open(file).read())
+        # By file count the feature would come on top of half the episodes
+        assert sorted(loads.values()) == [10000, 11000]
+
+    def test_assign_is_deterministic(self, files, tmp_path):
+        shards = sharding.assign(files, 3, str(tmp_path))
+        assert sharding.assign(reversed(files), 3, str(tmp_path)) == shards
+        assert set(shards.values()) == {1, 2, 3}
+
+    def test_merge(self, files, tmp_path):
+        root = str(tmp_path)
+        results = [shard_result(files, root, index, 2) for index in (1, 2)]
+        report = sharding.merge(results)
+        assert report["files"] == report["processed"] == len(files)
+        assert report["problems"] == []
+        assert report["imbalance"] == pytest.approx(11000 / 10500, abs=0.001)
+        assert sorted(sharding.find_results(root)["roundtrip"]) == [
+            sharding.result_path(root, "roundtrip", index, 2) for index in (1, 2)
+        ]
+
+    def test_merge_flags_missing_and_duplicated(self, files, tmp_path):
+        root = str(tmp_path)
+        first = shard_result(files, root, 1, 3)
+        # A node that saw every file in its own shard
+        everything = shard_result(files, root, 2, 3, dict.fromkeys(files, 2))
+        report = sharding.merge([first, everything])
+        assert report["missing_shards"] == [3]
+        assert len(report["duplicated"]) == len(first["files"])
+        assert report["files"] == len(files)
+        assert len(report["problems"]) == 2
+
+    def test_merge_flags_missing_files(self, files, tmp_path):
+        root = str(tmp_path)
+        results = [shard_result(files, root, index, 2) for index in (1, 2)]
+        results[1]["files"].popitem()
+        report = sharding.merge(results)
+        assert report["missing_files"] == 1
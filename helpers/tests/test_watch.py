@@ -0,0 +1,63 @@
+from helpers import watch
+from unittest.mock import MagicMock
+import os
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_watcher(tmp_path, clock):
+    return watch.Watcher(str(tmp_path), MagicMock(), settle=2.0, clock=clock)
+
+
+class TestWatcher:
+    def test_files_settle_before_they_are_handed_out(self, tmp_path):
+        clock = Clock()
+        watcher = make_watcher(tmp_path, clock)
+        dropped = tmp_path / "drop.webvtt"
+        dropped.write_text("WEBVTT\n", encoding="utf-8")
+        assert watcher.settled() == {}
+        clock.now = 1.0
+        # Still being copied
+        with open(dropped, "a", encoding="utf-8") as f:
+            f.write("\n00:00.000 --> 00:01.000\n")
+        assert watcher.settled() == {}
+        clock.now = 2.5
+        assert watcher.settled() == {}
+        clock.now = 3.0
+        assert list(watcher.settled()) == [str(dropped)]
+        # Handed out once
+        clock.now = 10.0
+        assert watcher.settled() == {}
+
+    def test_modified_and_removed_files(self, tmp_path):
+        clock = Clock()
+        watcher = make_watcher(tmp_path, clock)
+        dropped = tmp_path / "drop.webvtt"
+        dropped.write_text("WEBVTT\n", encoding="utf-8")
+        watcher.settled()
+        clock.now = 2.0
+        assert list(watcher.settled()) == [str(dropped)]
+        stat = os.stat(dropped)
+        os.utime(dropped, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+        clock.now = 3.0
+        assert watcher.settled() == {}
+        clock.now = 5.0
+        assert list(watcher.settled()) == [str(dropped)]
+        dropped.unlink()
+        assert watcher.settled() == {}
+        assert watcher.seen == {}
+
+    def test_outputs_are_not_watched(self, tmp_path):
+        clock = Clock()
+        watcher = make_watcher(tmp_path, clock)
+        (tmp_path / "prepared").mkdir()
+        (tmp_path / "prepared" / "drop.webvtt").write_text("WEBVTT\n", encoding="utf-8")
+        watcher.settled()
+        clock.now = 2.0
+        assert watcher.settled() == {}
@@ -0,0 +1,91 @@
+import os
+import time
+from typing import Callable, Final, Sequence
+from structlog import BoundLogger
+import helpers.discovery
+
+# Seconds between two scans of the watched folder
+POLL_INTERVAL: Final[float] = 1.0
+# Seconds the size and modification time of a file must stay the same
+# before it is processed, so files still being copied are left alone
+SETTLE: Final[float] = 2.0
+
+# Size and modification time of a file
+Signature = tuple[int, int]
+
+
+class Watcher:
+    """
+    New and modified files below a folder, handed out once they settle.
+
+    Every scan compares the size and modification time of the files with
+    the previous scan. A file is settled when they have not changed for
+    `settle` seconds; it is handed out again only when they change again.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        log: BoundLogger,
+        include: Sequence[str] = helpers.discovery.INCLUDE,
+        exclude: Sequence[str] = (),
+        prune: Sequence[str] = helpers.discovery.OUTPUT_DIRS,
+        settle: float = SETTLE,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.path = path
+        self.log = log
+        self.include = include
+        self.exclude = exclude
+        self.prune = prune
+        self.settle = settle
+        self.clock = clock
+        # Signatures of the files handed out
+        self.seen: dict[str, Signature] = {}
+        # Signature of the changing files, since when they have it
+        self.changing: dict[str, tuple[Signature, float]] = {}
+        # Wall time a change was first noticed, until the file is handed out
+        self.detected: dict[str, float] = {}
+
+    def scan(self) -> dict[str, Signature]:
+        if os.path.isdir(self.path):
+            files = helpers.discovery.walk(
+                self.path, self.log, self.include, self.exclude, self.prune
+            )
+        else:
+            files = [self.path]
+        signatures = {}
+        for file in files:
+            try:
+                stat = os.stat(file)
+            except OSError:
+                # Removed or renamed since the folder was listed
+                continue
+            signatures[file] = (stat.st_size, stat.st_mtime_ns)
+        return signatures
+
+    def settled(self) -> dict[str, float]:
+        """
+        Files that changed and then settled since the last call, with the
+        wall time their change was noticed.
+        """
+        now = self.clock()
+        current = self.scan()
+        ready = {}
+        for file, signature in current.items():
+            if self.seen.get(file) == signature:
+                continue
+            self.detected.setdefault(file, time.time())
+            previous = self.changing.get(file)
+            if previous is None or previous[0] != signature:
+                self.changing[file] = (signature, now)
+            elif now - previous[1] >= self.settle:
+                del self.changing[file]
+                self.seen[file] = signature
+                ready[file] = self.detected.pop(file)
+        for file in self.seen.keys() - current.keys():
+            del self.seen[file]
+        for file in self.changing.keys() - current.keys():
+            del self.changing[file]
+            self.detected.pop(file, None)
+        return ready
@@ -1,79 +1,852 @@
 import argparse
-from typing import List
-import glob
+import contextlib
+import signal
+import sys
+import threading
+import time
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator, Optional, Sequence
 import os
+import helpers.cache
+import helpers.chunking
+import helpers.discovery
+import helpers.executor
+import helpers.failures
+import helpers.formats
+import helpers.journal
 import helpers.logging
+import helpers.manifest
+import helpers.pipeline
 import helpers.postprocess
 import helpers.preprocess
-import threading
-from concurrent.futures import ThreadPoolExecutor, as_completed
-import alive_progress
+import helpers.profiling
+import helpers.reader
+import helpers.roundtrip
+import helpers.rules
+import helpers.scheduler
+import helpers.sharding
+import helpers.watch
+from structlog import BoundLogger
 
-MAX_CONCURRENT = 4  # Adjust as needed
 
+def parse_formats(value: str) -> tuple[str, ...]:
+    try:
+        return helpers.formats.parse(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e)) from e
 
-def process_with_semaphore(func, vtt_file, log, semaphore):
-    with semaphore:
-        func(vtt_file, log)
 
+def parse_positive(value: str) -> int:
+    try:
+        number = int(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(f"{value} is not a number") from e
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"{value} is not at least 1")
+    return number
 
-def main():
+
+def parse_shard(value: str) -> tuple[int, int]:
+    try:
+        return helpers.sharding.parse(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e)) from e
+
+
+def build_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(description="Process .webvtt files.")
     parser.add_argument(
         "path", help="Path to the file, or folder containing .webvtt files"
     )
     parser.add_argument(
-        "action", help="What to do with the files", choices={"prepare", "finalize"}
+        "action",
+        help="What to do with the files, roundtrip checks prepare and finalize in "
+        "memory, merge combines the shard results saved in path into a report",
+        choices={"prepare", "finalize", "roundtrip", "merge"},
     )
-    args = parser.parse_args()
-    log = helpers.logging.create_log(args.action)
-    path = args.path
-    log.info("Starting", action=args.action, path=path)
-    files: List[str] = []
+    parser.add_argument(
+        "--executor",
+        help="Run files on threads, worker processes or an async read/write pipeline",
+        choices=helpers.executor.EXECUTORS,
+        default="thread",
+    )
+    parser.add_argument(
+        "--workers",
+        help="Number of files processed concurrently (default: CPU count)",
+        type=int,
+        default=helpers.executor.default_workers(),
+    )
+    parser.add_argument(
+        "--read-ahead",
+        help="Files the async executor reads ahead of the workers (default: 8)",
+        type=parse_positive,
+        default=helpers.pipeline.READ_AHEAD,
+    )
+    parser.add_argument(
+        "--write-behind",
+        help="Outputs the async executor holds while they are written (default: 8)",
+        type=parse_positive,
+        default=helpers.pipeline.WRITE_BEHIND,
+    )
+    parser.add_argument(
+        "--in-flight",
+        help="Files submitted to the workers at a time by the thread and process "
+        "executors (default: 4 per worker)",
+        type=parse_positive,
+    )
+    parser.add_argument(
+        "--chunk-size",
+        help="Split larger files into chunks of cues for the workers, in bytes "
+        "(default: 524288, 0 never splits)",
+        type=int,
+        default=helpers.chunking.CHUNK_SIZE,
+    )
+    parser.add_argument(
+        "--formats",
+        help="Comma separated formats finalize writes from a single parse, "
+        f"of {', '.join(helpers.formats.FORMATS)} (default: vtt)",
+        type=parse_formats,
+        default=helpers.formats.DEFAULT_FORMATS,
+    )
+    parser.add_argument(
+        "--force",
+        help="Process files even if the manifest shows their outputs are current",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--watch",
+        help="Keep running and process files dropped into path as they settle",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--poll-interval",
+        help="Seconds between two scans of path in watch mode (default: 1)",
+        type=float,
+        default=helpers.watch.POLL_INTERVAL,
+    )
+    parser.add_argument(
+        "--settle",
+        help="Seconds a file must stay unchanged before watch mode processes it "
+        "(default: 2)",
+        type=float,
+        default=helpers.watch.SETTLE,
+    )
+    parser.add_argument(
+        "--resume",
+        help="Skip the files an interrupted run completed, as its journal lists them",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--profile",
+        help="Log wall and CPU time of every processing stage",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--memprofile",
+        help="Log the peak memory of every file and stage and report the heaviest "
+        "files at the end, processing is several times slower; with the thread "
+        "executor only with --workers 1",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--reader",
+        help="WebVTT parser used by prepare (default: fast)",
+        choices=helpers.reader.READERS,
+        default="fast",
+    )
+    parser.add_argument(
+        "--cache-size",
+        help="Cue texts cached for repeats, per process (default: 16384, 0 turns it off)",
+        type=int,
+        default=helpers.cache.DEFAULT_SIZE,
+    )
+    parser.add_argument(
+        "--cache-dir",
+        help="Load and save the cache in this folder, to share it across runs",
+    )
+    parser.add_argument(
+        "--rules",
+        help="JSON file changing the speaker, sound, punctuation and line length rules",
+    )
+    parser.add_argument(
+        "--log-level",
+        help="Least severe events written to the log (default: info)",
+        choices=helpers.logging.LEVELS,
+        default="info",
+    )
+    parser.add_argument(
+        "--log-queue",
+        help="Events queued for the log writer thread of each process (default: 10000)",
+        type=int,
+        default=helpers.logging.QUEUE_SIZE,
+    )
+    parser.add_argument(
+        "--log-overflow",
+        help="When the log queue is full, wait for the writer or drop the event "
+        "(default: block)",
+        choices=helpers.logging.OVERFLOW,
+        default="block",
+    )
+    parser.add_argument(
+        "--report",
+        help="Where roundtrip writes its mismatches and merge its run report "
+        "(default: <action>_report.json)",
+    )
+    parser.add_argument(
+        "--shard",
+        help="Only process shard i of N, files are assigned to shards by their "
+        "size and path so every node gets a share of the input bytes",
+        metavar="i/N",
+        type=parse_shard,
+    )
+    parser.add_argument(
+        "--include",
+        help="Only process files matching this glob (repeatable, default: *.webvtt)",
+        action="append",
+    )
+    parser.add_argument(
+        "--exclude",
+        help="Skip files and folders matching this glob (repeatable)",
+        action="append",
+        default=[],
+    )
+    parser.add_argument(
+        "--include-outputs",
+        help="Also search the prepared and final output folders",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--keep-going",
+        help="Keep processing when files fail and list the failures in a summary",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--failures",
+        help="Where --keep-going writes the failed files (default: <action>_failures.json)",
+    )
+    parser.add_argument(
+        "--retry",
+        help="Process the files listed in this failure summary instead of searching path",
+        metavar="SUMMARY",
+    )
+    return parser
+
+
+def collect_files(
+    path: str,
+    log: BoundLogger,
+    include: Sequence[str] = helpers.discovery.INCLUDE,
+    exclude: Sequence[str] = (),
+    prune: Sequence[str] = helpers.discovery.OUTPUT_DIRS,
+) -> Iterable[str]:
+    """
+    The file at `path`, or the files found below it as the folder is walked.
+    """
     if os.path.isfile(path):
-        files.append(path)
-    elif os.path.isdir(path):
-        pattern = os.path.join(path, "**", "*.webvtt")
-        files.extend(glob.glob(pattern, recursive=True))
-    else:
-        log.exception("Invalid path", path=path)
-        raise Exception(f"Path {path} is not valid.")
-
-    semaphore = threading.Semaphore(MAX_CONCURRENT)
-    executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT)
-    futures = []
-
-    if args.action == "prepare":
-        for vtt_file in files:
-            futures.append(
-                executor.submit(
-                    process_with_semaphore,
-                    helpers.preprocess.process_vtt,
-                    vtt_file,
-                    log,
-                    semaphore,
-                )
-            )
-    if args.action == "finalize":
-        for vtt_file in files:
-            futures.append(
-                executor.submit(
-                    process_with_semaphore,
-                    helpers.postprocess.process_vtt,
-                    vtt_file,
+        return [path]
+    if os.path.isdir(path):
+        return helpers.discovery.walk(path, log, include, exclude, prune)
+    log.exception("Invalid path", path=path)
+    raise Exception(f"Path {path} is not valid.")
+
+
+def check_memprofile(
+    executor: str, workers: int, memprofile: bool, log: BoundLogger
+) -> None:
+    """
+    Refuse memory profiling of files running on several threads of a process.
+
+    The tracemalloc peak belongs to the process, a file starting a stage
+    resets the peak another file is measuring, so peaks of files on
+    threads are wrong both ways.
+    """
+    if memprofile and executor == "thread" and workers > 1:
+        log.error("Invalid memprofile", executor=executor, workers=workers)
+        raise Exception(
+            "--memprofile needs the process or async executor, or --workers 1."
+        )
+
+
+def setup(
+    profile: bool = False,
+    memprofile: bool = False,
+    reader: str = "fast",
+    formats: Sequence[str] = helpers.formats.DEFAULT_FORMATS,
+    rules: Optional[helpers.rules.Rules] = None,
+    cache_size: int = helpers.cache.DEFAULT_SIZE,
+    cache_dir: Optional[str] = None,
+) -> None:
+    """
+    Configure profiling, the reader, formats, rules and caches of this process.
+
+    Clears the caches, then loads those saved in `cache_dir`.
+    """
+    helpers.profiling.configure(profile, memprofile)
+    helpers.reader.configure(reader)
+    helpers.formats.configure(formats)
+    helpers.rules.configure(rules)
+    helpers.cache.configure(cache_size, cache_dir)
+
+
+def run(
+    files: Iterable[str],
+    action: str,
+    log: BoundLogger,
+    executor: str = "thread",
+    workers: int = 1,
+    profile: bool = False,
+    reader: str = "fast",
+    keep_going: bool = False,
+    read_ahead: int = helpers.pipeline.READ_AHEAD,
+    write_behind: int = helpers.pipeline.WRITE_BEHIND,
+    cache_size: int = helpers.cache.DEFAULT_SIZE,
+    cache_dir: Optional[str] = None,
+    chunk_size: int = helpers.chunking.CHUNK_SIZE,
+    memprofile: bool = False,
+    rules: Optional[helpers.rules.Rules] = None,
+    formats: Sequence[str] = helpers.formats.DEFAULT_FORMATS,
+    journal: Optional[helpers.journal.Journal] = None,
+    in_flight: Optional[int] = None,
+    pool: Optional[Executor] = None,
+    done: Optional[Callable[[helpers.executor.FileResult], None]] = None,
+) -> dict[str, helpers.executor.FileResult]:
+    """
+    Run `action` over `files` and return the result of every file.
+
+    Files are submitted as `files` yields them, so workers start before a
+    folder walk is finished; at most `in_flight` files (by default
+    `IN_FLIGHT_PER_WORKER` per worker) are in flight at a time, the next
+    is submitted as one completes. Progress is weighted by file size.
+    Files larger than `chunk_size` bytes are split into chunks of cues for
+    several workers; finalize writes each of `formats`.
+    The first failing file stops the run, unless `keep_going` is set, then
+    failures are returned in the results. Every completed file is added to
+    `journal` as soon as it is done, and passed to `done`. Workers run in
+    `pool` when given, which is left running for the next call; the caller
+    then calls `setup` once, so the caches stay warm between calls.
+    """
+    check_memprofile(executor, workers, memprofile, log)
+    results: dict[str, helpers.executor.FileResult] = {}
+    summary = helpers.profiling.Summary()
+    # Latest cache counters of every process
+    caches: dict[int, dict[str, dict[str, int]]] = {}
+    if pool is None:
+        setup(profile, memprofile, reader, formats, rules, cache_size, cache_dir)
+
+    def finished(result: helpers.executor.FileResult) -> None:
+        results[result.file] = result
+        for pid, snapshot in result.caches.items():
+            caches[pid] = helpers.cache.latest(caches.get(pid), snapshot)
+        if result.failure:
+            log.error("File failed", **result.failure)
+        else:
+            summary.add(result.profile, result.file)
+            if journal is not None:
+                journal.add(result)
+        if done is not None:
+            done(result)
+        progress.advance(result.file)
+
+    def completed(vtt_file: str, future) -> None:
+        try:
+            # Will raise exceptions if any occurred in the workers
+            result = future.result()
+        except Exception as e:
+            if not keep_going:
+                log.error("Worker failed", file=vtt_file, error=str(e))
+                raise
+            # The worker died, or its result could not be sent back
+            failure = helpers.failures.failure(action, vtt_file, None, e)
+            result = helpers.executor.FileResult(vtt_file, None, failure=failure)
+        finished(result)
+
+    discovery = helpers.scheduler.Discovery(files)
+    try:
+        with helpers.scheduler.progress_bar() as bar:
+            progress = helpers.scheduler.Progress(discovery, bar)
+            if executor == "async":
+                # Bounded by the read-ahead and write-behind queues of the pipeline
+                helpers.pipeline.run(
+                    discovery,
+                    action,
                     log,
-                    semaphore,
+                    finished,
+                    workers=workers,
+                    profile=profile,
+                    reader=reader,
+                    keep_going=keep_going,
+                    read_ahead=read_ahead,
+                    write_behind=write_behind,
+                    cache_size=cache_size,
+                    cache_dir=cache_dir,
+                    chunk_size=chunk_size,
+                    memprofile=memprofile,
+                    rules=rules,
+                    formats=formats,
+                    pool=pool,
                 )
-            )
-    with alive_progress.alive_bar(
-        len(futures), title="Processing files", enrich_print=False
-    ) as bar:
-        for future in as_completed(futures):
-            # Will raise exceptions if any occurred in the worker threads
-            future.result()
-            bar()
+            else:
+                with (
+                    contextlib.nullcontext(pool)
+                    if pool is not None
+                    else helpers.executor.create_executor(
+                        executor,
+                        workers,
+                        action,
+                        profile=profile,
+                        reader=reader,
+                        cache_size=cache_size,
+                        cache_dir=cache_dir,
+                        memprofile=memprofile,
+                        rules=rules,
+                        formats=formats,
+                        log=log if keep_going else None,
+                    )
+                ) as pool, ThreadPoolExecutor(
+                    # Reads and writes the files split in chunks
+                    max_workers=1,
+                    thread_name_prefix="chunk-io",
+                ) as io:
+
+                    def submit(vtt_file: str) -> Future:
+                        def whole() -> Future:
+                            return helpers.executor.submit(
+                                pool, executor, action, vtt_file, log, keep_going
+                            )
+
+                        return (
+                            helpers.pipeline.submit_chunked(
+                                pool,
+                                io,
+                                action,
+                                vtt_file,
+                                log,
+                                whole,
+                                keep_going=keep_going,
+                                chunk_size=chunk_size,
+                            )
+                            or whole()
+                        )
+
+                    helpers.scheduler.run_window(
+                        discovery,
+                        submit,
+                        completed,
+                        (
+                            in_flight
+                            if in_flight is not None
+                            else workers * helpers.scheduler.IN_FLIGHT_PER_WORKER
+                        ),
+                    )
+            progress.show()
+    finally:
+        discovery.stop()
+    # Worker processes save theirs when the pool shuts them down
+    helpers.cache.save()
+    for name, counters in helpers.cache.total(caches.values()).items():
+        if counters["hits"] or counters["misses"]:
+            log.info("Cache", name=name, **counters)
+    if profile or memprofile:
+        log.info("Profile summary", **summary.fields())
+    if memprofile:
+        files, sites = summary.memory_report()
+        for rank, entry in enumerate(files, 1):
+            log.info("Heaviest file", rank=rank, **entry)
+        for rank, site in enumerate(sites, 1):
+            log.info("Allocation site", rank=rank, **site)
+    return results
+
+
+def report_failures(
+    results: dict[str, helpers.executor.FileResult],
+    args: argparse.Namespace,
+    log: BoundLogger,
+) -> int:
+    """
+    Write the failure summary of a --keep-going run, return the failure count.
+    """
+    if not args.keep_going:
+        return 0
+    failures = [result.failure for result in results.values() if result.failure]
+    path = args.failures or f"{args.action}_failures.json"
+    helpers.failures.write_summary(path, args.action, len(results), failures)
+    log.info("Failures", files=len(results), failed=len(failures), summary=path)
+    return len(failures)
+
+
+def load_rules(path: Optional[str], log: BoundLogger) -> helpers.rules.Rules:
+    """
+    The rules of the file at `path`, compiled once for the whole run.
+    """
+    try:
+        rules = helpers.rules.load(path)
+    except (OSError, ValueError) as e:
+        log.exception("Invalid rules", rules=path, error=str(e))
+        raise Exception(f"Rules {path} are not valid.") from e
+    # Before the manifest, its tool version depends on the rules
+    helpers.rules.configure(rules)
+    return rules
+
+
+def shard_files(
+    files: Iterable[str], args: argparse.Namespace, log: BoundLogger
+) -> tuple[Iterable[str], Optional[dict[str, int]]]:
+    """
+    The files of the shard of this run and the shard of every file found.
+
+    Every file has to be found before it is assigned, so the run only starts
+    once the folder walk is finished.
+    """
+    if not args.shard:
+        return files, None
+    index, count = args.shard
+    files = list(files)
+    shards = helpers.sharding.assign(files, count, helpers.manifest.run_dir(args.path))
+    files = [file for file in files if shards[file] == index]
+    log.info(
+        "Shard",
+        shard=index,
+        shards=count,
+        files=len(files),
+        found=len(shards),
+        bytes=sum(os.path.getsize(file) for file in files),
+    )
+    return files, shards
+
+
+def save_shard(
+    args: argparse.Namespace,
+    log: BoundLogger,
+    shards: Optional[dict[str, int]],
+    results: dict[str, helpers.executor.FileResult],
+    started: float,
+) -> None:
+    if shards is None:
+        return
+    index, count = args.shard
+    root = helpers.manifest.run_dir(args.path)
+    path = helpers.sharding.result_path(root, args.action, index, count)
+    helpers.sharding.write_result(
+        path,
+        args.action,
+        index,
+        count,
+        root,
+        shards,
+        results,
+        time.perf_counter() - started,
+    )
+    log.info("Shard result", shard=index, shards=count, result=path)
+
+
+def merge_shards(args: argparse.Namespace, log: BoundLogger) -> None:
+    folder = helpers.manifest.run_dir(args.path)
+    found = helpers.sharding.find_results(folder)
+    if not found:
+        log.error("No shard results", folder=folder)
+        raise Exception(f"No shard results in {folder}.")
+    reports = {}
+    for action, paths in found.items():
+        try:
+            results = [helpers.sharding.load_result(path) for path in paths]
+        except (OSError, ValueError) as e:
+            log.exception("Invalid shard result", action=action, error=str(e))
+            raise Exception(f"Shard results of {action} are not valid.") from e
+        report = helpers.sharding.merge(results)
+        reports[action] = report
+        log.info(
+            "Shards merged",
+            action=action,
+            shards=report["shards"],
+            files=report["files"],
+            failed=report["failed"],
+            imbalance=report["imbalance"],
+        )
+        for problem in report["problems"]:
+            log.warning("Shard problem", action=action, problem=problem)
+    path = args.report or f"{args.action}_report.json"
+    helpers.sharding.write_report(path, reports)
+    log.info("Done.", report=path)
+    if any(report["problems"] or report["failed"] for report in reports.values()):
+        sys.exit(1)
+
+
+def check_roundtrip(
+    files: Iterable[str],
+    args: argparse.Namespace,
+    log: BoundLogger,
+    rules: Optional[helpers.rules.Rules] = None,
+    shards: Optional[dict[str, int]] = None,
+):
+    # Nothing is written, so the manifest is neither checked nor updated
+    started = time.perf_counter()
+    results = run(
+        files,
+        args.action,
+        log,
+        executor=args.executor,
+        workers=args.workers,
+        profile=args.profile,
+        reader=args.reader,
+        keep_going=args.keep_going,
+        read_ahead=args.read_ahead,
+        write_behind=args.write_behind,
+        cache_size=args.cache_size,
+        cache_dir=args.cache_dir,
+        chunk_size=args.chunk_size,
+        memprofile=args.memprofile,
+        rules=rules,
+        in_flight=args.in_flight,
+    )
+    save_shard(args, log, shards, results, started)
+    failed = report_failures(results, args, log)
+    report = args.report or f"{args.action}_report.json"
+    mismatched = helpers.roundtrip.write_report(
+        report,
+        {
+            vtt_file: result.output
+            for vtt_file, result in results.items()
+            if not result.failure
+        },
+    )
+    log.info(
+        "Roundtrip checked",
+        files=len(results),
+        mismatched_files=mismatched,
+        report=report,
+    )
+    log.info("Done.")
+    if mismatched or failed:
+        sys.exit(1)
+
+
+@contextlib.contextmanager
+def stop_on_sigterm(stopped: threading.Event) -> Iterator[None]:
+    """
+    Set `stopped` on SIGTERM instead of exiting, so the current drop finishes.
+    """
+    if threading.current_thread() is not threading.main_thread():
+        # Signal handlers can only be set from the main thread
+        yield
+        return
+    previous = signal.signal(signal.SIGTERM, lambda *args: stopped.set())
+    try:
+        yield
+    finally:
+        signal.signal(signal.SIGTERM, previous)
+
+
+def watch(
+    args: argparse.Namespace,
+    log: BoundLogger,
+    rules: Optional[helpers.rules.Rules],
+    stopped: Optional[threading.Event] = None,
+) -> None:
+    """
+    Process the files dropped into `args.path` until `stopped` is set, the
+    process is interrupted or terminated.
 
+    One worker pool stays up between drops. Files are processed once they
+    settle and only when the manifest shows their outputs are not current;
+    failing files are logged and do not stop the watch. The latency from
+    noticing a change to the finished output is logged for every file.
+    """
+    if args.action not in ("prepare", "finalize"):
+        log.error("Invalid watch action", action=args.action)
+        raise Exception(f"Watch mode does not support {args.action}.")
+    if not os.path.exists(args.path):
+        log.error("Invalid path", path=args.path)
+        raise Exception(f"Path {args.path} is not valid.")
+    check_memprofile(args.executor, args.workers, args.memprofile, log)
+    stopped = stopped or threading.Event()
+    # Once for the whole watch, every drop runs on the same caches
+    setup(
+        args.profile,
+        args.memprofile,
+        args.reader,
+        args.formats,
+        rules,
+        args.cache_size,
+        args.cache_dir,
+    )
+    manifest = helpers.manifest.Manifest.load(
+        helpers.manifest.run_dir(args.path), args.action
+    )
+    watcher = helpers.watch.Watcher(
+        args.path,
+        log,
+        args.include or helpers.discovery.INCLUDE,
+        args.exclude,
+        () if args.include_outputs else helpers.discovery.OUTPUT_DIRS,
+        args.settle,
+    )
+    dropped: dict[str, float] = {}
+
+    def done(result: helpers.executor.FileResult) -> None:
+        if result.failure:
+            return
+        manifest.record(result.file, result.output)
+        log.info(
+            "Dropped file processed",
+            file=result.file,
+            output=result.output,
+            latency=round(time.time() - dropped.pop(result.file), 3),
+        )
+
+    # The async pipeline runs its workers in processes as well
+    kind = "process" if args.executor == "async" else args.executor
+    with helpers.executor.create_executor(
+        kind,
+        args.workers,
+        args.action,
+        profile=args.profile,
+        reader=args.reader,
+        cache_size=args.cache_size,
+        cache_dir=args.cache_dir,
+        memprofile=args.memprofile,
+        rules=rules,
+        formats=args.formats,
+        log=log,
+    ) as pool, stop_on_sigterm(stopped):
+        log.info(
+            "Watching",
+            path=args.path,
+            poll_interval=args.poll_interval,
+            settle=args.settle,
+        )
+        try:
+            while True:
+                dropped.update(watcher.settled())
+                if dropped:
+                    try:
+                        run(
+                            manifest.pending(list(dropped), args.force),
+                            args.action,
+                            log,
+                            executor=args.executor,
+                            workers=args.workers,
+                            profile=args.profile,
+                            reader=args.reader,
+                            keep_going=True,
+                            read_ahead=args.read_ahead,
+                            write_behind=args.write_behind,
+                            cache_size=args.cache_size,
+                            cache_dir=args.cache_dir,
+                            chunk_size=args.chunk_size,
+                            memprofile=args.memprofile,
+                            rules=rules,
+                            formats=args.formats,
+                            in_flight=args.in_flight,
+                            pool=pool,
+                            done=done,
+                        )
+                    finally:
+                        # Failed and current files are not waited for again
+                        dropped.clear()
+                        manifest.save()
+                if stopped.wait(args.poll_interval):
+                    break
+        except KeyboardInterrupt:
+            pass
+    log.info("Watch stopped", hits=manifest.hits, misses=manifest.misses)
+
+
+def main():
+    args = build_parser().parse_args()
+    log = helpers.logging.create_log(
+        args.action,
+        helpers.logging.LogSettings(args.log_level, args.log_queue, args.log_overflow),
+    )
+    path = args.path
+    log.info("Starting", action=args.action, path=path)
+    if args.action == "merge":
+        merge_shards(args, log)
+        return
+    rules = load_rules(args.rules, log)
+    if args.rules:
+        log.info("Rules", rules=args.rules, version=rules.version)
+    if args.watch:
+        watch(args, log, rules)
+        return
+    if args.retry:
+        files = helpers.failures.load_files(args.retry)
+    else:
+        files = collect_files(
+            path,
+            log,
+            args.include or helpers.discovery.INCLUDE,
+            args.exclude,
+            () if args.include_outputs else helpers.discovery.OUTPUT_DIRS,
+        )
+    files, shards = shard_files(files, args, log)
+    if args.action == "roundtrip":
+        check_roundtrip(files, args, log, rules, shards)
+        return
+    # Before the manifest, its finalize tool version depends on the formats
+    helpers.formats.configure(args.formats)
+    manifest = helpers.manifest.Manifest.load(
+        helpers.manifest.run_dir(path), args.action
+    )
+    journal = helpers.journal.Journal(
+        helpers.journal.journal_path(manifest.folder, args.action, args.shard),
+        manifest.tool,
+        manifest.hashes,
+    )
+    if args.resume:
+        journal.load(log)
+    resumed = dict(journal.entries)
+    journal.open()
+    started = time.perf_counter()
+    try:
+        results = run(
+            manifest.pending(
+                (vtt_file for vtt_file in files if vtt_file not in resumed),
+                args.force,
+            ),
+            args.action,
+            log,
+            executor=args.executor,
+            workers=args.workers,
+            profile=args.profile,
+            reader=args.reader,
+            keep_going=args.keep_going,
+            read_ahead=args.read_ahead,
+            write_behind=args.write_behind,
+            cache_size=args.cache_size,
+            cache_dir=args.cache_dir,
+            chunk_size=args.chunk_size,
+            memprofile=args.memprofile,
+            rules=rules,
+            formats=args.formats,
+            journal=journal,
+            in_flight=args.in_flight,
+        )
+    except BaseException:
+        # Kept for --resume
+        journal.close(complete=False)
+        raise
+    log.info(
+        "Manifest checked",
+        hits=manifest.hits,
+        misses=manifest.misses,
+        force=args.force,
+    )
+    for vtt_file, entry in resumed.items():
+        # Completed by the interrupted run, its input hashed back then
+        if "hash" in entry:
+            manifest.hashes[vtt_file] = entry["hash"]
+            manifest.record(vtt_file, entry["output"])
+    for vtt_file, result in results.items():
+        if not result.failure:
+            manifest.record(vtt_file, result.output)
+    manifest.save()
+    journal.close(complete=True)
+    save_shard(args, log, shards, results, started)
+    failed = report_failures(results, args, log)
     log.info("Done.")
+    # Only after every other file is done
+    if failed:
+        sys.exit(1)
 
 
 if __name__ == "__main__":
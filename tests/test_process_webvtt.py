@@ -1,19 +1,47 @@
 import pytest
 from unittest.mock import patch, MagicMock
-from process_webvtt import main
+from process_webvtt import build_parser, main, run, watch
 import webvtt
+import json
 import os
 import re
 import tempfile
 import shutil
-from helpers import preprocess, postprocess
+import signal
+import threading
+import time
+from helpers import cache, formats, manifest, preprocess, postprocess, profiling, rules
+import helpers.executor as helpers_executor
+import helpers.pipeline as helpers_pipeline
+import helpers.reader as helpers_reader
 import glob
 
 
+def make_args(path: str, action: str, *options: str):
+    # parse_args is patched in the tests, parse_known_args is not
+    args, _ = build_parser().parse_known_args([path, action, *options])
+    return args
+
+
+SAMPLES = sorted(glob.glob(os.path.join(os.path.dirname(__file__), "*.webvtt")))
+
+
+def copy_samples(folder) -> list[str]:
+    """
+    Copy the sample files into `folder` and return the paths of the copies.
+    """
+    files = []
+    for sample in SAMPLES:
+        target = folder / os.path.basename(sample)
+        shutil.copyfile(sample, target)
+        files.append(str(target))
+    return files
+
+
 class TestMain:
     @patch("process_webvtt.helpers.logging.create_log")
     @patch("process_webvtt.helpers.preprocess.process_vtt")
-    @patch("process_webvtt.glob.glob")
+    @patch("process_webvtt.helpers.discovery.walk")
     @patch("process_webvtt.os.path.isdir")
     @patch("process_webvtt.os.path.isfile")
     @patch("process_webvtt.argparse.ArgumentParser.parse_args")
@@ -22,14 +50,14 @@ class TestMain:
         mock_parse_args,
         mock_isfile,
         mock_isdir,
-        mock_glob,
+        mock_walk,
         mock_preprocess_vtt,
         mock_create_log,
     ):
         mock_logger = MagicMock()
         mock_create_log.return_value = mock_logger
         # Simulate single file, prepare action
-        mock_args = MagicMock(path="file.webvtt", action="prepare")
+        mock_args = make_args("file.webvtt", "prepare")
         mock_parse_args.return_value = mock_args
         mock_isfile.return_value = True
         mock_isdir.return_value = False
@@ -41,7 +69,7 @@ class TestMain:
 
     @patch("process_webvtt.helpers.logging.create_log")
     @patch("process_webvtt.helpers.postprocess.process_vtt")
-    @patch("process_webvtt.glob.glob")
+    @patch("process_webvtt.helpers.discovery.walk")
     @patch("process_webvtt.os.path.isdir")
     @patch("process_webvtt.os.path.isfile")
     @patch("process_webvtt.argparse.ArgumentParser.parse_args")
@@ -50,14 +78,14 @@ class TestMain:
         mock_parse_args,
         mock_isfile,
         mock_isdir,
-        mock_glob,
+        mock_walk,
         mock_postprocess_vtt,
         mock_create_log,
     ):
         mock_logger = MagicMock()
         mock_create_log.return_value = mock_logger
         # Simulate single file, finalize action
-        mock_args = MagicMock(path="file.webvtt", action="finalize")
+        mock_args = make_args("file.webvtt", "finalize")
         mock_parse_args.return_value = mock_args
         mock_isfile.return_value = True
         mock_isdir.return_value = False
@@ -69,7 +97,7 @@ class TestMain:
 
     @patch("process_webvtt.helpers.logging.create_log")
     @patch("process_webvtt.helpers.preprocess.process_vtt")
-    @patch("process_webvtt.glob.glob")
+    @patch("process_webvtt.helpers.discovery.walk")
     @patch("process_webvtt.os.path.isdir")
     @patch("process_webvtt.os.path.isfile")
     @patch("process_webvtt.argparse.ArgumentParser.parse_args")
@@ -78,18 +106,18 @@ class TestMain:
         mock_parse_args,
         mock_isfile,
         mock_isdir,
-        mock_glob,
+        mock_walk,
         mock_preprocess_vtt,
         mock_create_log,
     ):
         mock_logger = MagicMock()
         mock_create_log.return_value = mock_logger
         # Simulate directory with files, prepare action
-        mock_args = MagicMock(path="dir", action="prepare")
+        mock_args = make_args("dir", "prepare")
         mock_parse_args.return_value = mock_args
         mock_isfile.return_value = False
         mock_isdir.return_value = True
-        mock_glob.return_value = ["dir/a.webvtt", "dir/b.webvtt"]
+        mock_walk.return_value = ["dir/a.webvtt", "dir/b.webvtt"]
         main()
         mock_preprocess_vtt.assert_any_call("dir/a.webvtt", mock_logger)
         mock_preprocess_vtt.assert_any_call("dir/b.webvtt", mock_logger)
@@ -98,7 +126,7 @@ class TestMain:
 
     @patch("process_webvtt.helpers.logging.create_log")
     @patch("process_webvtt.helpers.postprocess.process_vtt")
-    @patch("process_webvtt.glob.glob")
+    @patch("process_webvtt.helpers.discovery.walk")
     @patch("process_webvtt.os.path.isdir")
     @patch("process_webvtt.os.path.isfile")
     @patch("process_webvtt.argparse.ArgumentParser.parse_args")
@@ -107,18 +135,18 @@ class TestMain:
         mock_parse_args,
         mock_isfile,
         mock_isdir,
-        mock_glob,
+        mock_walk,
         mock_postprocess_vtt,
         mock_create_log,
     ):
         mock_logger = MagicMock()
         mock_create_log.return_value = mock_logger
         # Simulate directory with files, finalize action
-        mock_args = MagicMock(path="dir", action="finalize")
+        mock_args = make_args("dir", "finalize")
         mock_parse_args.return_value = mock_args
         mock_isfile.return_value = False
         mock_isdir.return_value = True
-        mock_glob.return_value = ["dir/a.webvtt", "dir/b.webvtt"]
+        mock_walk.return_value = ["dir/a.webvtt", "dir/b.webvtt"]
         main()
         mock_postprocess_vtt.assert_any_call("dir/a.webvtt", mock_logger)
         mock_postprocess_vtt.assert_any_call("dir/b.webvtt", mock_logger)
@@ -134,7 +162,7 @@ class TestMain:
     ):
         mock_logger = MagicMock()
         mock_create_log.return_value = mock_logger
-        mock_args = MagicMock(path="invalid", action="prepare")
+        mock_args = make_args("invalid", "prepare")
         mock_parse_args.return_value = mock_args
         mock_isfile.return_value = False
         mock_isdir.return_value = False
@@ -144,6 +172,576 @@ class TestMain:
         assert "Path invalid is not valid." in str(excinfo.value)
 
 
+class TestExecutors:
+    samples = SAMPLES
+
+    def prepare_with(self, executor: str, folder) -> dict[str, str]:
+        files = copy_samples(folder)
+        return run(files, "prepare", MagicMock(), executor=executor, workers=2)
+
+    def test_process_matches_thread(self, tmp_path, monkeypatch):
+        # Worker processes append to prepare.jsonl in the working directory
+        monkeypatch.chdir(tmp_path)
+        (tmp_path / "thread").mkdir()
+        (tmp_path / "process").mkdir()
+        thread_results = self.prepare_with("thread", tmp_path / "thread")
+        process_results = self.prepare_with("process", tmp_path / "process")
+
+        assert len(process_results) == len(self.samples)
+        for source, result in process_results.items():
+            thread_source = str(tmp_path / "thread" / os.path.basename(source))
+            output, thread_output = result.output, thread_results[thread_source].output
+            with open(output, encoding="utf-8") as f, open(
+                thread_output, encoding="utf-8"
+            ) as g:
+                assert f.read() == g.read()
+
+    @pytest.mark.parametrize("action", ["prepare", "finalize"])
+    def test_async_matches_thread(self, tmp_path, monkeypatch, action):
+        monkeypatch.chdir(tmp_path)
+        outputs = {}
+        for executor in ("thread", "async"):
+            folder = tmp_path / executor
+            folder.mkdir()
+            files = copy_samples(folder)
+            if action == "finalize":
+                results = run(files, "prepare", MagicMock(), executor=executor)
+                files = [result.output for result in results.values()]
+            results = run(files, action, MagicMock(), executor=executor, workers=2)
+            outputs[executor] = {}
+            for result in results.values():
+                with open(result.output, "rb") as f:
+                    outputs[executor][os.path.basename(result.output)] = f.read()
+        assert len(outputs["async"]) == len(self.samples)
+        assert outputs["async"] == outputs["thread"]
+
+    @pytest.mark.parametrize("executor", helpers_executor.EXECUTORS)
+    @pytest.mark.parametrize("action", ["prepare", "finalize"])
+    def test_chunked_matches_whole_files(self, tmp_path, monkeypatch, executor, action):
+        monkeypatch.chdir(tmp_path)
+        outputs = {}
+        for chunk_size in (0, 200):
+            folder = tmp_path / str(chunk_size)
+            folder.mkdir()
+            files = copy_samples(folder)
+            if action == "finalize":
+                results = run(files, "prepare", MagicMock(), chunk_size=0)
+                files = [result.output for result in results.values()]
+            results = run(
+                files,
+                action,
+                MagicMock(),
+                executor=executor,
+                workers=2,
+                profile=True,
+                chunk_size=chunk_size,
+            )
+            outputs[chunk_size] = {}
+            for result in results.values():
+                assert result.profile["bytes_out"] > 0
+                with open(result.output, "rb") as f:
+                    outputs[chunk_size][os.path.basename(result.output)] = f.read()
+        assert len(outputs[200]) == len(self.samples)
+        assert outputs[200] == outputs[0]
+
+    @pytest.mark.parametrize("executor", ["process", "async"])
+    def test_profile_summary(self, tmp_path, monkeypatch, executor):
+        monkeypatch.chdir(tmp_path)
+        files = copy_samples(tmp_path)
+        log = MagicMock()
+        results = run(files, "prepare", log, executor=executor, workers=2, profile=True)
+        (call,) = [c for c in log.info.call_args_list if c.args == ("Profile summary",)]
+        summary = call.kwargs
+        assert summary["files"] == len(files)
+        assert summary["cues"] == sum(r.profile["cues"] for r in results.values())
+        assert summary["bytes_in"] == sum(os.path.getsize(f) for f in files)
+        assert summary["bytes_out"] == sum(
+            os.path.getsize(r.output) for r in results.values()
+        )
+
+    @pytest.mark.parametrize("executor", helpers_executor.EXECUTORS)
+    def test_rules_reach_the_workers(self, tmp_path, monkeypatch, executor):
+        monkeypatch.chdir(tmp_path)
+        source = tmp_path / "lowercase.webvtt"
+        source.write_text(
+            "WEBVTT\n\n00:00:01.000 --> 00:00:02.000\n-joe: Hi.\n-ann: Hello.\n",
+            encoding="utf-8",
+        )
+        lowercase = rules.Rules({"speaker_name": "[a-z]+"})
+        try:
+            results = run(
+                [str(source)], "prepare", MagicMock(), executor, 2, rules=lowercase
+            )
+        finally:
+            rules.configure()
+        with open(results[str(source)].output, encoding="utf-8") as f:
+            assert "⎡⎡Speaker ann:⎦⎦ Hello." in f.read()
+
+    @pytest.mark.parametrize("executor", helpers_executor.EXECUTORS)
+    def test_formats_from_one_parse(self, tmp_path, monkeypatch, executor):
+        monkeypatch.chdir(tmp_path)
+        files = copy_samples(tmp_path)
+        prepared = run(files, "prepare", MagicMock(), chunk_size=0)
+        files = [result.output for result in prepared.values()]
+        try:
+            results = run(
+                files,
+                "finalize",
+                MagicMock(),
+                executor,
+                2,
+                profile=True,
+                formats=("vtt", "srt", "ttml"),
+            )
+        finally:
+            formats.configure()
+        for result in results.values():
+            assert result.output.endswith(".vtt")
+            base = os.path.splitext(result.output)[0]
+            converted = str(tmp_path / "converted.srt")
+            webvtt.read(result.output).save_as_srt(converted)
+            with open(f"{base}.srt", "rb") as f, open(converted, "rb") as g:
+                assert f.read() == g.read()
+            assert os.path.getsize(f"{base}.ttml") > 0
+            assert result.profile["bytes_out"] == sum(
+                os.path.getsize(f"{base}{ext}") for ext in (".vtt", ".srt", ".ttml")
+            )
+
+    def test_formats_option(self):
+        assert make_args("x", "finalize", "--formats", "srt,vtt").formats == ("srt", "vtt")
+        assert make_args("x", "finalize").formats == ("vtt",)
+        with pytest.raises(SystemExit):
+            make_args("x", "finalize", "--formats", "vtt,ass")
+
+    def test_in_flight_option(self):
+        assert make_args("x", "prepare").in_flight is None
+        assert make_args("x", "prepare", "--in-flight", "1").in_flight == 1
+        for value in ("0", "-1"):
+            with pytest.raises(SystemExit):
+                make_args("x", "prepare", "--in-flight", value)
+
+    @pytest.mark.parametrize("option", ["--read-ahead", "--write-behind"])
+    def test_async_queues_need_room(self, option):
+        args = make_args("x", "prepare", option, "1")
+        assert getattr(args, option[2:].replace("-", "_")) == 1
+        with pytest.raises(SystemExit):
+            make_args("x", "prepare", option, "0")
+
+    @patch("process_webvtt.helpers.logging.create_log")
+    def test_resume_after_interrupted_run(self, mock_create_log, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        copy_samples(tmp_path)
+        process_vtt = preprocess.process_vtt
+        completed = []
+
+        def killed(file, log, *args):
+            # The run is stopped while the last file is processed
+            if len(completed) == len(self.samples) - 1:
+                raise KeyboardInterrupt
+            completed.append(os.path.basename(file))
+            return process_vtt(file, log, *args)
+
+        args = make_args(str(tmp_path), "prepare", "--workers", "1")
+        with patch("process_webvtt.argparse.ArgumentParser.parse_args", return_value=args):
+            with patch("process_webvtt.helpers.preprocess.process_vtt", side_effect=killed):
+                with pytest.raises(KeyboardInterrupt):
+                    main()
+        journal = tmp_path / ".webvtt_loc.prepare.journal"
+        assert journal.exists()
+        assert not glob.glob(str(tmp_path / "prepared" / "*.tmp"))
+
+        args = make_args(str(tmp_path), "prepare", "--workers", "1", "--resume")
+        with patch("process_webvtt.argparse.ArgumentParser.parse_args", return_value=args):
+            with patch(
+                "process_webvtt.helpers.preprocess.process_vtt", side_effect=process_vtt
+            ) as resumed:
+                main()
+        # Only the interrupted file is processed again
+        assert resumed.call_count == 1
+        assert os.path.basename(resumed.call_args.args[0]) not in completed
+        assert not journal.exists()
+        with open(tmp_path / ".webvtt_loc.prepare.json", encoding="utf-8") as f:
+            assert len(json.load(f)["files"]) == len(self.samples)
+
+    def test_watch_processes_dropped_files(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        folder = tmp_path / "drops"
+        folder.mkdir()
+        shutil.copyfile(self.samples[0], folder / "first.webvtt")
+        args = make_args(
+            str(folder), "prepare", "--watch", "--poll-interval", "0.05", "--settle", "0.1"
+        )
+        log = MagicMock()
+        stopped = threading.Event()
+
+        def wait_for(path):
+            for _ in range(200):
+                if path.exists():
+                    return
+                time.sleep(0.05)
+
+        def drop():
+            wait_for(folder / "prepared" / "first.webvtt")
+            shutil.copyfile(self.samples[1], folder / "second.webvtt")
+            wait_for(folder / "prepared" / "second.webvtt")
+            stopped.set()
+
+        dropper = threading.Thread(target=drop)
+        dropper.start()
+        with patch(
+            "process_webvtt.helpers.cache.configure", wraps=cache.configure
+        ) as configure:
+            watch(args, log, None, stopped)
+        dropper.join()
+        # The caches stay warm between drops
+        configure.assert_called_once()
+        processed = [
+            call.kwargs
+            for call in log.info.call_args_list
+            if call.args[0] == "Dropped file processed"
+        ]
+        assert [os.path.basename(event["file"]) for event in processed] == [
+            "first.webvtt",
+            "second.webvtt",
+        ]
+        # Includes waiting for the file to settle
+        assert all(event["latency"] >= 0.1 for event in processed)
+        with open(folder / ".webvtt_loc.prepare.json", encoding="utf-8") as f:
+            assert len(json.load(f)["files"]) == 2
+
+    @patch("process_webvtt.helpers.logging.create_log")
+    def test_shards_merge_into_one_report(self, mock_create_log, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        folder = tmp_path / "series"
+        folder.mkdir()
+        copy_samples(folder)
+        log = mock_create_log.return_value
+        for shard in ("1/2", "2/2"):
+            args = make_args(str(folder), "prepare", "--shard", shard, "--workers", "1")
+            with patch("process_webvtt.argparse.ArgumentParser.parse_args", return_value=args):
+                main()
+        # Both shards saved their entries into the same manifest
+        with open(folder / ".webvtt_loc.prepare.json", encoding="utf-8") as f:
+            assert len(json.load(f)["files"]) == len(self.samples)
+        args = make_args(str(folder), "merge", "--report", "report.json")
+        with patch("process_webvtt.argparse.ArgumentParser.parse_args", return_value=args):
+            main()
+        with open("report.json", encoding="utf-8") as f:
+            report = json.load(f)["actions"]["prepare"]
+        assert report["processed"] == len(self.samples)
+        assert report["problems"] == []
+        for entry in report["outputs"].values():
+            assert entry["output"].startswith("prepared/")
+        # A shard that did not run is flagged
+        os.remove(folder / ".webvtt_loc.prepare.shard-2-of-2.json")
+        with patch("process_webvtt.argparse.ArgumentParser.parse_args", return_value=args):
+            with pytest.raises(SystemExit):
+                main()
+        log.warning.assert_any_call(
+            "Shard problem", action="prepare", problem="Shards [2] are missing"
+        )
+
+    def test_memory_profile_needs_one_file_per_process(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        log = MagicMock()
+        with pytest.raises(Exception, match="--memprofile"):
+            run(self.samples, "prepare", log, executor="thread", workers=2, memprofile=True)
+        log.error.assert_called_once()
+
+    @pytest.mark.parametrize("executor", helpers_executor.EXECUTORS)
+    def test_memory_report(self, tmp_path, monkeypatch, executor):
+        monkeypatch.chdir(tmp_path)
+        files = copy_samples(tmp_path)
+        log = MagicMock()
+        try:
+            results = run(files, "prepare", log, executor=executor, memprofile=True)
+        finally:
+            profiling.configure(False)
+        assert all(r.profile["peak_kb"] > 0 for r in results.values())
+        heaviest = [c.kwargs for c in log.info.call_args_list if c.args == ("Heaviest file",)]
+        assert [entry["rank"] for entry in heaviest] == [1, 2, 3]
+        assert heaviest[0]["peak_kb"] == max(r.profile["peak_kb"] for r in results.values())
+        assert heaviest[0]["bytes_in"] == os.path.getsize(heaviest[0]["file"])
+
+    @pytest.mark.parametrize("executor", helpers_executor.EXECUTORS)
+    def test_cache_is_shared_across_runs(self, tmp_path, monkeypatch, executor):
+        monkeypatch.chdir(tmp_path)
+        files = copy_samples(tmp_path)
+        cache_dir = str(tmp_path / "cache")
+        counters = []
+        for _ in range(2):
+            log = MagicMock()
+            run(files, "prepare", log, executor=executor, workers=2, cache_dir=cache_dir)
+            (call,) = [c for c in log.info.call_args_list if c.args == ("Cache",)]
+            counters.append(call.kwargs)
+        assert counters[0]["misses"] > 0
+        assert counters[1]["misses"] == 0
+        assert counters[1]["hits"] == counters[0]["hits"] + counters[0]["misses"]
+
+    @pytest.mark.parametrize("executor", ["process", "async"])
+    def test_process_error_reaches_parent(self, tmp_path, monkeypatch, executor):
+        monkeypatch.chdir(tmp_path)
+        broken = tmp_path / "broken.webvtt"
+        broken.write_text("not a webvtt file", encoding="utf-8")
+        log = MagicMock()
+        with pytest.raises(Exception):
+            run([str(broken)], "prepare", log, executor=executor, workers=1)
+        log.error.assert_called_once()
+        assert log.error.call_args.kwargs["file"] == str(broken)
+
+    def test_in_flight_window(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        files = []
+        for index in range(12):
+            sample = self.samples[index % len(self.samples)]
+            target = tmp_path / f"{index}.webvtt"
+            shutil.copyfile(sample, target)
+            files.append(str(target))
+        submit = helpers_executor.submit
+        futures, in_flight = [], []
+
+        def counted(*args):
+            in_flight.append(sum(not future.done() for future in futures))
+            futures.append(submit(*args))
+            return futures[-1]
+
+        with patch("process_webvtt.helpers.executor.submit", side_effect=counted):
+            results = run(files, "prepare", MagicMock(), workers=1, in_flight=2)
+        assert len(results) == len(files)
+        # Submitted as others complete, never more than the window at a time
+        assert max(in_flight) < 2
+
+
+class TestManifest:
+    sample = os.path.join(os.path.dirname(__file__), "sample1.webvtt")
+
+    def run_main(self, path, *options):
+        with patch("process_webvtt.helpers.logging.create_log") as create_log, patch(
+            "process_webvtt.argparse.ArgumentParser.parse_args"
+        ) as parse_args, patch(
+            "process_webvtt.helpers.preprocess.process_vtt",
+            wraps=preprocess.process_vtt,
+        ) as process_vtt:
+            create_log.return_value = MagicMock()
+            parse_args.return_value = make_args(str(path), "prepare", *options)
+            main()
+            return process_vtt.call_count, create_log.return_value
+
+    @pytest.fixture
+    def vtt_file(self, tmp_path):
+        path = tmp_path / "a.webvtt"
+        shutil.copyfile(self.sample, path)
+        return path
+
+    def test_rerun_skips_unchanged_files(self, vtt_file):
+        assert self.run_main(vtt_file)[0] == 1
+        calls, log = self.run_main(vtt_file)
+        assert calls == 0
+        log.info.assert_any_call("Manifest checked", hits=1, misses=0, force=False)
+
+    def test_changed_input_is_reprocessed(self, vtt_file):
+        self.run_main(vtt_file)
+        with open(vtt_file, "a", encoding="utf-8") as f:
+            f.write("\n00:59:00.000 --> 00:59:01.000\nAdded.\n")
+        assert self.run_main(vtt_file)[0] == 1
+
+    def test_missing_output_is_reprocessed(self, vtt_file):
+        self.run_main(vtt_file)
+        os.remove(vtt_file.parent / "prepared" / "a.webvtt")
+        assert self.run_main(vtt_file)[0] == 1
+
+    def test_folder_rerun_skips_outputs(self, vtt_file):
+        assert self.run_main(vtt_file.parent)[0] == 1
+        calls, log = self.run_main(vtt_file.parent)
+        assert calls == 0
+        log.info.assert_any_call("Manifest checked", hits=1, misses=0, force=False)
+        assert not (vtt_file.parent / "prepared" / "prepared").exists()
+
+    def test_changed_reader_is_reprocessed(self, vtt_file, tmp_path, monkeypatch):
+        self.run_main(vtt_file)
+        reader = tmp_path / "reader.py"
+        shutil.copyfile(helpers_reader.__file__, reader)
+        with open(reader, "a", encoding="utf-8") as f:
+            f.write("# Fixed\n")
+        monkeypatch.setattr(helpers_reader, "__file__", str(reader))
+        assert self.run_main(vtt_file)[0] == 1
+
+    def test_force(self, vtt_file):
+        self.run_main(vtt_file)
+        calls, log = self.run_main(vtt_file, "--force")
+        assert calls == 1
+        log.info.assert_any_call("Manifest checked", hits=0, misses=1, force=True)
+
+    @staticmethod
+    def recorded_manifest(folder, name):
+        path = folder / name
+        path.write_text(name, encoding="utf-8")
+        recorded = manifest.Manifest.load(str(folder), "prepare")
+        recorded.is_current(str(path))
+        recorded.record(str(path), str(path))
+        return recorded
+
+    def test_shards_saving_together_keep_each_others_entries(self, tmp_path):
+        shards = [self.recorded_manifest(tmp_path, f"{i}.webvtt") for i in range(8)]
+        barrier = threading.Barrier(len(shards))
+
+        def save(shard):
+            barrier.wait()
+            shard.save()
+
+        threads = [threading.Thread(target=save, args=(shard,)) for shard in shards]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        saved = manifest.Manifest.load(str(tmp_path), "prepare")
+        assert sorted(saved.entries) == [f"{i}.webvtt" for i in range(8)]
+        assert not (tmp_path / ".webvtt_loc.prepare.json.lock").exists()
+
+    def test_stale_lock_is_removed(self, tmp_path):
+        shard = self.recorded_manifest(tmp_path, "a.webvtt")
+        lock = tmp_path / ".webvtt_loc.prepare.json.lock"
+        lock.write_text("killed 1\n", encoding="utf-8")
+        old = time.time() - manifest.LOCK_STALE - 1
+        os.utime(lock, (old, old))
+        shard.save()
+        assert "a.webvtt" in manifest.Manifest.load(str(tmp_path), "prepare").entries
+        assert not lock.exists()
+
+
+def kill_worker(file):
+    # Killed like the kernel kills a worker running out of memory
+    if os.path.basename(file) == "killed.webvtt":
+        os.kill(os.getpid(), signal.SIGKILL)
+
+
+def killed_process_vtt(file, log):
+    kill_worker(file)
+    return _process_vtt(file, log)
+
+
+def killed_transform(profile, action, file, data):
+    kill_worker(file)
+    return _transform(profile, action, file, data)
+
+
+_process_vtt = preprocess.process_vtt
+_transform = helpers_pipeline._transform
+
+
+class TestKeepGoing:
+    samples = SAMPLES
+
+    def run_main(self, *argv):
+        with patch("process_webvtt.helpers.logging.create_log") as create_log, patch(
+            "process_webvtt.argparse.ArgumentParser.parse_args"
+        ) as parse_args, patch(
+            "process_webvtt.helpers.preprocess.process_vtt",
+            wraps=preprocess.process_vtt,
+        ) as process_vtt:
+            create_log.return_value = MagicMock()
+            parse_args.return_value = make_args(*argv)
+            with pytest.raises(SystemExit) as excinfo:
+                main()
+            assert excinfo.value.code == 1
+            return process_vtt.call_count, create_log.return_value
+
+    @pytest.mark.parametrize("executor", helpers_executor.EXECUTORS)
+    def test_failures_do_not_stop_the_run(self, tmp_path, monkeypatch, executor):
+        monkeypatch.chdir(tmp_path)
+        folder = tmp_path / "season"
+        folder.mkdir()
+        copy_samples(folder)
+        (folder / "broken.webvtt").write_text("not a webvtt file", encoding="utf-8")
+        summary = tmp_path / "failures.json"
+        options = ["--keep-going", "--failures", str(summary), "--executor", executor]
+        self.run_main(str(folder), "prepare", *options, "--workers", "2")
+
+        for sample in self.samples:
+            assert (folder / "prepared" / os.path.basename(sample)).exists()
+        with open(summary, encoding="utf-8") as f:
+            report = json.load(f)
+        assert report["files"] == len(self.samples) + 1
+        assert report["failures"] == [
+            {
+                "file": str(folder / "broken.webvtt"),
+                "stage": "parse",
+                "type": "MalformedFileError",
+                "message": "Invalid format",
+            }
+        ]
+
+        # A later run retries only the failed files
+        calls, _ = self.run_main(str(folder), "prepare", *options, "--retry", str(summary))
+        assert calls == (1 if executor == "thread" else 0)
+        calls, _ = self.run_main(str(folder), "prepare", *options)
+        assert calls == (1 if executor == "thread" else 0)
+
+
+    @pytest.mark.parametrize("executor", ["process", "async"])
+    def test_killed_worker_does_not_stop_the_run(self, tmp_path, monkeypatch, executor):
+        monkeypatch.chdir(tmp_path)
+        folder = tmp_path / "season"
+        folder.mkdir()
+        copy_samples(folder)
+        shutil.copyfile(self.samples[0], folder / "killed.webvtt")
+        summary = tmp_path / "failures.json"
+        options = ["--keep-going", "--failures", str(summary), "--executor", executor]
+        with patch(
+            "process_webvtt.helpers.preprocess.process_vtt", killed_process_vtt
+        ), patch("process_webvtt.helpers.pipeline._transform", killed_transform):
+            _, log = self.run_main(
+                str(folder), "prepare", *options, "--workers", "1", "--in-flight", "1"
+            )
+
+        for sample in self.samples:
+            assert (folder / "prepared" / os.path.basename(sample)).exists()
+        with open(summary, encoding="utf-8") as f:
+            failures = json.load(f)["failures"]
+        assert [(entry["file"], entry["type"]) for entry in failures] == [
+            (str(folder / "killed.webvtt"), "BrokenProcessPool")
+        ]
+        assert any(
+            call.args[0] == "Worker pool restarted" for call in log.warning.call_args_list
+        )
+
+class TestRoundtripAction:
+    def run_main(self, path, report):
+        with patch("process_webvtt.helpers.logging.create_log") as create_log, patch(
+            "process_webvtt.argparse.ArgumentParser.parse_args"
+        ) as parse_args:
+            create_log.return_value = MagicMock()
+            parse_args.return_value = make_args(
+                str(path), "roundtrip", "--report", str(report), "--workers", "2"
+            )
+            main()
+            return create_log.return_value
+
+    def test_samples(self, tmp_path):
+        copy_samples(tmp_path)
+        report = tmp_path.parent / f"{tmp_path.name}.json"
+        log = self.run_main(tmp_path, report)
+        # Only the report is written
+        assert len(os.listdir(tmp_path)) == 3
+        with open(report, encoding="utf-8") as f:
+            assert json.load(f) == {"files": 3, "mismatched_files": 0, "mismatches": {}}
+        log.info.assert_any_call(
+            "Roundtrip checked", files=3, mismatched_files=0, report=str(report)
+        )
+
+    def test_mismatch_exits_with_error(self, tmp_path):
+        vtt_file = tmp_path / "a.webvtt"
+        shutil.copyfile(os.path.join(os.path.dirname(__file__), "sample1.webvtt"), vtt_file)
+        report = tmp_path / "report.json"
+        with patch(
+            "helpers.roundtrip.normalize", side_effect=lambda text: text
+        ), pytest.raises(SystemExit) as excinfo:
+            self.run_main(vtt_file, report)
+        assert excinfo.value.code == 1
+        with open(report, encoding="utf-8") as f:
+            assert json.load(f)["mismatched_files"] == 1
+
+
 class TestRoundtrip:
     test_files = [
         os.path.basename(f)